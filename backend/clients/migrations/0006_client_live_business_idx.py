@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-17 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0005_alter_client_client_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['business', 'name'], name='client_live_business_idx'),
+        ),
+    ]
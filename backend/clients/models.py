@@ -2,7 +2,7 @@ from django.db import models
 from users.models import Business
 from django.conf import settings
 
-from utils.models import SoftDeleteModel
+from utils.models import LIVE, SoftDeleteModel
 
 class Client(SoftDeleteModel):
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='clients')
@@ -34,5 +34,14 @@ class Client(SoftDeleteModel):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # No soft_delete_cascade: invoices are financial records and outlive their
+    # client, as they always have (archive_soft_deleted keeps such a client too)
+
+    class Meta:
+        indexes = [
+            # Client list and pickers of a business, live rows only
+            models.Index(fields=['business', 'name'], condition=LIVE, name='client_live_business_idx'),
+        ]
+
     def __str__(self):
         return self.name
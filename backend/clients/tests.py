@@ -162,6 +162,20 @@ class ClientCRUDTestCase(APITestCase):
         deleted_client = Client.all_objects.get(id=self.client_obj.id)
         self.assertTrue(deleted_client.is_deleted)
 
+    def test_delete_client_keeps_its_invoices(self):
+        """Müştəri silinəndə onun fakturaları silinmir"""
+        from django.utils import timezone
+        from invoices.models import Invoice
+
+        today = timezone.now().date()
+        invoice = Invoice.objects.create(business=self.business, client=self.client_obj, invoice_date=today, due_date=today)
+        response = self.client.delete(
+            reverse('client-detail', args=[self.client_obj.id]),
+            HTTP_X_BUSINESS_ID=self.business.id
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(Invoice.objects.filter(id=invoice.id).exists())
+
 
 @override_settings(SECURE_SSL_REDIRECT=False)
 class ClientIsolationTestCase(APITestCase):
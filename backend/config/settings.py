@@ -123,6 +123,11 @@ else:
 PASSWORD_RESET_CONFIRM_URL = 'https://invoiceaz.vercel.app/password-reset-confirm/' if not DEBUG else 'http://localhost:5173/password-reset-confirm/'
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
 
+# Invoice numbering (per-business counter, e.g. INV-1001)
+INVOICE_NUMBER_PREFIX = os.environ.get('INVOICE_NUMBER_PREFIX', 'INV')
+INVOICE_NUMBER_PADDING = int(os.environ.get('INVOICE_NUMBER_PADDING', 4))
+INVOICE_NUMBER_START = 1000
+
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_HEADERS = [
     'accept',
@@ -261,6 +266,22 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Plan usage counters and public invoice pages are cached here. Without
+# REDIS_URL each process keeps its own in-memory cache, so with several
+# gunicorn workers (or worker commands) an entry dropped by one process stays
+# in the others until its TTL runs out; set REDIS_URL in such deployments.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -313,6 +334,49 @@ WHITENOISE_MANIFEST_STRICT = False
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered invoice PDFs, keyed by content fingerprint (kept outside MEDIA_ROOT,
+# which is publicly served)
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', BASE_DIR / 'pdf_cache')
+
+# Background PDF jobs are processed by `manage.py run_pdf_worker`. In eager mode
+# (default for local DEBUG runs) they are processed right after the request commits.
+PDF_JOBS_EAGER = os.environ.get('PDF_JOBS_EAGER', str(DEBUG)).lower() == 'true'
+PDF_JOB_MAX_ATTEMPTS = 3
+
+# Excel product imports run as ProductImportJob via `manage.py run_import_worker`
+# (eagerly after the upload request in the same DEBUG-driven mode as PDF jobs).
+# Rows are read lazily and written PRODUCT_IMPORT_CHUNK_SIZE at a time; at most
+# PRODUCT_IMPORT_MAX_ERRORS row errors are kept on the job. Uploaded sheets wait
+# for the worker in PRODUCT_IMPORT_DIR, outside MEDIA_ROOT (which is publicly served).
+PRODUCT_IMPORT_JOBS_EAGER = os.environ.get('PRODUCT_IMPORT_JOBS_EAGER', str(DEBUG)).lower() == 'true'
+PRODUCT_IMPORT_CHUNK_SIZE = int(os.environ.get('PRODUCT_IMPORT_CHUNK_SIZE', 1000))
+PRODUCT_IMPORT_MAX_ERRORS = 200
+PRODUCT_IMPORT_MAX_ATTEMPTS = 2
+PRODUCT_IMPORT_DIR = os.environ.get('PRODUCT_IMPORT_DIR', BASE_DIR / 'product_imports')
+
+# List exports (`<list>/export/?file_format=csv|xlsx`) stream rows straight from
+# the database, EXPORT_CHUNK_SIZE rows per fetch.
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Outbound emails are queued in the outbox and delivered by `manage.py run_email_worker`
+# in batches over one connection. Failures are retried after BASE, 2*BASE, 4*BASE...
+# seconds (capped at MAX) and dead-lettered after MAX_ATTEMPTS.
+EMAIL_OUTBOX_EAGER = os.environ.get('EMAIL_OUTBOX_EAGER', str(DEBUG)).lower() == 'true'
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_BACKOFF_BASE = 30
+EMAIL_OUTBOX_BACKOFF_MAX = 3600
+
+# Plan usage counters (users.plan_usage) are cached per business/owner for this
+# many seconds; saves and deletes of counted rows drop their entry immediately
+# and again on commit (in every process only with a shared cache, see CACHES).
+PLAN_USAGE_CACHE_TTL = int(os.environ.get('PLAN_USAGE_CACHE_TTL', 60))
+
+# Serialized public (share link) invoice pages (invoices.public), keyed by
+# share_token; invoice, line and payment changes drop their entry immediately
+# and again on commit. Other processes only see the drop with a shared cache,
+# so without REDIS_URL entries live a few seconds.
+PUBLIC_INVOICE_CACHE_TTL = int(os.environ.get('PUBLIC_INVOICE_CACHE_TTL', 300 if os.environ.get('REDIS_URL') else 10))
+
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
 
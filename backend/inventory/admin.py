@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     Product, Warehouse, StockMovement,
-    PurchaseOrder, PurchaseOrderItem, InventoryAdjustment
+    PurchaseOrder, PurchaseOrderItem, InventoryAdjustment, ProductImportJob
 )
 
 
@@ -42,3 +42,10 @@ class InventoryAdjustmentAdmin(admin.ModelAdmin):
     list_display = ('product', 'old_quantity', 'new_quantity', 'reason', 'created_at')
     list_filter = ('reason', 'business')
     readonly_fields = ('old_quantity', 'created_at')
+
+
+@admin.register(ProductImportJob)
+class ProductImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'business', 'status', 'processed_rows', 'created_count', 'updated_count', 'error_count', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('errors', 'error', 'created_at', 'started_at', 'finished_at')
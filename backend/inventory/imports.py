@@ -0,0 +1,350 @@
+"""
+Streaming Excel product import (ProductImportJob).
+
+The sheet is read with openpyxl in read-only mode, one row at a time, and
+written in chunks of PRODUCT_IMPORT_CHUNK_SIZE rows, each in its own
+transaction:
+  - products with a SKU are upserted with one INSERT ... ON CONFLICT (business, sku)
+  - products without a SKU are inserted (merged by name within the file)
+  - every stock change is logged with one bulk insert of StockMovement rows
+Rows that cannot be read are reported on the job (row number + reason) and
+skipped, and progress is saved after every chunk, so memory stays bounded by
+the chunk size however long the sheet is.
+
+Columns: Ad, Təsvir, SKU, Qiymət, Vahid, Miqdar, Limit, Maya Qiyməti, Anbar.
+Several rows with the same SKU are one product: quantities add up and the last
+row wins for the other columns. Imported quantities replace the current stock.
+"""
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+import openpyxl
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Product, ProductImportJob, StockMovement, Warehouse
+
+COLUMNS = ('name', 'description', 'sku', 'base_price', 'unit', 'stock_quantity', 'min_stock_level', 'cost_price', 'warehouse')
+DECIMAL_COLUMNS = {
+    'base_price': 'Qiymət',
+    'stock_quantity': 'Miqdar',
+    'min_stock_level': 'Limit',
+    'cost_price': 'Maya Qiyməti',
+}
+MAX_LENGTHS = {'name': ('Ad', 255), 'sku': ('SKU', 100), 'unit': ('Vahid', 20)}
+UPDATE_FIELDS = [
+    'name', 'description', 'base_price', 'cost_price', 'unit', 'stock_quantity', 'min_stock_level', 'is_deleted', 'deleted_at'
+]
+IMPORT_NOTE = 'Excel idxalı'
+
+
+def _chunk_size():
+    return getattr(settings, 'PRODUCT_IMPORT_CHUNK_SIZE', 1000)
+
+
+def _text(value):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _decimal(value, label):
+    if value in (None, ''):
+        return Decimal('0')
+    try:
+        return Decimal(str(value).strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"'{label}' rəqəm deyil: {value}")
+
+
+def parse_row(values):
+    """Product fields of one sheet row; None for rows without a name. Raises ValueError for bad values."""
+    row = dict(zip(COLUMNS, list(values) + [None] * len(COLUMNS)))
+    data = {
+        'name': _text(row['name']),
+        'description': row['description'],
+        'sku': _text(row['sku']),
+        'unit': _text(row['unit']) or 'pcs',
+        'warehouse': (_text(row['warehouse']) or '').lower(),
+    }
+    if not data['name']:
+        return None
+    for field, (label, max_length) in MAX_LENGTHS.items():
+        if data[field] and len(data[field]) > max_length:
+            raise ValueError(f"'{label}' {max_length} simvoldan uzundur")
+    for field, label in DECIMAL_COLUMNS.items():
+        data[field] = _decimal(row[field], label)
+    return data
+
+
+class ProductImporter:
+    """Writes parsed rows of one job chunk by chunk and keeps its counters."""
+
+    def __init__(self, job):
+        from users.plan_limits import check_product_limit
+
+        self.job = job
+        self.business = job.business
+        self.user = job.requested_by or self.business.user
+        warehouses = list(Warehouse.objects.filter(business=self.business))
+        self.warehouses = {wh.name.strip().lower(): wh for wh in warehouses}
+        self.default_warehouse = next((wh for wh in warehouses if wh.is_default), None) or (
+            warehouses[0] if len(warehouses) == 1 else None
+        )
+        # Product key -> id of every product this import has written; repeated
+        # SKUs in later chunks add to the stock written so far instead of replacing it
+        self.written = {}
+
+        limit = check_product_limit(self.user, self.business)
+        self.new_allowed = None if limit['limit'] is None else max(limit['limit'] - limit['current'], 0)
+
+    def run(self, rows):
+        chunk = []
+        for row_number, values in rows:
+            chunk.append((row_number, values))
+            if len(chunk) >= _chunk_size():
+                self.flush(chunk)
+                chunk = []
+        if chunk:
+            self.flush(chunk)
+
+    def error(self, row_number, message):
+        self.job.error_count += 1
+        if len(self.job.errors) < getattr(settings, 'PRODUCT_IMPORT_MAX_ERRORS', 200):
+            self.job.errors.append({'row': row_number, 'error': message})
+
+    def flush(self, chunk):
+        entries = {}
+        for row_number, values in chunk:
+            try:
+                data = parse_row(values)
+            except ValueError as e:
+                self.error(row_number, str(e))
+                continue
+            if data is None:
+                continue
+
+            warehouse = self.warehouses.get(data.pop('warehouse')) or self.default_warehouse
+            key = data['sku'] or f"NO-SKU-{data['name']}"
+            entry = entries.get(key)
+            if entry is None:
+                entries[key] = {**data, 'warehouse': warehouse, 'rows': [row_number]}
+            else:
+                stock = entry['stock_quantity'] + data['stock_quantity']
+                entry.update(data, stock_quantity=stock, warehouse=entry['warehouse'] or warehouse)
+                entry['rows'].append(row_number)
+
+        written, new_allowed = dict(self.written), self.new_allowed
+        try:
+            with transaction.atomic():
+                created, updated = self.write(entries)
+        except Exception as e:
+            self.written, self.new_allowed = written, new_allowed
+            for entry in entries.values():
+                for row_number in entry['rows']:
+                    self.error(row_number, f"Yazıla bilmədi: {e}")
+        else:
+            self.job.created_count += created
+            self.job.updated_count += updated
+
+        self.job.processed_rows += len(chunk)
+        self.job.heartbeat_at = timezone.now()
+        self.job.save(update_fields=['processed_rows', 'heartbeat_at', 'created_count', 'updated_count', 'error_count', 'errors'])
+
+    def write(self, entries):
+        """Upsert one chunk of merged entries and log their stock changes. Returns (created, updated)."""
+        skus = [entry['sku'] for entry in entries.values() if entry['sku']]
+        current = {
+            row['sku']: row for row in Product.all_objects.filter(business=self.business, sku__in=skus)
+            .values('id', 'sku', 'stock_quantity')
+        }
+        unskued_ids = [self.written[key] for key, entry in entries.items() if not entry['sku'] and key in self.written]
+        current_unskued = {
+            row['id']: row for row in Product.all_objects.filter(pk__in=unskued_ids).values('id', 'stock_quantity')
+        }
+
+        upserts, inserts, updates, changes = [], [], [], []
+        created = updated = 0
+        for key, entry in entries.items():
+            existing = current.get(entry['sku']) if entry['sku'] else current_unskued.get(self.written.get(key))
+            if existing is None:
+                if self.new_allowed is not None:
+                    if self.new_allowed <= 0:
+                        for row_number in entry['rows']:
+                            self.error(row_number, "Məhsul limitiniz dolub.")
+                        continue
+                    self.new_allowed -= 1
+                created += 1
+            elif key not in self.written:
+                updated += 1
+
+            stock_before = existing['stock_quantity'] if existing else Decimal('0')
+            stock_after = entry['stock_quantity'] + (stock_before if key in self.written else 0)
+            product = Product(
+                business=self.business,
+                sku=entry['sku'],
+                name=entry['name'],
+                description=entry['description'],
+                base_price=entry['base_price'],
+                cost_price=entry['cost_price'],
+                unit=entry['unit'],
+                stock_quantity=stock_after,
+                min_stock_level=entry['min_stock_level'],
+                warehouse=entry['warehouse'],
+                is_deleted=False,
+                deleted_at=None
+            )
+            if entry['sku']:
+                upserts.append(product)
+            elif existing:
+                product.pk = existing['id']
+                updates.append(product)
+            else:
+                inserts.append(product)
+            changes.append((key, product, stock_before, stock_after))
+
+        if upserts:
+            Product.objects.bulk_create(
+                upserts, update_conflicts=True, unique_fields=['business', 'sku'], update_fields=UPDATE_FIELDS
+            )
+            ids = dict(Product.all_objects.filter(business=self.business, sku__in=[p.sku for p in upserts]).values_list('sku', 'id'))
+            for product in upserts:
+                product.pk = ids[product.sku]
+        if inserts:
+            Product.objects.bulk_create(inserts)
+        if updates:
+            Product.objects.bulk_update(updates, UPDATE_FIELDS)
+
+        movements = []
+        for key, product, stock_before, stock_after in changes:
+            self.written[key] = product.pk
+            if stock_after == stock_before:
+                continue
+            movements.append(StockMovement(
+                business=self.business,
+                product_id=product.pk,
+                warehouse=product.warehouse,
+                movement_type='ADJUSTMENT_PLUS' if stock_after > stock_before else 'ADJUSTMENT_MINUS',
+                source_type='ADJUSTMENT',
+                quantity=abs(stock_after - stock_before),
+                unit_cost=product.cost_price,
+                stock_before=stock_before,
+                stock_after=stock_after,
+                note=IMPORT_NOTE,
+                created_by=self.job.requested_by
+            ))
+        StockMovement.objects.bulk_create(movements)
+        return created, updated
+
+
+def read_rows(sheet):
+    """(row number, values) for every data row of the sheet, read lazily."""
+    for row_number, values in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+        if values and any(value not in (None, '') for value in values):
+            yield row_number, values
+
+
+def enqueue_import_job(business, file, user=None):
+    """Store the uploaded sheet and queue its import."""
+    job = ProductImportJob.objects.create(business=business, file=file, requested_by=user)
+    if getattr(settings, 'PRODUCT_IMPORT_JOBS_EAGER', False):
+        transaction.on_commit(lambda: run_import_job(job.pk))
+    return job
+
+
+def claim_import_jobs(limit=5):
+    """Atomically move up to `limit` queued jobs to 'running' and return their ids."""
+    candidates = ProductImportJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:limit]
+    claimed = []
+    for job_id in list(candidates):
+        now = timezone.now()
+        if ProductImportJob.objects.filter(pk=job_id, status='queued').update(status='running', started_at=now, heartbeat_at=now):
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale_import_jobs(timeout_seconds=1800):
+    """
+    Restart imports abandoned by a crashed worker (or fail them after the last
+    attempt). A job is abandoned when its progress has not been saved for
+    `timeout_seconds`; a long import that is still writing chunks is left alone.
+    """
+    max_attempts = getattr(settings, 'PRODUCT_IMPORT_MAX_ATTEMPTS', 2)
+    cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+    stale = ProductImportJob.objects.filter(status='running', heartbeat_at__lt=cutoff)
+    stale.filter(attempts__gte=max_attempts).update(
+        status='failed', error='Worker timed out', finished_at=timezone.now()
+    )
+    return stale.filter(attempts__lt=max_attempts).update(status='queued', started_at=None, heartbeat_at=None)
+
+
+def run_import_job(job_id):
+    """Import one claimed (or eagerly run) job from start to finish. Never raises."""
+    from notifications.utils import create_notification, log_activity
+    from users.plan_usage import invalidate_business
+
+    job = ProductImportJob.objects.select_related('business__user', 'requested_by').get(pk=job_id)
+    if job.status == 'queued':
+        job.started_at = timezone.now()
+    job.heartbeat_at = timezone.now()
+    job.status = 'running'
+    job.attempts += 1
+    # A restarted import reads the sheet again from the first row
+    job.processed_rows = job.created_count = job.updated_count = job.error_count = 0
+    job.errors = []
+    job.save(update_fields=[
+        'status', 'started_at', 'heartbeat_at', 'attempts',
+        'processed_rows', 'created_count', 'updated_count', 'error_count', 'errors'
+    ])
+
+    try:
+        importer = ProductImporter(job)
+        with job.file.open('rb') as file:
+            workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+            try:
+                sheet = workbook.active
+                job.total_rows = max(sheet.max_row - 1, 0) if sheet.max_row else None
+                job.save(update_fields=['total_rows'])
+                importer.run(read_rows(sheet))
+            finally:
+                workbook.close()
+
+        if not (job.created_count or job.updated_count or job.error_count):
+            raise ValueError("Faylda yüklənə biləcək məhsul tapılmadı.")
+        job.status = 'done'
+        job.error = ''
+    except Exception as e:
+        job.status = 'failed'
+        job.error = f"Excel oxunarkən xəta baş verdi: {e}"
+        print(f"Product import {job.pk} error: {e}")
+
+    job.finished_at = timezone.now()
+    job.file.delete(save=False)
+    job.save(update_fields=['status', 'error', 'finished_at', 'file'])
+    invalidate_business(job.business_id)
+
+    if job.status == 'done':
+        business = job.business
+        processed = job.created_count + job.updated_count
+        message = f"Excel vasitəsilə {processed} məhsul uğurla işlənildi."
+        if job.error_count:
+            message += f" {job.error_count} sətir xəta ilə ötürüldü."
+        create_notification(
+            user=business.user,
+            business=business,
+            title="Toplu Məhsul Yüklənməsi",
+            message=message,
+            type='success' if not job.error_count else 'warning',
+            link='/inventory',
+            setting_key='product_created'
+        )
+        log_activity(
+            business=business,
+            user=job.requested_by or business.user,
+            action='CREATE',
+            module='PRODUCT',
+            description=f"Excel ilə toplu məhsul yükləndi ({processed} ədəd)"
+        )
+    return job
@@ -0,0 +1,76 @@
+"""
+Benchmark the streaming list exports against serializing the whole table.
+Usage: python manage.py bench_exports --rows 200000 --chunk-size 2000
+
+Seeds `--rows` products into a throwaway business, then consumes
+`products/export/` as CSV and XLSX and, for comparison, `products/all/`
+(the unpaginated dropdown endpoint). Reports wall time, response size and the
+peak Python memory (tracemalloc) of each. The business is removed afterwards.
+"""
+import time
+import tracemalloc
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from inventory.models import Product
+from inventory.views import ProductViewSet
+from users.models import Business, SubscriptionPlan
+
+
+class Command(BaseCommand):
+    help = 'Benchmark time and memory of the streaming CSV/XLSX exports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        plan = SubscriptionPlan.objects.create(name=f'bench-{uuid.uuid4().hex[:8]}', label='Benchmark', has_csv_export=True)
+        user = User.objects.create_user(email=f"bench-{uuid.uuid4().hex[:8]}@invoice.az", password=uuid.uuid4().hex, subscription_plan=plan)
+        business = Business.objects.create(user=user, name='Benchmark Business')
+        factory = APIRequestFactory()
+
+        try:
+            Product.objects.bulk_create([
+                Product(business=business, name=f'Məhsul {n}', sku=f'BENCH-{n:07d}', description='Benchmark', base_price=10, stock_quantity=5)
+                for n in range(options['rows'])
+            ], batch_size=5000)
+            self.stdout.write(f"Rows: {options['rows']}, chunk size: {options['chunk_size']}")
+
+            cases = (
+                ('export csv', {'get': 'export'}, {'file_format': 'csv'}),
+                ('export xlsx', {'get': 'export'}, {'file_format': 'xlsx'}),
+                ('all (JSON)', {'get': 'all_products'}, {}),
+            )
+            with override_settings(EXPORT_CHUNK_SIZE=options['chunk_size']):
+                for label, actions, params in cases:
+                    view = ProductViewSet.as_view(actions, throttle_classes=[])
+                    request = factory.get('/api/inventory/products/', params, HTTP_X_BUSINESS_ID=str(business.id), SERVER_NAME='localhost')
+                    force_authenticate(request, user=user)
+
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    response = view(request)
+                    if response.streaming:
+                        size = sum(len(block) for block in response.streaming_content)
+                    else:
+                        size = len(response.render().content)
+                    elapsed = time.perf_counter() - started
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    self.stdout.write(
+                        f"{label:<12} {response.status_code} {elapsed:8.2f} s {size / 1024 / 1024:8.1f} MB out "
+                        f"{peak / 1024 / 1024:8.1f} MB peak"
+                    )
+        finally:
+            Product.all_objects.filter(business=business).delete()
+            business.delete()
+            user.delete()
+            plan.delete()
+
+        self.stdout.write(self.style.SUCCESS('Success: Export benchmark finished.'))
@@ -0,0 +1,76 @@
+"""
+Benchmark the streaming Excel product import.
+Usage: python manage.py bench_product_import --rows 200000 --chunk-size 1000
+
+Writes a sheet of `--rows` products (every tenth row repeats an earlier SKU),
+imports it into a throwaway business with run_import_job, then imports it a
+second time (all updates, no stock changes) and reports wall time, rows per
+second, the process peak RSS and the number of stock movements written. The
+business is removed afterwards.
+"""
+import io
+import resource
+import time
+import uuid
+
+import openpyxl
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from inventory.imports import run_import_job
+from inventory.models import Product, ProductImportJob, StockMovement
+from users.models import Business
+
+
+class Command(BaseCommand):
+    help = 'Benchmark time and memory of the chunked product import'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user = User.objects.create_user(email=f"bench-{uuid.uuid4().hex[:8]}@invoice.az", password=uuid.uuid4().hex)
+        business = Business.objects.create(user=user, name='Benchmark Business')
+        content = self._sheet(options['rows'])
+        self.stdout.write(f"Rows: {options['rows']}, chunk size: {options['chunk_size']}, file: {len(content) / 1024 / 1024:.1f} MB")
+
+        try:
+            with override_settings(PRODUCT_IMPORT_CHUNK_SIZE=options['chunk_size'], PRODUCT_IMPORT_JOBS_EAGER=False):
+                for label in ('first import', 're-import'):
+                    job = ProductImportJob.objects.create(
+                        business=business, requested_by=user, file=SimpleUploadedFile('bench.xlsx', content)
+                    )
+                    movements_before = StockMovement.objects.filter(business=business).count()
+                    started = time.perf_counter()
+                    job = run_import_job(job.pk)
+                    elapsed = time.perf_counter() - started
+                    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+                    movements = StockMovement.objects.filter(business=business).count() - movements_before
+                    self.stdout.write(
+                        f"{label:<13} {job.status:<6} {elapsed:8.1f} s {options['rows'] / elapsed:10.0f} rows/s "
+                        f"{peak / 1024 / 1024:8.1f} MB peak RSS  created={job.created_count} updated={job.updated_count} "
+                        f"movements={movements}"
+                    )
+        finally:
+            StockMovement.objects.filter(business=business).delete()
+            Product.all_objects.filter(business=business).delete()
+            ProductImportJob.objects.filter(business=business).delete()
+            business.delete()
+            user.delete()
+
+        self.stdout.write(self.style.SUCCESS('Success: Product import benchmark finished.'))
+
+    def _sheet(self, rows):
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(['Ad', 'Təsvir', 'SKU', 'Qiymət', 'Vahid', 'Miqdar', 'Limit', 'Maya Qiyməti', 'Anbar'])
+        for n in range(rows):
+            sku = n // 2 if n % 10 == 9 else n
+            sheet.append([f'Məhsul {sku}', 'Benchmark', f'BENCH-{sku:07d}', 10, 'pcs', 5, 1, 6, None])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
@@ -0,0 +1,46 @@
+"""
+Process queued Excel product imports (ProductImportJob) off the request path.
+Usage: python manage.py run_import_worker            # run forever
+       python manage.py run_import_worker --once     # process what is queued and exit
+
+Jobs are claimed with a conditional UPDATE, so several workers can run side by side.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from inventory.imports import claim_import_jobs, requeue_stale_import_jobs, run_import_job
+
+
+class Command(BaseCommand):
+    help = 'Import queued product Excel files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--batch', type=int, default=5, help='Jobs claimed per poll')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=1800, help='Requeue running jobs with no progress for this long (seconds)')
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        while True:
+            close_old_connections()
+            requeue_stale_import_jobs(options['stale_after'])
+            job_ids = claim_import_jobs(options['batch'])
+
+            for job_id in job_ids:
+                job = run_import_job(job_id)
+                if job.status == 'done':
+                    processed += 1
+                elif job.status == 'failed':
+                    failed += 1
+
+            if not job_ids:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Success: Processed {processed} product imports ({failed} failed).'
+        ))
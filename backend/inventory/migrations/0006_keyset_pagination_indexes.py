@@ -0,0 +1,21 @@
+# Generated by Django 5.2.11 on 2026-10-17 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_purchaseorderreceipt_purchaseorderreceiptitem'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['business', 'name', 'id'], name='product_business_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['business', 'created_at', 'id'], name='stockmove_business_keyset_idx'),
+        ),
+    ]
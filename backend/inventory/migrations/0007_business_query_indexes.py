@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-17 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'created_at'], name='stockmove_product_created_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.11 on 2026-10-17 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_productimportjob'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_business_keyset_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['business', 'name', 'id'], name='product_live_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['business', 'is_default'], name='warehouse_live_business_idx'),
+        ),
+    ]
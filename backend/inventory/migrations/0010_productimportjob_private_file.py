@@ -0,0 +1,19 @@
+# Generated by Django 5.2.11 on 2026-10-17 18:05
+
+import inventory.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_soft_delete_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimportjob',
+            name='file',
+            field=models.FileField(blank=True, max_length=500, storage=inventory.models.ImportFileStorage(), upload_to=inventory.models.import_file_path),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.11 on 2026-10-17 18:20
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_heartbeats(apps, schema_editor):
+    """Jobs already running get their start time as the last heartbeat."""
+    ProductImportJob = apps.get_model('inventory', 'ProductImportJob')
+    ProductImportJob.objects.filter(status='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_productimportjob_private_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(start_heartbeats, migrations.RunPython.noop),
+    ]
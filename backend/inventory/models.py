@@ -1,8 +1,11 @@
 from django.db import models
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from decimal import Decimal
+import os
+import uuid
 
-from utils.models import SoftDeleteModel
+from utils.models import LIVE, SoftDeleteModel
 
 
 class Warehouse(SoftDeleteModel):
@@ -16,6 +19,10 @@ class Warehouse(SoftDeleteModel):
 
     class Meta:
         ordering = ['-is_default', 'name']
+        indexes = [
+            # Warehouses of a business (default warehouse first), live rows only
+            models.Index(fields=['business', 'is_default'], condition=LIVE, name='warehouse_live_business_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({'Əsas' if self.is_default else 'Əlavə'})"
@@ -49,6 +56,11 @@ class Product(SoftDeleteModel):
     class Meta:
         unique_together = ('business', 'sku')
         ordering = ['name']
+        indexes = [
+            # Keyset pagination of the product list (utils.pagination), live rows only:
+            # imports look products up by SKU through the unique (business, sku) index
+            models.Index(fields=['business', 'name', 'id'], condition=LIVE, name='product_live_keyset_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.sku})" if self.sku else self.name
@@ -125,6 +137,12 @@ class StockMovement(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the movement journal (utils.pagination)
+            models.Index(fields=['business', 'created_at', 'id'], name='stockmove_business_keyset_idx'),
+            # Movement history of one product (?product=), newest first
+            models.Index(fields=['product', 'created_at'], name='stockmove_product_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_movement_type_display()} | {self.product.name} | {self.quantity}"
@@ -238,3 +256,83 @@ class InventoryAdjustment(models.Model):
     @property
     def difference(self):
         return self.new_quantity - self.old_quantity
+
+
+class ImportFileStorage(FileSystemStorage):
+    """
+    Queued import sheets: kept in PRODUCT_IMPORT_DIR, outside MEDIA_ROOT (which
+    is publicly served), with no URL. Only the import worker reads them back.
+    """
+
+    @property
+    def base_location(self):
+        return str(getattr(settings, 'PRODUCT_IMPORT_DIR', settings.BASE_DIR / 'product_imports'))
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
+
+
+def import_file_path(instance, filename):
+    # Named after the job, not the uploaded file
+    return f'{instance.pk}{os.path.splitext(filename)[1].lower()}'
+
+
+class ProductImportJob(models.Model):
+    """
+    Excel product import queued by ProductViewSet.upload_excel and processed in
+    chunks by `manage.py run_import_worker` (see inventory/imports.py).
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Növbədə'),
+        ('running', 'İcra olunur'),
+        ('done', 'Hazırdır'),
+        ('failed', 'Xəta'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    business = models.ForeignKey('users.Business', on_delete=models.CASCADE, related_name='product_imports')
+    file = models.FileField(upload_to=import_file_path, storage=ImportFileStorage(), max_length=500, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+
+    # Progress: rows read so far (header excluded) out of the sheet's row count when known
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # Row-level problems, [{'row': 12, 'error': '...'}], capped at PRODUCT_IMPORT_MAX_ERRORS
+    errors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='product_imports'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Refreshed with every progress save; a running job without one for a while has lost its worker
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.status})"
+
+    @property
+    def progress(self):
+        if self.status == 'done':
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, self.processed_rows * 100 // self.total_rows)
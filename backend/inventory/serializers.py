@@ -1,8 +1,9 @@
+from django.urls import reverse
 from rest_framework import serializers
 from .models import (
     Product, Warehouse, StockMovement,
     PurchaseOrder, PurchaseOrderItem, InventoryAdjustment,
-    PurchaseOrderReceipt, PurchaseOrderReceiptItem
+    PurchaseOrderReceipt, PurchaseOrderReceiptItem, ProductImportJob
 )
 
 
@@ -35,6 +36,37 @@ class ExcelUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
 
 
+class ProductImportJobSerializer(serializers.ModelSerializer):
+    progress = serializers.IntegerField(read_only=True)
+    detail = serializers.SerializerMethodField()
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductImportJob
+        fields = (
+            'id', 'status', 'progress', 'total_rows', 'processed_rows', 'created_count', 'updated_count',
+            'error_count', 'errors', 'error', 'detail', 'created_at', 'finished_at', 'status_url'
+        )
+        read_only_fields = fields
+
+    def get_detail(self, obj):
+        if obj.status == 'done':
+            detail = f"{obj.created_count + obj.updated_count} məhsul uğurla işlənildi (Sinxronizasiya: Mövcud stoklar əvəzləndi)."
+            if obj.error_count:
+                detail += f" {obj.error_count} sətir xəta ilə ötürüldü."
+            return detail
+        if obj.status == 'failed':
+            return obj.error
+        if obj.status == 'running':
+            return f"İdxal davam edir: {obj.processed_rows} sətir işlənildi."
+        return "Excel faylı qəbul edildi, idxal növbəyə alındı."
+
+    def get_status_url(self, obj):
+        url = reverse('product-import-job', kwargs={'job_id': obj.pk})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
 class WarehouseSerializer(serializers.ModelSerializer):
     product_count = serializers.SerializerMethodField()
 
@@ -1,9 +1,11 @@
+import csv
+
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from users.models import Business, SubscriptionPlan
-from inventory.models import Warehouse, Product
+from inventory.models import Warehouse, Product, StockMovement
 from django.test import override_settings
 
 User = get_user_model()
@@ -47,3 +49,154 @@ class InventoryViewsTestCase(APITestCase):
         response = self.client.get(url, HTTP_X_BUSINESS_ID=self.business.id)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
+
+    def test_export_products_and_stock_movements(self):
+        SubscriptionPlan.objects.filter(pk=self.user.subscription_plan_id).update(has_csv_export=True)
+        warehouse = Warehouse.objects.create(business=self.business, name='Əsas')
+        product = Product.objects.create(business=self.business, name='Çay', sku='CAY-1', base_price=5, stock_quantity=3, warehouse=warehouse)
+        Product.objects.create(business=self.business, name='Qəhvə', stock_quantity=0)
+        StockMovement.objects.create(business=self.business, product=product, warehouse=warehouse, movement_type='IN',
+                                     quantity=3, stock_before=0, stock_after=3, created_by=self.user)
+
+        response = self.client.get(reverse('product-export'), {'stock_status': 'out_of_stock'}, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[0], ['Ad', 'Təsvir', 'SKU', 'Qiymət', 'Vahid', 'Miqdar', 'Limit', 'Maya Qiyməti', 'Anbar'])
+        self.assertEqual([row[0] for row in rows[1:]], ['Qəhvə'])
+
+        response = self.client.get(reverse('stock-movement-export'), HTTP_X_BUSINESS_ID=self.business.id)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][1:5], ['Çay', 'CAY-1', 'Əsas', 'IN'])
+        self.assertEqual(rows[1][-1], self.user.email)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PRODUCT_IMPORT_JOBS_EAGER=True, PRODUCT_IMPORT_CHUNK_SIZE=2)
+class ProductImportTestCase(APITestCase):
+    def setUp(self):
+        import tempfile
+        media = override_settings(MEDIA_ROOT=tempfile.mkdtemp(), PRODUCT_IMPORT_DIR=tempfile.mkdtemp())
+        media.enable()
+        self.addCleanup(media.disable)
+
+        plan = SubscriptionPlan.objects.create(name='import', label='Import', products_limit=3)
+        self.user = User.objects.create_user(email='import@inventory.com', password='password', subscription_plan=plan)
+        self.business = Business.objects.create(name='Import Business', user=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def _sheet(self, rows):
+        import io
+        import openpyxl
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['Ad', 'Təsvir', 'SKU', 'Qiymət', 'Vahid', 'Miqdar', 'Limit', 'Maya Qiyməti', 'Anbar'])
+        for row in rows:
+            sheet.append(row)
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return SimpleUploadedFile('products.xlsx', buffer.getvalue())
+
+    def _upload(self, rows):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('product-upload-excel'), {'file': self._sheet(rows)}, format='multipart',
+                HTTP_X_BUSINESS_ID=self.business.id
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return self.client.get(response.data['status_url'], HTTP_X_BUSINESS_ID=self.business.id)
+
+    def test_import_upserts_in_chunks_and_logs_stock_changes(self):
+        from inventory.models import ProductImportJob, StockMovement
+
+        existing = Product.objects.create(business=self.business, name='Old', sku='A-1', stock_quantity=10)
+        response = self._upload([
+            ['Alma', None, 'A-1', 2, 'kg', 3, 0, 1, None],
+            ['Armud', None, 'B-2', 4, 'kg', 4, 0, 2, None],
+            ['Pis', None, 'C-3', 'abc', 'kg', 1, 0, 0, None],
+            ['Alma', 'Təzə', 'A-1', 2.5, 'kg', 2, 0, 1, None],
+            ['Xidmət', None, None, 50, 'service', 0, 0, 0, None],
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['progress'], 100)
+        self.assertEqual(
+            (response.data['processed_rows'], response.data['created_count'], response.data['updated_count']), (5, 2, 1)
+        )
+        self.assertEqual(response.data['error_count'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 4)
+
+        # Same SKU on both sides of a chunk boundary: quantities add up, last row wins
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.description, existing.stock_quantity), ('Alma', 'Təzə', 5))
+        self.assertEqual(
+            list(StockMovement.objects.filter(product=existing).order_by('id').values_list('movement_type', 'stock_before', 'stock_after')),
+            [('ADJUSTMENT_MINUS', 10, 3), ('ADJUSTMENT_PLUS', 3, 5)]
+        )
+        self.assertEqual(Product.objects.get(sku='B-2').movements.get().quantity, 4)
+        self.assertTrue(Product.objects.filter(business=self.business, name='Xidmət', sku=None).exists())
+        self.assertFalse(ProductImportJob.objects.get().file)
+
+    def test_queued_sheet_is_kept_outside_media_root(self):
+        import os
+        from django.conf import settings
+        from inventory.models import ProductImportJob
+
+        # No captured on_commit callbacks: the job stays queued with its file
+        response = self.client.post(
+            reverse('product-upload-excel'), {'file': self._sheet([['Alma', None, 'A-1', 2, 'kg', 3, 0, 1, None]])},
+            format='multipart', HTTP_X_BUSINESS_ID=self.business.id
+        )
+        job = ProductImportJob.objects.get(pk=response.data['id'])
+        self.assertTrue(os.path.exists(job.file.path))
+        self.assertFalse(job.file.path.startswith(os.path.abspath(settings.MEDIA_ROOT)))
+        self.assertEqual(os.path.basename(job.file.name), f'{job.pk}.xlsx')
+        with self.assertRaises(ValueError):
+            job.file.url
+
+    def test_only_imports_without_recent_progress_are_requeued(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from inventory.imports import ProductImporter, requeue_stale_import_jobs
+        from inventory.models import ProductImportJob
+
+        long_ago = timezone.now() - timedelta(hours=2)
+        busy, stuck = [
+            ProductImportJob.objects.create(
+                business=self.business, status='running', attempts=1, started_at=long_ago, heartbeat_at=long_ago
+            )
+            for _ in range(2)
+        ]
+        # A chunk written by the (slow but alive) worker counts as a heartbeat
+        ProductImporter(busy).flush([(2, ['Alma', None, 'A-1', 2, 'kg', 3, 0, 1, None])])
+
+        self.assertEqual(requeue_stale_import_jobs(1800), 1)
+        busy.refresh_from_db()
+        stuck.refresh_from_db()
+        self.assertEqual((busy.status, busy.processed_rows, busy.started_at), ('running', 1, long_ago))
+        self.assertEqual(stuck.status, 'queued')
+
+    def test_rows_beyond_product_limit_are_reported(self):
+        response = self._upload([[f'Məhsul {n}', None, f'P-{n}', 1, 'pcs', 1, 0, 0, None] for n in range(5)])
+        self.assertEqual(response.data['created_count'], 3)
+        self.assertEqual([error['row'] for error in response.data['errors']], [5, 6])
+        self.assertEqual(Product.objects.filter(business=self.business).count(), 3)
+
+    def test_unreadable_file_fails_the_job(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('product-upload-excel'), {'file': SimpleUploadedFile('products.xlsx', b'not a workbook')},
+                format='multipart', HTTP_X_BUSINESS_ID=self.business.id
+            )
+        job = self.client.get(response.data['status_url'], HTTP_X_BUSINESS_ID=self.business.id).data
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('Excel oxunarkən xəta', job['detail'])
+
+        other = User.objects.create_user(email='other@inventory.com', password='password')
+        other_business = Business.objects.create(name='Other', user=other)
+        self.client.force_authenticate(user=other)
+        response = self.client.get(response.data['status_url'], HTTP_X_BUSINESS_ID=other_business.id)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
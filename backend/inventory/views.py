@@ -1,9 +1,8 @@
-import openpyxl
 from decimal import Decimal
 from django.db import transaction
 from django.db.models import Sum, F, Q
 from django.utils import timezone
-from rest_framework import viewsets, status, permissions, pagination, filters, serializers
+from rest_framework import viewsets, status, permissions, filters, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
@@ -12,10 +11,10 @@ from .models import (
     Product, Warehouse, StockMovement,
     PurchaseOrder, PurchaseOrderItem,
     PurchaseOrderReceipt, PurchaseOrderReceiptItem,
-    InventoryAdjustment
+    InventoryAdjustment, ProductImportJob
 )
 from .serializers import (
-    ProductSerializer, ExcelUploadSerializer,
+    ProductSerializer, ExcelUploadSerializer, ProductImportJobSerializer,
     WarehouseSerializer, StockMovementSerializer,
     PurchaseOrderSerializer, PurchaseOrderCreateSerializer,
     PurchaseOrderItemSerializer,
@@ -27,9 +26,12 @@ from users.permissions import IsRoleAuthorized
 from users.plan_limits import check_product_limit
 from rest_framework.exceptions import PermissionDenied
 from notifications.utils import create_notification, log_activity
+from .imports import enqueue_import_job
+from utils.exports import ExportMixin
+from utils.pagination import OptionalKeysetPagination
 
 
-class StandardResultsSetPagination(pagination.PageNumberPagination):
+class StandardResultsSetPagination(OptionalKeysetPagination):
     page_size = 50
     page_size_query_param = 'page_size'
     max_page_size = 1000
@@ -98,13 +100,29 @@ class WarehouseViewSet(BusinessContextMixin, viewsets.ModelViewSet):
 
 
 # ──────────────────── PRODUCT (updated) ────────────────────
-class ProductViewSet(BusinessContextMixin, viewsets.ModelViewSet):
+class ProductViewSet(BusinessContextMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated, IsRoleAuthorized]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('name', 'id')
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'sku']
+    export_ordering = keyset_ordering
+    export_filename = 'mehsullar'
+    export_title = 'Məhsullar'
+    # Same columns as the Excel import, so an export can be edited and uploaded back
+    export_columns = (
+        ('Ad', 'name'),
+        ('Təsvir', 'description'),
+        ('SKU', 'sku'),
+        ('Qiymət', 'base_price'),
+        ('Vahid', 'unit'),
+        ('Miqdar', 'stock_quantity'),
+        ('Limit', 'min_stock_level'),
+        ('Maya Qiyməti', 'cost_price'),
+        ('Anbar', 'warehouse__name'),
+    )
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -213,6 +231,10 @@ class ProductViewSet(BusinessContextMixin, viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'], url_path='upload-excel')
     def upload_excel(self, request):
+        """
+        Queue an Excel import (inventory/imports.py) and answer 202 with the job;
+        clients follow `status_url` for progress and row-level errors.
+        """
         serializer = ExcelUploadSerializer(data=request.data)
         if serializer.is_valid():
             file = serializer.validated_data['file']
@@ -232,165 +254,31 @@ class ProductViewSet(BusinessContextMixin, viewsets.ModelViewSet):
                     "upgrade_required": True
                 }, status=status.HTTP_403_FORBIDDEN)
 
-            try:
-                wb = openpyxl.load_workbook(file, read_only=True)
-                sheet = wb.active
-
-                # Pre-fetch warehouses for lookup
-                warehouses = Warehouse.objects.filter(business=business)
-                warehouse_map = {wh.name.strip().lower(): wh for wh in warehouses}
-                default_warehouse = warehouses.filter(is_default=True).first() or (warehouses.first() if warehouses.count() == 1 else None)
-
-                excel_data_map = {}
-                for row in sheet.iter_rows(min_row=2, values_only=True):
-                    if not row or not any(row):
-                        continue
-
-                    vals = list(row) + [None] * 9
-                    # New Order: Ad, Təsvir, SKU, Qiymət, Vahid, Miqdar, Limit, Maya Qiyməti, Anbar
-                    name, desc, sku, price, unit, stock, min_stock, cost, wh_name = vals[0:9]
-
-                    if not name:
-                        continue
-
-                    # Lookup warehouse by name from the 9th column
-                    target_warehouse = None
-                    if wh_name:
-                        target_warehouse = warehouse_map.get(str(wh_name).strip().lower())
-                    
-                    if not target_warehouse:
-                        target_warehouse = default_warehouse
-
-                    sku_key = sku or f"NO-SKU-{name}"
-                    
-                    # We add warehouse to key if we want to allow same SKU in different warehouses?
-                    # The unique constraint is ('business', 'sku'). So SKU must be unique per business.
-                    # If multiple rows have same SKU, they are treated as same product but potentially summing stock.
-                    # For now, we'll stick to SKU as the primary key.
-
-                    if sku_key not in excel_data_map:
-                        excel_data_map[sku_key] = {
-                            'name': name,
-                            'description': desc,
-                            'sku': sku,
-                            'base_price': Decimal(str(price or 0)),
-                            'cost_price': Decimal(str(cost or 0)),
-                            'unit': unit or 'pcs',
-                            'stock_quantity': Decimal(str(stock or 0)),
-                            'min_stock_level': Decimal(str(min_stock or 0)),
-                            'warehouse': target_warehouse
-                        }
-                    else:
-                        excel_data_map[sku_key]['stock_quantity'] += Decimal(str(stock or 0))
-                        excel_data_map[sku_key]['name'] = name
-                        excel_data_map[sku_key]['description'] = desc
-                        excel_data_map[sku_key]['base_price'] = Decimal(str(price or 0))
-                        excel_data_map[sku_key]['cost_price'] = Decimal(str(cost or 0))
-                        excel_data_map[sku_key]['unit'] = unit or 'pcs'
-                        excel_data_map[sku_key]['min_stock_level'] = Decimal(str(min_stock or 0))
-                        # Update warehouse if provided in later rows? Let's keep first found or provided.
-                        if not excel_data_map[sku_key]['warehouse'] and target_warehouse:
-                            excel_data_map[sku_key]['warehouse'] = target_warehouse
-
-                if not excel_data_map:
-                    return Response({"detail": "Faylda yüklənə biləcək məhsul tapılmadı."}, status=status.HTTP_400_BAD_REQUEST)
-
-                limit_check = check_product_limit(request.user, business)
-                if not limit_check['allowed']:
-                    raise PermissionDenied({
-                        "code": "plan_limit",
-                        "detail": "Məhsul limitiniz dolub.",
-                        "limit": limit_check['limit'],
-                        "current": limit_check['current'],
-                        "upgrade_required": True
-                    })
-
-                remaining = limit_check['limit'] - limit_check['current'] if limit_check['limit'] else 999999
-                if len(excel_data_map) > remaining:
-                    raise PermissionDenied({
-                        "code": "plan_limit",
-                        "detail": f"Excel faylındakı məhsul sayı ({len(excel_data_map)}) qalan limitinizi ({remaining}) aşır.",
-                        "limit": limit_check['limit'],
-                        "current": limit_check['current'],
-                        "upgrade_required": True
-                    })
-
-                products_to_process = []
-                for sku_key, data in excel_data_map.items():
-                    product = Product(
-                        business=business,
-                        sku=data['sku'],
-                        name=data['name'],
-                        description=data['description'],
-                        base_price=data['base_price'],
-                        cost_price=data['cost_price'],
-                        unit=data['unit'],
-                        stock_quantity=data['stock_quantity'],
-                        min_stock_level=data['min_stock_level'],
-                        warehouse=data['warehouse'],
-                        is_deleted=False,
-                        deleted_at=None
-                    )
-                    products_to_process.append(product)
-
-                try:
-                    with transaction.atomic():
-                        Product.objects.bulk_create(
-                            products_to_process,
-                            update_conflicts=True,
-                            unique_fields=['business', 'sku'],
-                            update_fields=['name', 'description', 'base_price', 'cost_price', 'unit', 'stock_quantity', 'min_stock_level', 'is_deleted', 'deleted_at']
-                        )
-                except Exception:
-                    # FALLBACK: If bulk_create fails, try a minimal bulk_create without new fields
-                    minimal_products = []
-                    for sku_key, data in excel_data_map.items():
-                        minimal_products.append(Product(
-                            business=business,
-                            sku=data['sku'],
-                            name=data['name'],
-                            description=data['description'],
-                            base_price=data['base_price'],
-                            unit=data['unit'],
-                            is_deleted=False,
-                            deleted_at=None
-                        ))
-                    
-                    with transaction.atomic():
-                        Product.objects.bulk_create(
-                            minimal_products,
-                            update_conflicts=True,
-                            unique_fields=['business', 'sku'],
-                            update_fields=['name', 'description', 'base_price', 'unit', 'is_deleted', 'deleted_at']
-                        )
-
-                # Notify and Log for Bulk Upload
-                create_notification(
-                    user=business.user,
-                    business=business,
-                    title="Toplu Məhsul Yüklənməsi",
-                    message=f"Excel vasitəsilə {len(products_to_process)} məhsul uğurla işlənildi.",
-                    type='success',
-                    link='/inventory',
-                    setting_key='product_created'
-                )
-                log_activity(
-                    business=business,
-                    user=self.request.user,
-                    action='CREATE',
-                    module='PRODUCT',
-                    description=f"Excel ilə toplu məhsul yükləndi ({len(products_to_process)} ədəd)"
-                )
+            # Rows beyond the remaining limit are reported per row by the import itself
+            limit_check = check_product_limit(request.user, business)
+            if not limit_check['allowed']:
+                raise PermissionDenied({
+                    "code": "plan_limit",
+                    "detail": "Məhsul limitiniz dolub.",
+                    "limit": limit_check['limit'],
+                    "current": limit_check['current'],
+                    "upgrade_required": True
+                })
 
-                return Response({
-                    "detail": f"{len(products_to_process)} məhsul uğurla işlənildi (Sinxronizasiya: Mövcud stoklar əvəzləndi)."
-                }, status=status.HTTP_201_CREATED)
-            except PermissionDenied:
-                raise
-            except Exception as e:
-                return Response({"detail": f"Excel oxunarkən xəta baş verdi: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+            job = enqueue_import_job(business, file, user=request.user)
+            data = ProductImportJobSerializer(job, context={'request': request}).data
+            return Response(data, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'], url_path='import-jobs/(?P<job_id>[0-9a-f-]+)', url_name='import-job')
+    def import_job(self, request, job_id=None):
+        job = ProductImportJob.objects.filter(pk=job_id, business=self.get_active_business()).first()
+        if not job:
+            return Response({"detail": "Tapşırıq tapılmadı"}, status=status.HTTP_404_NOT_FOUND)
+        data = ProductImportJobSerializer(job, context={'request': request}).data
+        code = status.HTTP_200_OK if job.status in ('done', 'failed') else status.HTTP_202_ACCEPTED
+        return Response(data, status=code)
+
     @action(detail=False, methods=['get'], url_path='lookup')
     def lookup(self, request):
         sku = request.query_params.get('sku')
@@ -481,10 +369,8 @@ class ProductViewSet(BusinessContextMixin, viewsets.ModelViewSet):
         if not business:
             return Response({"detail": "Aktiv biznes seçilməyib."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Delete all products for this business
-        # SoftDeleteQuerySet.delete() returns an int, not a tuple
-        result = Product.objects.filter(business=business).delete()
-        count = result if isinstance(result, int) else result[0]
+        # Delete all products for this business in bulk (plan usage is refreshed via bulk_soft_deleted)
+        count = Product.objects.filter(business=business).soft_delete()
 
         return Response({
             "detail": f"{count} məhsul uğurla silindi.",
@@ -504,15 +390,33 @@ class ProductViewSet(BusinessContextMixin, viewsets.ModelViewSet):
 
 
 # ──────────────────── STOCK MOVEMENTS ────────────────────
-class StockMovementViewSet(BusinessContextMixin, viewsets.ModelViewSet):
+class StockMovementViewSet(BusinessContextMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = StockMovement.objects.all()
     serializer_class = StockMovementSerializer
     permission_classes = [permissions.IsAuthenticated, IsRoleAuthorized]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-created_at', '-id')
+    export_ordering = keyset_ordering
+    export_filename = 'stok_hereketleri'
+    export_title = 'Stok hərəkətləri'
+    export_columns = (
+        ('Tarix', 'created_at'),
+        ('Məhsul', 'product__name'),
+        ('SKU', 'product__sku'),
+        ('Anbar', 'warehouse__name'),
+        ('Növ', 'movement_type'),
+        ('Mənbə', 'source_type'),
+        ('Miqdar', 'quantity'),
+        ('Vahid maya', 'unit_cost'),
+        ('Əvvəl', 'stock_before'),
+        ('Sonra', 'stock_after'),
+        ('Qeyd', 'note'),
+        ('İstifadəçi', 'created_by__email'),
+    )
     http_method_names = ['get', 'post', 'head', 'options']  # No update/delete
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('product', 'warehouse', 'created_by')
         product_id = self.request.query_params.get('product')
         movement_type = self.request.query_params.get('movement_type')
         warehouse_id = self.request.query_params.get('warehouse')
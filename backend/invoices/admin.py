@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Invoice, InvoiceItem, Payment, Expense
+from .models import Invoice, InvoiceItem, Payment, Expense, InvoiceNumberSequence, PdfRenderJob, MonthlyRollup
 
 class InvoiceItemInline(admin.TabularInline):
     model = InvoiceItem
@@ -22,3 +22,21 @@ class ExpenseAdmin(admin.ModelAdmin):
     list_display = ('description', 'business', 'amount', 'category', 'status', 'date')
     list_filter = ('category', 'status', 'business')
     search_fields = ('description', 'vendor', 'business__name')
+
+@admin.register(InvoiceNumberSequence)
+class InvoiceNumberSequenceAdmin(admin.ModelAdmin):
+    list_display = ('business', 'prefix', 'padding', 'last_value', 'updated_at')
+    search_fields = ('business__name',)
+    readonly_fields = ('updated_at',)
+
+@admin.register(PdfRenderJob)
+class PdfRenderJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'invoice', 'action', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'action')
+    readonly_fields = ('fingerprint', 'error', 'created_at', 'started_at', 'finished_at')
+
+@admin.register(MonthlyRollup)
+class MonthlyRollupAdmin(admin.ModelAdmin):
+    list_display = ('business', 'kind', 'month', 'currency', 'status', 'count', 'total')
+    list_filter = ('kind', 'status', 'currency')
+    search_fields = ('business__name',)
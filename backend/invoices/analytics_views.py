@@ -1,17 +1,27 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from django.db.models import Sum, Count, F, Avg, Case, When, Value, IntegerField, DecimalField, Q
+from django.db.models import Sum, Count, F, Avg, Case, When, Value, IntegerField, DecimalField, FloatField, Q, Exists, OuterRef, Min, Max, ExpressionWrapper
 from django.db.models.functions import TruncDate, ExtractWeekDay
-from django.utils import timezone
 import datetime
 from datetime import timedelta
-from .models import Invoice, Payment, Expense
-from users.models import Business, TeamMember
+from decimal import Decimal
+from .models import Invoice, Payment, Expense, MonthlyRollup
+from .views import StandardResultsSetPagination
+from clients.models import Client
+from users.models import Business
 
 from rest_framework.exceptions import PermissionDenied
 
+from users.context import get_business_context
 from users.mixins import BusinessContextMixin
+from utils.functions import DaysBetween
+from utils.periods import add_months, business_timezone, date_range, in_range, local_date
+
+CHURN_LIST_SIZE = 5
+# Statuses that still expect money. Listed rather than excluded so the
+# (business, status, due_date) index can serve the overdue filters.
+UNPAID_STATUSES = ('finalized', 'sent', 'viewed', 'overdue')
 
 class AnalyticsBaseView(BusinessContextMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -23,6 +33,10 @@ class AnalyticsBaseView(BusinessContextMixin, APIView):
              raise PermissionDenied("Biznes profili tapılmadı və ya icazəniz yoxdur.")
         return business
 
+    def get_today(self, business):
+        """Today's date in the business timezone."""
+        return local_date(business_timezone(business))
+
 class PaymentAnalyticsView(AnalyticsBaseView):
     def get(self, request):
         business = self.get_business(request)
@@ -31,23 +45,31 @@ class PaymentAnalyticsView(AnalyticsBaseView):
         payments = Payment.objects.filter(invoice__business=business)
         invoices = Invoice.objects.filter(business=business, status='paid')
 
-        # 1. Payment Behavior
-        total_payments_count = payments.count()
-        on_time_payments = payments.filter(payment_date__lte=F('invoice__due_date')).count()
-        late_payments = total_payments_count - on_time_payments
+        # Day differences are computed by the database (see utils.functions.DaysBetween)
+        timed_payments = payments.annotate(
+            delay_days=DaysBetween('payment_date', 'invoice__due_date'),
+            days_taken=DaysBetween('payment_date', 'invoice__invoice_date'),
+        )
+
+        # 1. Payment Behavior + 4. Payment Speed buckets, in one aggregate
+        late = Q(payment_date__gt=F('invoice__due_date'))
+        stats = timed_payments.aggregate(
+            total=Count('id'),
+            late=Count('id', filter=late),
+            # Avg overdue days for LATE payments
+            avg_overdue_days=Avg('delay_days', filter=late, output_field=FloatField()),
+            speed_7=Count('id', filter=Q(days_taken__lte=7)),
+            speed_14=Count('id', filter=Q(days_taken__gt=7, days_taken__lte=14)),
+            speed_30=Count('id', filter=Q(days_taken__gt=14, days_taken__lte=30)),
+            speed_30_plus=Count('id', filter=Q(days_taken__gt=30)),
+        )
+        total_payments_count = stats['total']
+        late_payments = stats['late']
+        on_time_payments = total_payments_count - late_payments
         
         on_time_percentage = (on_time_payments / total_payments_count * 100) if total_payments_count > 0 else 0
         late_percentage = (late_payments / total_payments_count * 100) if total_payments_count > 0 else 0
-
-        # Avg overdue days for LATE payments
-        late_payments_qs = payments.filter(payment_date__gt=F('invoice__due_date'))
-        avg_overdue_days = 0
-        if late_payments_qs.exists():
-            # Calculate difference in days
-            # SQLite/Postgres compatibility might vary for date diffs in simple aggregate
-            # Doing python side calculation for simplicity and robustness across DBs for now
-            total_late_days = sum((p.payment_date - p.invoice.due_date).days for p in late_payments_qs)
-            avg_overdue_days = total_late_days / late_payments_qs.count()
+        avg_overdue_days = stats['avg_overdue_days'] or 0
 
         # 2. Payment Heatmap
         # Group by date
@@ -96,32 +118,12 @@ class PaymentAnalyticsView(AnalyticsBaseView):
         ]
 
         # 4. Payment Speed Analysis & Customer Rating
-        # Optimized: Fetch only needed fields and select related invoice/client to avoid N+1
-        all_payments_dates = payments.select_related('invoice', 'invoice__client').only(
-            'payment_date', 
-            'invoice__invoice_date', 
-            'invoice__due_date', 
-            'invoice__client__name',
-            'invoice__client__id'
-        )
-        
-        speed_buckets = {'0-7 gün': 0, '8-14 gün': 0, '15-30 gün': 0, '30+ gün': 0}
-        clients_analytics = {}
-        
-        for p in all_payments_dates:
-            # Speed Analysis
-            days_taken = (p.payment_date - p.invoice.invoice_date).days
-            if days_taken <= 7: speed_buckets['0-7 gün'] += 1
-            elif days_taken <= 14: speed_buckets['8-14 gün'] += 1
-            elif days_taken <= 30: speed_buckets['15-30 gün'] += 1
-            else: speed_buckets['30+ gün'] += 1
-
-            # Customer Rating Analysis
-            client = p.invoice.client
-            delay = (p.payment_date - p.invoice.due_date).days
-            if client.id not in clients_analytics:
-                clients_analytics[client.id] = {'name': client.name, 'delays': []}
-            clients_analytics[client.id]['delays'].append(delay)
+        speed_buckets = {
+            '0-7 gün': stats['speed_7'],
+            '8-14 gün': stats['speed_14'],
+            '15-30 gün': stats['speed_30'],
+            '30+ gün': stats['speed_30_plus'],
+        }
         
         total_speed_count = sum(speed_buckets.values())
         formatted_speed = []
@@ -133,9 +135,14 @@ class PaymentAnalyticsView(AnalyticsBaseView):
                 'percentage': round(percent, 1)
             })
         
+        # Average delay per client, best payers first (Top 10)
+        client_delays = timed_payments.values('invoice__client_id', 'invoice__client__name').annotate(
+            avg_delay=Avg('delay_days', output_field=FloatField())
+        ).order_by('avg_delay', 'invoice__client_id')[:10]
+
         customer_ratings = []
-        for cid, data in clients_analytics.items():
-            avg_delay = sum(data['delays']) / len(data['delays'])
+        for row in client_delays:
+            avg_delay = row['avg_delay']
             
             # Rating Logic
             if avg_delay <= 3:
@@ -156,16 +163,13 @@ class PaymentAnalyticsView(AnalyticsBaseView):
                 color = 'text-red-600 bg-red-50'
                 
             customer_ratings.append({
-                'id': cid,
-                'name': data['name'],
+                'id': row['invoice__client_id'],
+                'name': row['invoice__client__name'],
                 'avg_delay': round(avg_delay, 1),
                 'rating': rating,
                 'description': desc,
                 'color': color
             })
-            
-        # Sort customers by rating (A to D)
-        customer_ratings.sort(key=lambda x: x['avg_delay'])
 
         response_data = {
             'behavior': {
@@ -176,7 +180,7 @@ class PaymentAnalyticsView(AnalyticsBaseView):
             'heatmap': formatted_heatmap,
             'methods': formatted_methods,
             'speed': formatted_speed,
-            'customer_ratings': customer_ratings[:10] # Top 10
+            'customer_ratings': customer_ratings
         }
 
         return Response(response_data)
@@ -185,82 +189,77 @@ class ProblematicInvoicesView(AnalyticsBaseView):
     def get(self, request):
         business = self.get_business(request)
 
-        today = timezone.now().date()
+        today = self.get_today(business)
         
         # Base QS: All unpaid invoices that are past due date
         overdue_invoices = Invoice.objects.filter(
-            business=business, 
+            business=business,
+            status__in=UNPAID_STATUSES,
             due_date__lt=today
-        ).exclude(status__in=['draft', 'paid', 'cancelled'])
-
-        # 1. KPI Cards
-        total_overdue_amount = sum(inv.total - inv.paid_amount for inv in overdue_invoices)
-        debtors_count = overdue_invoices.values('client').distinct().count()
-        
-        # Critical Debt (>90 days)
-        critical_date = today - timedelta(days=90)
-        critical_invoices = overdue_invoices.filter(due_date__lt=critical_date)
-        critical_debt = sum(inv.total - inv.paid_amount for inv in critical_invoices)
-
-        # 2. Aging Analysis (Buckets)
-        aging = {
-            '1-30 gün': 0,
-            '31-60 gün': 0,
-            '61-90 gün': 0,
-            '90+ gün': 0
-        }
+        )
 
-        for inv in overdue_invoices:
-            overdue_days = (today - inv.due_date).days
-            remaining = float(inv.total - inv.paid_amount)
-            
-            if overdue_days <= 30:
-                aging['1-30 gün'] += remaining
-            elif overdue_days <= 60:
-                aging['31-60 gün'] += remaining
-            elif overdue_days <= 90:
-                aging['61-90 gün'] += remaining
-            else:
-                aging['90+ gün'] += remaining
+        remaining = ExpressionWrapper(F('total') - F('paid_amount'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+        def remaining_due(**due_date):
+            return Sum(Case(When(then=remaining, **due_date), default=Value(0), output_field=DecimalField(max_digits=12, decimal_places=2)))
+
+        # 1. KPI Cards + 2. Aging Analysis (Buckets), in one aggregate
+        # Overdue days map to due-date ranges, so no date arithmetic is needed in SQL
+        # Critical Debt (>90 days) is the 90+ bucket
+        totals = overdue_invoices.aggregate(
+            total_overdue=Sum(remaining),
+            debtors_count=Count('client', distinct=True),
+            aging_30=remaining_due(due_date__gte=today - timedelta(days=30)),
+            aging_60=remaining_due(due_date__gte=today - timedelta(days=60), due_date__lt=today - timedelta(days=30)),
+            aging_90=remaining_due(due_date__gte=today - timedelta(days=90), due_date__lt=today - timedelta(days=60)),
+            aging_90_plus=remaining_due(due_date__lt=today - timedelta(days=90)),
+        )
 
         formatted_aging = [
-            {'range': k, 'amount': v} for k, v in aging.items()
+            {'range': '1-30 gün', 'amount': float(totals['aging_30'] or 0)},
+            {'range': '31-60 gün', 'amount': float(totals['aging_60'] or 0)},
+            {'range': '61-90 gün', 'amount': float(totals['aging_90'] or 0)},
+            {'range': '90+ gün', 'amount': float(totals['aging_90_plus'] or 0)},
         ]
 
-        # 3. Debtors List (Top Risk)
-        debtors_map = {}
-        for inv in overdue_invoices:
-            cid = inv.client.id
-            if cid not in debtors_map:
-                debtors_map[cid] = {
-                    'id': cid,
-                    'name': inv.client.name,
-                    'email': inv.client.email,
-                    'phone': inv.client.phone,
-                    'total_debt': 0,
-                    'invoices_count': 0,
-                    'max_overdue_days': 0
-                }
-            
-            remaining = float(inv.total - inv.paid_amount)
-            overdue_days = (today - inv.due_date).days
-            
-            debtors_map[cid]['total_debt'] += remaining
-            debtors_map[cid]['invoices_count'] += 1
-            if overdue_days > debtors_map[cid]['max_overdue_days']:
-                debtors_map[cid]['max_overdue_days'] = overdue_days
-
-        debtors_list = list(debtors_map.values())
-        debtors_list.sort(key=lambda x: x['total_debt'], reverse=True)
+        # 3. Debtors List (Top Risk), grouped by client and paginated
+        debtors_qs = overdue_invoices.values(
+            'client_id', 'client__name', 'client__email', 'client__phone'
+        ).annotate(
+            total_debt=Sum(remaining),
+            invoices_count=Count('id'),
+            oldest_due_date=Min('due_date'),
+        ).order_by('-total_debt', 'client_id')
+
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(debtors_qs, request, view=self)
+
+        debtors_list = [
+            {
+                'id': row['client_id'],
+                'name': row['client__name'],
+                'email': row['client__email'],
+                'phone': row['client__phone'],
+                'total_debt': float(row['total_debt'] or 0),
+                'invoices_count': row['invoices_count'],
+                'max_overdue_days': (today - row['oldest_due_date']).days
+            }
+            for row in page
+        ]
 
         response_data = {
             'kpi': {
-                'total_overdue': float(total_overdue_amount),
-                'critical_debt': float(critical_debt),
-                'debtors_count': debtors_count
+                'total_overdue': float(totals['total_overdue'] or 0),
+                'critical_debt': float(totals['aging_90_plus'] or 0),
+                'debtors_count': totals['debtors_count']
             },
             'aging': formatted_aging,
-            'debtors': debtors_list
+            'debtors': debtors_list,
+            'debtors_pagination': {
+                'count': paginator.page.paginator.count,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+            }
         }
 
         return Response(response_data)
@@ -269,36 +268,29 @@ class ForecastAnalyticsView(AnalyticsBaseView):
     def get(self, request):
         business = self.get_business(request)
 
-        today = timezone.now().date()
-        current_month_start = today.replace(day=1)
+        today = self.get_today(business)
+        current_month_start, _ = date_range('month', today)
+        rollups = MonthlyRollup.objects.filter(business=business)
         
         # --- 1. GROWTH METRICS (MoM, YoY) ---
         
-        # Helper to get revenue for a specific month range
-        def get_revenue(start_date, end_date):
-            return Invoice.objects.filter(
-                business=business, 
-                invoice_date__range=[start_date, end_date],
+        # Accrued revenue per invoice month for the last 13 months, one indexed lookup
+        revenue_by_month = dict(
+            rollups.filter(
+                kind='invoice',
+                month__gte=add_months(current_month_start, -12),
+                month__lte=current_month_start,
                 status__in=['paid', 'sent', 'overdue'] # Considering accrued revenue
-            ).aggregate(total=Sum('total'))['total'] or 0
-
-        # Current Month
-        # End of current month
-        next_month = (current_month_start + timedelta(days=32)).replace(day=1)
-        current_month_end = next_month - timedelta(days=1)
-        current_revenue = get_revenue(current_month_start, current_month_end)
+            ).values('month').annotate(revenue=Sum('total')).values_list('month', 'revenue')
+        )
 
-        # Last Month
-        last_month_end = current_month_start - timedelta(days=1)
-        last_month_start = last_month_end.replace(day=1)
-        last_revenue = get_revenue(last_month_start, last_month_end)
+        def get_revenue(month):
+            return revenue_by_month.get(month) or 0
 
+        current_revenue = get_revenue(current_month_start)
+        last_revenue = get_revenue(add_months(current_month_start, -1))
         # Same Month Last Year
-        last_year_start = current_month_start.replace(year=today.year - 1)
-        # Handle leap year edge case if needed, but replace handles most
-        next_month_ly = (last_year_start + timedelta(days=32)).replace(day=1)
-        last_year_end = next_month_ly - timedelta(days=1)
-        last_year_revenue = get_revenue(last_year_start, last_year_end)
+        last_year_revenue = get_revenue(add_months(current_month_start, -12))
 
         # Calculations
         mom_growth = ((current_revenue - last_revenue) / last_revenue * 100) if last_revenue > 0 else 100 if current_revenue > 0 else 0
@@ -313,24 +305,8 @@ class ForecastAnalyticsView(AnalyticsBaseView):
         
         # Loop back 11 months + current
         for i in range(11, -1, -1):
-            # Calculate date range for Month (Current - i)
-            # This is a bit tricky with time deltas, easier to construct date objects
-            # Let's simple approximate for MVP or use relativedelta if available (not standard)
-            # Using simple math logic:
-            year = today.year
-            month = today.month - i
-            while month <= 0:
-                month += 12
-                year -= 1
-            
-            start = timezone.datetime(year, month, 1).date()
-            # Get end of month
-            if month == 12:
-                end = timezone.datetime(year + 1, 1, 1).date() - timedelta(days=1)
-            else:
-                end = timezone.datetime(year, month + 1, 1).date() - timedelta(days=1)
-            
-            rev = get_revenue(start, end)
+            start = add_months(current_month_start, -i)
+            rev = get_revenue(start)
             historical_data.append(float(rev))
             months_labels.append(start.strftime("%b"))
 
@@ -363,12 +339,7 @@ class ForecastAnalyticsView(AnalyticsBaseView):
             worst = realistic * 0.85 # 15% worse
             
             # Future Date Label
-            future_month = today.month + i
-            future_year = today.year
-            while future_month > 12:
-                future_month -= 12
-                future_year += 1
-            label = timezone.datetime(future_year, future_month, 1).strftime("%b")
+            label = add_months(current_month_start, i).strftime("%b")
             
             forecast_data.append({
                 'month': label,
@@ -392,39 +363,30 @@ class ForecastAnalyticsView(AnalyticsBaseView):
         # 1. Projected Inflow: Invoices due in next 3 months
         # 2. Projected Outflow: Avg Expenses of last 6 months * 3
         
-        from .models import Expense # Import locally to avoid circular if any
-        
-        # Expense Avg
+        # Expense Avg: whole months from the rollup plus the partial month at the window start
         six_months_ago = today - timedelta(days=180)
-        expenses_last_6m = Expense.objects.filter(business=business, date__gt=six_months_ago).aggregate(total=Sum('amount'))['total'] or 0
+        boundary_month = six_months_ago.replace(day=1)
+        expenses_last_6m = (rollups.filter(kind='expense', month__gt=boundary_month).aggregate(total=Sum('total'))['total'] or 0) + (
+            Expense.objects.filter(
+                business=business, date__gt=six_months_ago, date__lt=add_months(boundary_month, 1)
+            ).aggregate(total=Sum('amount'))['total'] or 0
+        )
         monthly_avg_expense = float(expenses_last_6m) / 6 if expenses_last_6m > 0 else 0
+
+        # Inflow: Sum of Unpaid Invoices falling due in each month
+        # Paid invoices are already "Cash In". We want "To be collected".
+        upcoming_months = [add_months(current_month_start, i) for i in range(1, 4)]
+        inflow_by_month = dict(
+            rollups.filter(
+                kind='invoice_due',
+                month__in=upcoming_months,
+                status__in=['sent', 'viewed', 'overdue']
+            ).values('month').annotate(inflow=Sum('total')).values_list('month', 'inflow')
+        )
         
         cashflow_forecast = []
-        for i in range(1, 4):
-            # Month Range
-            future_month = today.month + i
-            future_year = today.year
-            while future_month > 12:
-                future_month -= 12
-                future_year += 1
-            
-            start = timezone.datetime(future_year, future_month, 1).date()
-            if future_month == 12:
-                end = timezone.datetime(future_year + 1, 1, 1).date() - timedelta(days=1)
-            else:
-                end = timezone.datetime(future_year, future_month + 1, 1).date() - timedelta(days=1)
-                
-            # Inflow: Sum of Unpaid Invoices falling due in this month
-            inflow = Invoice.objects.filter(
-                business=business, 
-                due_date__range=[start, end],
-                status__in=['sent', 'viewed', 'overdue']
-            ).aggregate(total=Sum('total'))['total'] or 0
-            
-            # Add accrued paid invoices? No, cashflow forecast represents FUTURE cash movement.
-            # Paid invoices are already "Cash In". We want "To be collected".
-            
-            inflow = float(inflow)
+        for start in upcoming_months:
+            inflow = float(inflow_by_month.get(start) or 0)
             outflow = monthly_avg_expense # Assumed constant 
             net = inflow - outflow
             
@@ -439,23 +401,23 @@ class ForecastAnalyticsView(AnalyticsBaseView):
         # Clients active before but NO invoices in last 90 days
         cutoff_date = today - timedelta(days=90)
         
-        # Get all clients
-        all_clients = business.clients.all()
-        churn_risk_clients = []
-        
-        for client in all_clients:
-            last_inv = client.invoices.order_by('-invoice_date').first()
-            if last_inv:
-                if last_inv.invoice_date < cutoff_date:
-                    churn_risk_clients.append({
-                        'id': client.id,
-                        'name': client.name,
-                        'last_seen': last_inv.invoice_date.strftime("%Y-%m-%d"),
-                        'days_inactive': (today - last_inv.invoice_date).days
-                    })
-        
-        # Sort by days inactive
-        churn_risk_clients.sort(key=lambda x: x['days_inactive'], reverse=True)
+        # Last invoice date per client in one grouped query; only the top 5 rows leave the database
+        churn_candidates = business.clients.annotate(
+            last_invoice_date=Max('invoices__invoice_date', filter=Q(invoices__is_deleted=False))
+        ).filter(
+            last_invoice_date__lt=cutoff_date
+        ).order_by('last_invoice_date', 'id').values('id', 'name', 'last_invoice_date')[:CHURN_LIST_SIZE]
+
+        # Sorted by days inactive
+        churn_risk_clients = [
+            {
+                'id': client['id'],
+                'name': client['name'],
+                'last_seen': client['last_invoice_date'].strftime("%Y-%m-%d"),
+                'days_inactive': (today - client['last_invoice_date']).days
+            }
+            for client in churn_candidates
+        ]
 
         response_data = {
             'growth': {
@@ -466,7 +428,7 @@ class ForecastAnalyticsView(AnalyticsBaseView):
             'revenue_chart': combined_chart_data + forecast_data,
             'cashflow': cashflow_forecast,
             'risks': {
-                'churn_list': churn_risk_clients[:5] # Top 5 at risk
+                'churn_list': churn_risk_clients # Top 5 at risk
             }
         }
 
@@ -475,74 +437,75 @@ class ForecastAnalyticsView(AnalyticsBaseView):
 class TaxAnalyticsView(AnalyticsBaseView):
     def get(self, request):
         business = self.get_business(request)
-        today = timezone.now().date()
+        today = self.get_today(business)
 
         # Fix Bug 12: Year validation
         try:
             year_str = request.query_params.get('year')
-            year = int(year_str) if year_str else timezone.now().year
+            year = int(year_str) if year_str else today.year
         except (ValueError, TypeError):
-            year = timezone.now().year
+            year = today.year
         
-        # Base Querysets for the specific year
-        invoices = Invoice.objects.filter(business=business, invoice_date__year=year)
+        year_start, next_year_start = date_range('year', datetime.date(year, 1, 1))
+        excluded_statuses = ['draft', 'cancelled']
+        rollups = MonthlyRollup.objects.filter(business=business)
+
         # We consider paid/sent invoices for tax, excluding drafts and cancelled
-        relevant_invoices = invoices.exclude(status__in=['draft', 'cancelled'])
-        
-        from .models import Expense
-        expenses = Expense.objects.filter(business=business, date__year=year)
-
-        # 1. VAT (ƏDV) Analysis
-        vat_summary = relevant_invoices.aggregate(
-            total_vat=Sum('tax_amount'),
-            vat_18=Sum(Case(When(tax_rate=18, then=F('tax_amount'))), output_field=DecimalField(max_digits=10, decimal_places=2)),
-            vat_0=Sum(Case(When(tax_rate=0, then=F('tax_amount'))), output_field=DecimalField(max_digits=10, decimal_places=2))
+        invoice_months = list(
+            rollups.filter(kind='invoice', month__gte=year_start, month__lt=next_year_start)
+            .exclude(status__in=excluded_statuses)
+            .values('month', 'tax_rate')
+            .annotate(vat=Sum('tax_amount'), revenue=Sum('subtotal'))
+            .order_by('month')
+        )
+        expense_months = list(
+            rollups.filter(kind='expense', month__gte=year_start, month__lt=next_year_start)
+            .values('month', 'is_tax_deductible')
+            .annotate(amount=Sum('total'))
         )
 
-        # Monthly VAT Breakdown
-        from django.db.models.functions import ExtractMonth
-        monthly_vat = relevant_invoices.annotate(month=ExtractMonth('invoice_date'))\
-            .values('month')\
-            .annotate(vat=Sum('tax_amount'), revenue=Sum('subtotal'))\
-            .order_by('month')
+        # 1. VAT (ƏDV) Analysis + Monthly VAT Breakdown
+        vat_by_rate = {}
+        monthly_vat = {}
+        quarterly_data = {}
+        for row in invoice_months:
+            vat, revenue = float(row['vat']), float(row['revenue'])
+            vat_by_rate[row['tax_rate']] = vat_by_rate.get(row['tax_rate'], 0) + vat
+            month = monthly_vat.setdefault(row['month'].month, {'vat': 0, 'revenue': 0})
+            month['vat'] += vat
+            month['revenue'] += revenue
+            quarter = quarterly_data.setdefault((row['month'].month - 1) // 3 + 1, {'vat': 0, 'revenue': 0})
+            quarter['vat'] += vat
+            quarter['revenue'] += revenue
 
         formatted_monthly = []
         month_names = ['Yanvar', 'Fevral', 'Mart', 'Aprel', 'May', 'İyun', 'İyul', 'Avqust', 'Sentyabr', 'Oktyabr', 'Noyabr', 'Dekabr']
-        for m in monthly_vat:
+        for m, values in sorted(monthly_vat.items()):
             formatted_monthly.append({
-                'month': month_names[m['month']-1],
-                'vat': float(m['vat'] or 0),
-                'revenue': float(m['revenue'] or 0)
+                'month': month_names[m-1],
+                'vat': values['vat'],
+                'revenue': values['revenue']
             })
 
         # 2. Income Tax (Gəlir Vergisi)
-        total_revenue = float(relevant_invoices.aggregate(Sum('subtotal'))['subtotal__sum'] or 0)
+        total_revenue = sum(values['revenue'] for values in monthly_vat.values())
         
         # Professional Logic: Only deduct tax-deductible expenses from the tax base
-        deductible_expenses = expenses.filter(is_tax_deductible=True)
-        total_expenses = float(expenses.aggregate(Sum('amount'))['amount__sum'] or 0)
-        official_expenses = float(deductible_expenses.aggregate(Sum('amount'))['amount__sum'] or 0)
+        total_expenses = sum(float(row['amount']) for row in expense_months)
+        official_expenses = sum(float(row['amount']) for row in expense_months if row['is_tax_deductible'])
         
         tax_base = max(0, total_revenue - official_expenses)
         
         # 3. Quarterly Breakdown
-        from django.db.models.functions import ExtractQuarter
-        quarterly_data = relevant_invoices.annotate(quarter=ExtractQuarter('invoice_date'))\
-            .values('quarter')\
-            .annotate(revenue=Sum('subtotal'), vat=Sum('tax_amount'))\
-            .order_by('quarter')
-        
-        quarterly_expenses = expenses.annotate(quarter=ExtractQuarter('date'))\
-            .values('quarter')\
-            .annotate(amount=Sum('amount'))\
-            .order_by('quarter')
-        
-        exp_map = {q['quarter']: float(q['amount']) for q in quarterly_expenses}
+        exp_map = {}
+        for row in expense_months:
+            q = (row['month'].month - 1) // 3 + 1
+            exp_map[q] = exp_map.get(q, 0) + float(row['amount'])
         
         formatted_quarters = []
         for i in range(1, 5):
-            q_rev = next((float(q['revenue']) for q in quarterly_data if q['quarter'] == i), 0)
-            q_vat = next((float(q['vat']) for q in quarterly_data if q['quarter'] == i), 0)
+            q_rev = quarterly_data.get(i, {}).get('revenue', 0)
+            q_vat = quarterly_data.get(i, {}).get('vat', 0)
             q_exp = exp_map.get(i, 0)
             
             formatted_quarters.append({
@@ -555,26 +518,38 @@ class TaxAnalyticsView(AnalyticsBaseView):
 
         # 4. Yearly Summary & Comparisons
         # 4. VAT Registration Threshold Analysis (200,000 AZN / 12 months)
-        # Any consecutive 12 months!
+        # Any consecutive 12 months! Whole months come from the rollup, the partial first month from invoices.
         twelve_months_ago = today - timedelta(days=365)
-        twelve_month_revenue = float(Invoice.objects.filter(
-            business=business,
-            invoice_date__gte=twelve_months_ago
-        ).exclude(status__in=['draft', 'cancelled']).aggregate(total=Sum('subtotal'))['total'] or 0)
+        boundary_month = twelve_months_ago.replace(day=1)
+        twelve_month_revenue = float(
+            (rollups.filter(kind='invoice', month__gt=boundary_month)
+             .exclude(status__in=excluded_statuses)
+             .aggregate(total=Sum('subtotal'))['total'] or 0)
+            + (Invoice.objects.filter(
+                business=business,
+                invoice_date__gte=twelve_months_ago,
+                invoice_date__lt=add_months(boundary_month, 1)
+            ).exclude(status__in=excluded_statuses).aggregate(total=Sum('subtotal'))['total'] or 0)
+        )
         
         vat_limit = 200000.00
         is_approaching_vat = twelve_month_revenue > (vat_limit * 0.8)
         is_over_vat = twelve_month_revenue >= vat_limit
 
-        customer_count = relevant_invoices.values('client').distinct().count()
+        customer_count = Client.all_objects.filter(business=business).filter(Exists(
+            Invoice.objects.filter(
+                client=OuterRef('pk'),
+                **in_range('invoice_date', (year_start, next_year_start))
+            ).exclude(status__in=excluded_statuses)
+        )).count()
         
         response_data = {
             'year': year,
             'vat': {
-                'total': float(vat_summary['total_vat'] or 0),
+                'total': sum(vat_by_rate.values()),
                 'by_rate': {
-                    'rate_18': float(vat_summary['vat_18'] or 0),
-                    'rate_0': float(vat_summary['vat_0'] or 0)
+                    'rate_18': vat_by_rate.get(Decimal('18.00'), 0),
+                    'rate_0': vat_by_rate.get(Decimal('0.00'), 0)
                 },
                 'monthly': formatted_monthly
             },
@@ -626,8 +601,8 @@ class DashboardStatsView(AnalyticsBaseView):
         invoices = Invoice.objects.filter(business=business).exclude(status__in=['draft', 'cancelled'])
         
         # Role-based filtering
-        team_member = TeamMember.objects.filter(business=business, user=request.user).first()
-        if team_member and team_member.role == 'SALES_REP':
+        context = get_business_context(request)
+        if context.is_team_member and context.role == 'SALES_REP':
             # Sales Reps see only their assigned clients' invoices or created by them
             invoices = invoices.filter(
                 Q(created_by=request.user) | Q(client__assigned_to=request.user)
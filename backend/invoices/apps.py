@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class InvoicesConfig(AppConfig):
     name = 'invoices'
+
+    def ready(self):
+        import invoices.public  # noqa: F401
+        import invoices.rollups  # noqa: F401
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.utils import timezone
+
+from notifications.outbox import queue_email_message
+
+from .pdf import CURRENCY_SYMBOLS
+
+
+def build_invoice_email(invoice, pdf_content):
+    """Build the client-facing invoice email with the PDF attached."""
+    client = invoice.client
+    subject = f"Faktura #{invoice.invoice_number} - {invoice.business.name}"
+
+    # Simple body with link
+    frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:5173').rstrip('/')
+    public_link = f"{frontend_url}/view/{invoice.share_token}"
+    currency_symbol = CURRENCY_SYMBOLS.get(
+        invoice.currency or invoice.business.default_currency,
+        '₼'
+    )
+
+    body = f"Salam {client.name},\n\n"
+    body += f"{invoice.business.name} tərəfindən sizə {invoice.invoice_number} nömrəli faktura göndərilib.\n"
+    body += f"Məbləğ: {invoice.total} {currency_symbol}\n\n"
+    body += f"Fakturanı onlayn izləmək və ödəmək üçün aşağıdakı linkə daxil olun:\n{public_link}\n\n"
+    body += "Təşəkkürlər!"
+
+    email = EmailMessage(
+        subject,
+        body,
+        settings.DEFAULT_FROM_EMAIL or 'noreply@invoiceaz.com',
+        [client.email],
+    )
+    email.attach(f"invoice_{invoice.invoice_number}.pdf", pdf_content, 'application/pdf')
+    return email
+
+
+def mark_invoice_sent(invoice):
+    if invoice.status in ['draft', 'finalized']:
+        invoice.status = 'sent'
+        invoice.sent_at = timezone.now()
+        invoice.save(update_fields=['status', 'sent_at', 'updated_at'])
+
+
+def send_invoice_email(invoice, pdf_content):
+    """Queue the invoice email for the outbox worker and move drafts to 'sent'."""
+    queue_email_message(build_invoice_email(invoice, pdf_content), category='invoice')
+    mark_invoice_sent(invoice)
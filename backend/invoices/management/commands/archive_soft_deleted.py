@@ -0,0 +1,155 @@
+"""
+Move rows soft-deleted more than N days ago out of the live tables into
+ArchivedRecord (one JSON snapshot per row).
+Usage: python manage.py archive_soft_deleted                   # deleted 90+ days ago
+       python manage.py archive_soft_deleted --days 30 --batch-size 200 --sleep 0.5
+       python manage.py archive_soft_deleted --dry-run         # only count and report sizes
+
+Each batch is archived and removed in its own short transaction, so only the
+rows of that batch are locked. Models are processed children first (lines and
+payments before invoices, invoices before clients). A row that anything still
+references (a stock movement, a PDF job, a live invoice of a deleted client)
+is kept; public view events (InvoiceView) do not count as references and are
+dropped with their invoice. --dry-run counts the rows archivable right now;
+parents whose children get archived in the same run become archivable too.
+Soft delete already applied the side effects (stock, rollups, storage, plan
+usage), so the rows are removed without signals.
+
+Table and index sizes are printed before and after. PostgreSQL hands the
+space back to the table after VACUUM; SQLite sizes come from the dbstat
+virtual table and are shown as "-" when it is not compiled in.
+"""
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from invoices.models import ArchivedRecord
+
+# (model label, path to the business id), children before their parents
+ARCHIVED_MODELS = (
+    ('invoices.InvoiceItem', 'invoice__business_id'),
+    ('invoices.Payment', 'invoice__business_id'),
+    ('invoices.Invoice', 'business_id'),
+    ('invoices.Expense', 'business_id'),
+    ('clients.Client', 'business_id'),
+    ('inventory.Product', 'business_id'),
+    ('inventory.Warehouse', 'business_id'),
+)
+
+# Rows of these models are removed together with the row they point to
+DROPPED_WITH_PARENT = ('invoices.InvoiceView',)
+
+
+def _dropped_relations(model):
+    return [relation for relation in model._meta.related_objects if relation.related_model._meta.label in DROPPED_WITH_PARENT]
+
+
+def archivable(model, cutoff):
+    """Rows of `model` soft-deleted before `cutoff` that no other row references."""
+    rows = model.all_objects.filter(is_deleted=True, deleted_at__lt=cutoff)
+    for relation in model._meta.related_objects:
+        if relation.related_model._meta.label in DROPPED_WITH_PARENT:
+            continue
+        referencing = relation.related_model._base_manager.filter(**{relation.field.name: OuterRef('pk')})
+        rows = rows.filter(~Exists(referencing))
+    return rows
+
+
+def relation_sizes(model):
+    """(table bytes, index bytes) of `model`, or (None, None) when the backend cannot tell."""
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_table_size(%s), pg_indexes_size(%s)', [table, table])
+                return cursor.fetchone()
+            if connection.vendor == 'sqlite':
+                indexes = [
+                    name for name, info in connection.introspection.get_constraints(cursor, table).items()
+                    if info['index'] or info['unique']
+                ]
+                cursor.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')
+                sizes = dict(cursor.fetchall())
+                return sizes.get(table, 0), sum(sizes.get(name, 0) for name in indexes)
+    except DatabaseError:
+        pass
+    return None, None
+
+
+def _format_size(size):
+    return '-' if size is None else f'{size / 1024:.0f} KB'
+
+
+class Command(BaseCommand):
+    help = 'Archive rows soft-deleted more than --days ago and remove them from the live tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Archive rows deleted more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Count the rows without archiving them')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        models = [(apps.get_model(label), business_path) for label, business_path in ARCHIVED_MODELS]
+
+        self.stdout.write('Before:')
+        ready = sum(self._report(model, cutoff) for model, _ in models)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Success: {ready} rows can be archived.'))
+            return
+
+        archived = 0
+        for model, business_path in models:
+            archived += self._archive(model, business_path, cutoff, options['batch_size'], options['sleep'])
+
+        self.stdout.write('After:')
+        for model, _ in models:
+            self._report(model, cutoff)
+        self.stdout.write(self.style.SUCCESS(f'Success: Archived {archived} rows.'))
+
+    def _archive(self, model, business_path, cutoff, batch_size, sleep):
+        label = model._meta.label
+        archived = 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    archivable(model, cutoff).select_for_update(of=('self',))
+                    .annotate(archive_business_id=F(business_path)).order_by('pk')[:batch_size]
+                )
+                if not rows:
+                    return archived
+                ArchivedRecord.objects.bulk_create([
+                    ArchivedRecord(
+                        model=label, object_id=row.pk, business_id=row.archive_business_id,
+                        deleted_at=row.deleted_at, data=entry['fields'],
+                    )
+                    for row, entry in zip(rows, serializers.serialize('python', rows))
+                ], ignore_conflicts=True)
+                # Nothing else references these rows, so no collector/cascade is needed
+                ids = [row.pk for row in rows]
+                for relation in _dropped_relations(model):
+                    dropped = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': ids})
+                    dropped._raw_delete(dropped.db)
+                batch = model.all_objects.filter(pk__in=ids)
+                batch._raw_delete(batch.db)
+            archived += len(rows)
+            if sleep:
+                time.sleep(sleep)
+
+    def _report(self, model, cutoff):
+        total = model.all_objects.count()
+        deleted = model.all_objects.filter(is_deleted=True).count()
+        ready = archivable(model, cutoff).count()
+        table_size, index_size = relation_sizes(model)
+        self.stdout.write(
+            f'  {model._meta.label}: {total} rows, {deleted} deleted, {ready} archivable; '
+            f'table {_format_size(table_size)}, indexes {_format_size(index_size)}'
+        )
+        return ready
@@ -0,0 +1,171 @@
+"""
+Benchmark the business-scoped composite indexes against the hot queries they serve.
+Usage: python manage.py bench_indexes --businesses 5 --invoices 20000 --movements 20000
+
+Seeds throwaway businesses (the measured one plus neighbours sharing the
+tables), then runs each hot query twice: with the indexes from
+invoices/0022-0023 and inventory/0007 in place ("after") and dropped
+("before"). Reports the best of `--repeat` timings and, with --explain, the
+query plans. The "before" run drops the indexes inside a transaction that is
+always rolled back, so a killed run cannot leave the tables without them; the
+seeded businesses are removed afterwards.
+
+Dropping an index locks its table for the whole "before" run, so the command
+only runs against a development database (DEBUG) unless
+--i-know-this-drops-indexes is given, and never on a backend that cannot roll
+back DDL.
+"""
+import datetime
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from clients.models import Client
+from inventory.models import Product, StockMovement
+from invoices.analytics_views import UNPAID_STATUSES
+from invoices.models import Invoice
+from users.models import Business
+
+# (model, index name) of the indexes under test
+INDEXES = (
+    (Invoice, 'invoice_live_status_due_idx'),
+    (Invoice, 'invoice_live_date_idx'),
+    (StockMovement, 'stockmove_product_created_idx'),
+)
+STATUSES = ('draft', 'sent', 'viewed', 'paid', 'overdue', 'cancelled')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark hot business-scoped queries with and without the composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--businesses', type=int, default=5)
+        parser.add_argument('--invoices', type=int, default=20000, help='Invoices per business')
+        parser.add_argument('--movements', type=int, default=20000, help='Stock movements per business')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--explain', action='store_true', help='Print the query plans')
+        parser.add_argument(
+            '--i-know-this-drops-indexes', action='store_true',
+            help='Run even though DEBUG is off (the indexes are dropped and the tables locked while measuring)'
+        )
+
+    def handle(self, *args, **options):
+        if not connection.features.can_rollback_ddl:
+            raise CommandError(f'{connection.vendor} cannot roll back DDL; run this on PostgreSQL or SQLite.')
+        if not (settings.DEBUG or options['i_know_this_drops_indexes']):
+            raise CommandError(
+                'This drops indexes and seeds rows in the configured database. Run it against a '
+                'development database (DEBUG=True) or pass --i-know-this-drops-indexes.'
+            )
+
+        User = get_user_model()
+        self.user = User.objects.create_user(email=f"bench-{uuid.uuid4().hex[:8]}@invoice.az", password=uuid.uuid4().hex)
+        businesses = [
+            Business.objects.create(user=self.user, name=f'Benchmark Business {n}')
+            for n in range(options['businesses'])
+        ]
+
+        try:
+            for business in businesses:
+                self._seed(business, options['invoices'], options['movements'])
+            self._analyze()
+
+            queries = self._queries(businesses[0])
+            after = self._measure(queries, options)
+            with transaction.atomic():
+                self._drop_indexes()
+                self._analyze()
+                before = self._measure(queries, options)
+                # Brings the indexes (and their statistics) back, however the run ends
+                transaction.set_rollback(True)
+
+            self.stdout.write(f"{'query':<20}{'before ms':>11}{'after ms':>10}")
+            for name in queries:
+                self.stdout.write(f"{name:<20}{before[name][0]:>11.2f}{after[name][0]:>10.2f}")
+            if options['explain']:
+                for name in queries:
+                    self.stdout.write(f"\n== {name}\n-- before\n{before[name][1]}\n-- after\n{after[name][1]}")
+        finally:
+            StockMovement.objects.filter(business__in=businesses).delete()
+            Product.all_objects.filter(business__in=businesses).delete()
+            Invoice.all_objects.filter(business__in=businesses).delete()
+            Client.all_objects.filter(business__in=businesses).delete()
+            for business in businesses:
+                business.delete()
+            self.user.delete()
+
+        self.stdout.write(self.style.SUCCESS('Success: Index benchmark finished.'))
+
+    def _queries(self, business):
+        """Name -> queryset for the hot query patterns, shaped as the views issue them."""
+        today = timezone.now().date()
+        open_invoices = Invoice.objects.filter(business=business).exclude(status__in=['draft', 'cancelled'])
+        product = Product.objects.filter(business=business).first()
+        return {
+            # ProblematicInvoicesView
+            'overdue_aging': Invoice.objects.filter(business=business, status__in=UNPAID_STATUSES, due_date__lt=today)
+                .values('business').annotate(total=Sum(F('total') - F('paid_amount'))),
+            # DashboardStatsView
+            'dashboard_overdue': open_invoices.filter(status='overdue')
+                .values('business').annotate(total=Sum(F('total') - F('paid_amount'))),
+            # TaxReportView / forecast: revenue over the last 12 months
+            'revenue_12_months': Invoice.objects.filter(business=business, invoice_date__gte=today - timedelta(days=365))
+                .exclude(status__in=['draft', 'cancelled']).values('business').annotate(total=Sum('subtotal')),
+            # StockMovementViewSet ?product=
+            'product_history': StockMovement.objects.filter(product=product).order_by('-created_at')[:50],
+        }
+
+    def _measure(self, queries, options):
+        results = {}
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            plan = queryset.explain() if options['explain'] else ''
+            results[name] = (min(timings) * 1000, plan)
+        return results
+
+    def _drop_indexes(self):
+        # Plain DROP INDEX: the SQLite schema editor refuses to run inside a transaction
+        with connection.cursor() as cursor:
+            for _, name in INDEXES:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+
+    def _analyze(self):
+        with connection.cursor() as cursor:
+            for model in (Invoice, StockMovement):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    def _seed(self, business, invoices, movements):
+        rng = random.Random(business.id)
+        client = Client.objects.create(business=business, name='Benchmark Client')
+        today = datetime.date.today()
+        rows = []
+        for i in range(invoices):
+            invoice_date = today - timedelta(days=rng.randrange(3 * 365))
+            rows.append(Invoice(
+                business=business, client=client, invoice_number=f'BENCH-{i:06d}', invoice_date=invoice_date,
+                due_date=invoice_date + timedelta(days=rng.choice((7, 14, 30))), status=rng.choice(STATUSES),
+                subtotal=Decimal('100.00'), total=Decimal('100.00'), paid_amount=Decimal('0.00'),
+            ))
+        Invoice.objects.bulk_create(rows, batch_size=2000)
+
+        products = Product.objects.bulk_create([
+            Product(business=business, name=f'Benchmark Product {n}', stock_quantity=movements) for n in range(20)
+        ])
+        StockMovement.objects.bulk_create([
+            StockMovement(business=business, product=products[i % len(products)], movement_type='OUT',
+                          source_type='MANUAL', quantity=1, stock_before=1, stock_after=0)
+            for i in range(movements)
+        ], batch_size=2000)
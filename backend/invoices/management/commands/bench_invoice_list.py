@@ -0,0 +1,116 @@
+"""
+Benchmark the invoice list endpoint representations.
+Usage: python manage.py bench_invoice_list --invoices 1000 --items 5 --payments 1
+
+Creates a throwaway business with invoices, items and payments, then requests
+GET /api/invoices/ with page sizes 50 and 1000 for:
+  full     - the detail InvoiceSerializer (what the list used to return)
+  compact  - InvoiceListSerializer, the default list representation
+  expand   - compact plus ?expand=items
+  fields   - ?fields=id,invoice_number,status,total
+and reports response time, payload size and query count. The business is
+removed afterwards.
+"""
+import datetime
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from clients.models import Client
+from invoices.models import Invoice, InvoiceItem, Payment
+from invoices.serializers import InvoiceSerializer
+from invoices.views import InvoiceViewSet
+from users.models import Business
+
+PAGE_SIZES = (50, 1000)
+VARIANTS = {
+    'full': {},
+    'compact': {},
+    'expand': {'expand': 'items'},
+    'fields': {'fields': 'id,invoice_number,status,total'},
+}
+
+
+class FullInvoiceViewSet(InvoiceViewSet):
+    """The list as it was before InvoiceListSerializer: every nested relation."""
+    def get_serializer_class(self):
+        return InvoiceSerializer
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('business').prefetch_related('items', 'payments')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark payload size and serialization time of the invoice list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=1000)
+        parser.add_argument('--items', type=int, default=5)
+        parser.add_argument('--payments', type=int, default=1)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user = User.objects.create_user(email=f"bench-{uuid.uuid4().hex[:8]}@invoice.az", password=uuid.uuid4().hex)
+        business = Business.objects.create(user=user, name='Benchmark Business')
+
+        try:
+            self._seed(business, options['invoices'], options['items'], options['payments'])
+            factory = APIRequestFactory()
+
+            self.stdout.write(f"Invoices: {options['invoices']}, items/invoice: {options['items']}, payments/invoice: {options['payments']}")
+            self.stdout.write(f"{'variant':<9}{'page':>6}{'ms':>10}{'KB':>10}{'queries':>9}")
+            for page_size in PAGE_SIZES:
+                for variant, params in VARIANTS.items():
+                    view = (FullInvoiceViewSet if variant == 'full' else InvoiceViewSet).as_view({'get': 'list'})
+                    timings = []
+                    for _ in range(options['repeat']):
+                        request = factory.get('/api/invoices/', {'page_size': page_size, **params},
+                                              HTTP_X_BUSINESS_ID=str(business.id), SERVER_NAME='localhost')
+                        force_authenticate(request, user=user)
+                        connection.queries_log.clear()  # the log is capped; keep counts exact
+                        with CaptureQueriesContext(connection) as ctx:
+                            started = time.perf_counter()
+                            response = view(request)
+                            response.render()
+                            timings.append(time.perf_counter() - started)
+                    self.stdout.write(
+                        f"{variant:<9}{page_size:>6}{min(timings) * 1000:>10.1f}"
+                        f"{len(response.content) / 1024:>10.1f}{len(ctx.captured_queries):>9}"
+                    )
+        finally:
+            Payment.all_objects.filter(invoice__business=business).delete()
+            InvoiceItem.all_objects.filter(invoice__business=business).delete()
+            Invoice.all_objects.filter(business=business).delete()
+            Client.all_objects.filter(business=business).delete()
+            business.delete()
+            user.delete()
+
+        self.stdout.write(self.style.SUCCESS('Success: Invoice list benchmark finished.'))
+
+    def _seed(self, business, invoices, items, payments):
+        client = Client.objects.create(business=business, name='Benchmark Client', email='client@example.com')
+        today = datetime.date.today()
+        created = Invoice.objects.bulk_create([
+            Invoice(
+                business=business, client=client, invoice_number=f'BENCH-{i:05d}', invoice_date=today,
+                due_date=today, status='sent', subtotal=Decimal('100.00') * items, total=Decimal('100.00') * items,
+                notes='Benchmark invoice'
+            )
+            for i in range(invoices)
+        ])
+        InvoiceItem.objects.bulk_create([
+            InvoiceItem(invoice=invoice, description=f'Line {n}', quantity=1, unit_price=Decimal('100.00'),
+                        amount=Decimal('100.00'))
+            for invoice in created for n in range(items)
+        ], batch_size=1000)
+        Payment.objects.bulk_create([
+            Payment(invoice=invoice, amount=Decimal('10.00'), payment_date=today)
+            for invoice in created for _ in range(payments)
+        ], batch_size=1000)
@@ -0,0 +1,96 @@
+"""
+Concurrency benchmark for per-business invoice number allocation.
+Usage: python manage.py bench_invoice_numbers --threads 32 --per-thread 50
+
+Creates a throwaway business, allocates numbers from many threads at once and
+reports throughput, latency percentiles and queries per allocation. The
+business (and its counter) is removed afterwards.
+"""
+import statistics
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+from invoices.models import InvoiceNumberSequence
+from users.models import Business
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent invoice number allocation for a single business'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--per-thread', type=int, default=50)
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        per_thread = options['per_thread']
+
+        User = get_user_model()
+        user = User.objects.create_user(email=f"bench-{uuid.uuid4().hex[:8]}@invoice.az", password=uuid.uuid4().hex)
+        business = Business.objects.create(user=user, name='Benchmark Business')
+
+        try:
+            # Warm up: creates the counter row and measures the steady-state cost.
+            with transaction.atomic():
+                InvoiceNumberSequence.next_number(business.id)
+            with CaptureQueriesContext(connection) as ctx:
+                InvoiceNumberSequence.next_number(business.id)
+            queries_per_allocation = len(ctx.captured_queries)
+
+            numbers = []
+            latencies = []
+            errors = []
+            lock = threading.Lock()
+
+            def worker():
+                local_numbers, local_latencies = [], []
+                try:
+                    for _ in range(per_thread):
+                        started = time.perf_counter()
+                        with transaction.atomic():
+                            local_numbers.append(InvoiceNumberSequence.next_number(business.id))
+                        local_latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    connections.close_all()
+                with lock:
+                    numbers.extend(local_numbers)
+                    latencies.extend(local_latencies)
+
+            pool = [threading.Thread(target=worker) for _ in range(threads)]
+            started = time.perf_counter()
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+            elapsed = time.perf_counter() - started
+
+            if errors:
+                raise CommandError(f"{len(errors)} worker(s) failed: {errors[0]}")
+
+            sequence = InvoiceNumberSequence.objects.get(business=business)
+            values = sorted(InvoiceNumberSequence.parse_number(sequence.prefix, n) for n in numbers)
+            unique = len(set(values)) == len(values)
+            gapless = values == list(range(values[0], values[0] + len(values))) if values else True
+
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(f"Backend:                {connection.vendor}")
+            self.stdout.write(f"Threads x allocations:  {threads} x {per_thread} = {len(numbers)}")
+            self.stdout.write(f"Queries per allocation: {queries_per_allocation}")
+            self.stdout.write(f"Throughput:             {len(numbers) / elapsed:.0f} numbers/s")
+            self.stdout.write(f"Latency p50 / p99:      {statistics.median(latencies) * 1000:.2f} ms / {p99 * 1000:.2f} ms")
+            self.stdout.write(f"Unique / gapless:       {unique} / {gapless}")
+
+            if not (unique and gapless):
+                raise CommandError('Allocated numbers are not unique and contiguous')
+            self.stdout.write(self.style.SUCCESS('Success: allocation is unique and gapless.'))
+        finally:
+            user.delete()
@@ -0,0 +1,90 @@
+"""
+Benchmark applying stock for whole invoices.
+Usage: python manage.py bench_invoice_stock --lines 100 1000 --products 50
+
+For each line count, writes the invoice lines of a throwaway business twice:
+one InvoiceItem.objects.create per line (the per-line signal path, as the
+serializer did before) and InvoiceItem.bulk_add + apply_invoice_stock (what
+InvoiceSerializer.create and duplicate do now). Reports wall time, queries and
+stock movements written for each; both must leave the same stock behind.
+The business is removed afterwards.
+"""
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from clients.models import Client
+from inventory.models import Product, StockMovement
+from inventory.stock import apply_invoice_stock, item_quantities
+from invoices.models import Invoice, InvoiceItem
+from users.models import Business
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-line vs per-invoice stock application'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[100, 1000])
+        parser.add_argument('--products', type=int, default=50)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user = User.objects.create_user(email=f"bench-{uuid.uuid4().hex[:8]}@invoice.az", password=uuid.uuid4().hex)
+        business = Business.objects.create(user=user, name='Benchmark Business')
+        client = Client.objects.create(business=business, name='Benchmark Client')
+        products = Product.objects.bulk_create([
+            Product(business=business, name=f'Benchmark Product {n}', stock_quantity=10 ** 6, cost_price=1)
+            for n in range(options['products'])
+        ])
+
+        try:
+            self.stdout.write(f"{'lines':>6} {'path':<10}{'ms':>10}{'queries':>9}{'movements':>11}")
+            for lines in options['lines']:
+                rows = [
+                    {'product': products[n % len(products)], 'description': f'Line {n}',
+                     'quantity': Decimal('1.00'), 'unit_price': Decimal('10.00'), 'order': n}
+                    for n in range(lines)
+                ]
+                stock = {}
+                for label, write in (('per-line', self._per_line), ('invoice', self._per_invoice)):
+                    invoice = Invoice.objects.create(
+                        business=business, client=client, invoice_date=timezone.now().date(), due_date=timezone.now().date()
+                    )
+                    before = dict(Product.objects.filter(business=business).values_list('id', 'stock_quantity'))
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        with transaction.atomic():
+                            write(invoice, rows)
+                        elapsed = time.perf_counter() - started
+                    after = Product.objects.filter(business=business).values_list('id', 'stock_quantity')
+                    stock[label] = {pk: before[pk] - quantity for pk, quantity in after}
+                    movements = StockMovement.objects.filter(source_type='INVOICE', source_id=invoice.pk).count()
+                    self.stdout.write(f"{lines:>6} {label:<10}{elapsed * 1000:>10.1f}{len(queries):>9}{movements:>11}")
+                if stock['per-line'] != stock['invoice']:
+                    self.stderr.write(f"Stock differs between the two paths for {lines} lines")
+        finally:
+            StockMovement.objects.filter(business=business).delete()
+            InvoiceItem.all_objects.filter(invoice__business=business).delete()
+            Invoice.all_objects.filter(business=business).delete()
+            Product.all_objects.filter(business=business).delete()
+            Client.all_objects.filter(business=business).delete()
+            business.delete()
+            user.delete()
+
+        self.stdout.write(self.style.SUCCESS('Success: Invoice stock benchmark finished.'))
+
+    @staticmethod
+    def _per_line(invoice, rows):
+        for row in rows:
+            InvoiceItem.objects.create(invoice=invoice, **row)
+
+    @staticmethod
+    def _per_invoice(invoice, rows):
+        items = InvoiceItem.bulk_add(invoice, rows)
+        apply_invoice_stock(invoice.pk, {}, item_quantities(items))
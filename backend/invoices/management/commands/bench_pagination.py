@@ -0,0 +1,111 @@
+"""
+Benchmark page-number against keyset (cursor) pagination at increasing depth.
+Usage: python manage.py bench_pagination --rows 20000 --page-size 50
+
+Seeds a throwaway business with `--rows` invoices and stock movements, then
+times GET /api/invoices/ and /api/inventory/stock-movements/ for the first,
+middle and last page:
+  page    - ?page=N (COUNT(*) + OFFSET)
+  cursor  - ?pagination=cursor, following `next` links to the same depth;
+            only the request for the measured page is timed
+The business is removed afterwards.
+"""
+import datetime
+import time
+import uuid
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from clients.models import Client
+from inventory.models import Product, StockMovement
+from inventory.views import StockMovementViewSet
+from invoices.models import Invoice
+from invoices.views import InvoiceViewSet
+from users.models import Business
+
+ENDPOINTS = {
+    'invoices': (InvoiceViewSet, '/api/invoices/', {'fields': 'id,invoice_number,total'}),
+    'stock-movements': (StockMovementViewSet, '/api/inventory/stock-movements/', {}),
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark deep-page latency of page-number and keyset pagination'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows, page_size = options['rows'], options['page_size']
+        User = get_user_model()
+        self.user = User.objects.create_user(email=f"bench-{uuid.uuid4().hex[:8]}@invoice.az", password=uuid.uuid4().hex)
+        self.business = Business.objects.create(user=self.user, name='Benchmark Business')
+        self.factory = APIRequestFactory()
+
+        try:
+            self._seed(rows)
+            last_page = max((rows + page_size - 1) // page_size, 1)
+            depths = sorted({1, (last_page + 1) // 2, last_page})
+
+            self.stdout.write(f"Rows: {rows}, page size: {page_size}")
+            self.stdout.write(f"{'endpoint':<17}{'page':>7}{'page ms':>10}{'cursor ms':>11}")
+            for name, (viewset, path, params) in ENDPOINTS.items():
+                view = viewset.as_view({'get': 'list'}, throttle_classes=[])  # hundreds of requests per run
+                params = {**params, 'page_size': page_size}
+                for depth in depths:
+                    page_ms = self._time(options['repeat'], lambda: self._get(view, path, {**params, 'page': depth}))
+                    cursor_params = self._cursor_at(view, path, {**params, 'pagination': 'cursor'}, depth)
+                    cursor_ms = self._time(options['repeat'], lambda: self._get(view, path, cursor_params))
+                    self.stdout.write(f"{name:<17}{depth:>7}{page_ms:>10.1f}{cursor_ms:>11.1f}")
+        finally:
+            StockMovement.objects.filter(business=self.business).delete()
+            Product.all_objects.filter(business=self.business).delete()
+            Invoice.all_objects.filter(business=self.business).delete()
+            Client.all_objects.filter(business=self.business).delete()
+            self.business.delete()
+            self.user.delete()
+
+        self.stdout.write(self.style.SUCCESS('Success: Pagination benchmark finished.'))
+
+    def _get(self, view, path, params):
+        request = self.factory.get(path, params, HTTP_X_BUSINESS_ID=str(self.business.id), SERVER_NAME='localhost')
+        force_authenticate(request, user=self.user)
+        response = view(request)
+        response.render()
+        return response
+
+    def _time(self, repeat, call):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    def _cursor_at(self, view, path, params, depth):
+        """Query parameters of the keyset page at `depth`, reached by following next links."""
+        for _ in range(depth - 1):
+            next_link = self._get(view, path, params).data['next']
+            params = {key: values[0] for key, values in parse_qs(urlparse(next_link).query).items()}
+        return params
+
+    def _seed(self, rows):
+        client = Client.objects.create(business=self.business, name='Benchmark Client')
+        product = Product.objects.create(business=self.business, name='Benchmark Product', stock_quantity=rows)
+        today = datetime.date.today()
+        Invoice.objects.bulk_create([
+            Invoice(business=self.business, client=client, invoice_number=f'BENCH-{i:06d}', invoice_date=today,
+                    due_date=today, status='sent', total=Decimal('100.00'))
+            for i in range(rows)
+        ], batch_size=2000)
+        StockMovement.objects.bulk_create([
+            StockMovement(business=self.business, product=product, movement_type='OUT', source_type='MANUAL',
+                          quantity=1, stock_before=rows - i, stock_after=rows - i - 1)
+            for i in range(rows)
+        ], batch_size=2000)
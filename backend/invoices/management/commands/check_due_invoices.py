@@ -1,70 +1,139 @@
+"""
+Sweep invoices for upcoming due dates and overdue payments.
+Usage: python manage.py check_due_invoices [--chunk 2000]
+
+Set-based and idempotent, so it is safe to run every few minutes:
+  * sent/viewed invoices due within REMINDER_DAYS get one reminder
+    (tracked by Invoice.reminder_sent_at);
+  * sent/viewed invoices whose due date has arrived are flipped to 'overdue'
+    with one UPDATE per chunk, including any that earlier runs missed.
+Only rows this run actually changed are notified. Each chunk runs in its own
+transaction with the selected rows locked (SKIP LOCKED where supported), so
+concurrent runs do not notify twice.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
 from django.utils import timezone
-from datetime import timedelta
+
 from invoices.models import Invoice
-from notifications.utils import create_notification
+from invoices.rollups import refresh_invoice_months
+from notifications.utils import create_notifications_bulk
+
+REMINDER_DAYS = 3
+OPEN_STATUSES = ['sent', 'viewed']
+
+Alert = namedtuple('Alert', 'user_id business_id title message type')
+
 
 class Command(BaseCommand):
-    help = 'Check for invoices due in 3 days and create notifications'
+    help = 'Send due-date reminders and mark past-due invoices as overdue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=2000, help='Invoices updated per transaction')
 
     def handle(self, *args, **options):
         today = timezone.now().date()
-        reminder_date = today + timedelta(days=3)
-        
-        # 1. Reminders for invoices due in 3 days
-        upcoming_invoices = Invoice.objects.filter(
-            due_date=reminder_date,
-            status__in=['sent', 'viewed']
-        ).select_related('business__user', 'client')
-
-        count_upcoming = 0
-        for invoice in upcoming_invoices:
-            create_notification(
-                user=invoice.business.user,
-                title="Ödəniş xatırlatması",
-                message=f"{invoice.client.name} tərəfindən ödənilməli olan #{invoice.invoice_number} nömrəli fakturanın vaxtına 3 gün qalıb.",
-                type='warning',
-                link=f"/invoices"
-            )
-            if invoice.client and invoice.client.assigned_to:
-                create_notification(
-                    user=invoice.client.assigned_to,
-                    title="Ödəniş xatırlatması",
-                    message=f"Müştəriniz {invoice.client.name} üçün #{invoice.invoice_number} nömrəli fakturanın ödənişinə 3 gün qalıb.",
-                    type='warning',
-                    link=f"/invoices"
-                )
-            count_upcoming += 1
-
-        # 2. Alerts for invoices that became overdue today
-        overdue_invoices = Invoice.objects.filter(
-            due_date=today,
-            status__in=['sent', 'viewed']
-        ).select_related('business__user', 'client')
-
-        count_overdue = 0
-        for invoice in overdue_invoices:
-            # Update status to overdue
-            invoice.status = 'overdue'
-            invoice.save(update_fields=['status'])
-            
-            create_notification(
-                user=invoice.business.user,
-                title="Vaxtı keçmiş ödəniş",
-                message=f"#{invoice.invoice_number} nömrəli fakturanın ödəniş vaxtı bu gün bitdi. Status 'Vaxtı keçib' olaraq yeniləndi.",
-                type='error',
-                link=f"/invoices"
-            )
-            if invoice.client and invoice.client.assigned_to:
-                create_notification(
-                    user=invoice.client.assigned_to,
-                    title="Vaxtı keçmiş ödəniş",
-                    message=f"Müştəriniz {invoice.client.name} üçün #{invoice.invoice_number} nömrəli fakturanın vaxtı bitdi. Status 'Vaxtı keçib' olaraq yeniləndi.",
-                    type='error',
-                    link=f"/invoices"
-                )
-            count_overdue += 1
+        chunk = options['chunk']
+
+        # 1. Reminders for invoices due in the next few days
+        upcoming = Invoice.objects.filter(
+            status__in=OPEN_STATUSES,
+            due_date__gt=today,
+            due_date__lte=today + timedelta(days=REMINDER_DAYS),
+            reminder_sent_at__isnull=True,
+        )
+        count_upcoming = self._sweep(upcoming, {'reminder_sent_at': timezone.now()}, chunk, self._reminder_alerts, today)
+
+        # 2. Invoices whose due date has arrived (today or missed by earlier runs)
+        overdue = Invoice.objects.filter(status__in=OPEN_STATUSES, due_date__lte=today)
+        count_overdue = self._sweep(
+            overdue, {'status': 'overdue', 'updated_at': timezone.now()}, chunk, self._overdue_alerts, today,
+            setting_key='overdue_invoice'
+        )
 
         self.stdout.write(self.style.SUCCESS(
             f'Success: Created {count_upcoming} reminders and handled {count_overdue} overdue invoices.'
         ))
+
+    def _sweep(self, queryset, changes, chunk, build_alerts, today, setting_key=None):
+        """Apply `changes` to every row of `queryset` chunk by chunk and notify about those rows."""
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True, of=('self',))
+
+        handled = 0
+        while True:
+            with transaction.atomic():
+                rows = list(queryset.order_by('due_date', 'id').values(
+                    'id', 'invoice_number', 'invoice_date', 'due_date', 'business_id', 'business__user_id',
+                    'client__name', 'client__assigned_to_id'
+                )[:chunk])
+                if not rows:
+                    break
+                Invoice.objects.filter(pk__in=[row['id'] for row in rows]).update(**changes)
+                if 'status' in changes:
+                    self._refresh_rollups(rows)
+
+                alerts = []
+                for row in rows:
+                    alerts.extend(build_alerts(row, today))
+                self._notify(alerts, setting_key)
+            handled += len(rows)
+            if len(rows) < chunk:
+                break
+        return handled
+
+    def _refresh_rollups(self, rows):
+        # queryset.update() skips the post_save hooks that keep MonthlyRollup current
+        months = defaultdict(lambda: (set(), set()))
+        for row in rows:
+            invoice_months, due_months = months[row['business_id']]
+            invoice_months.add(row['invoice_date'])
+            due_months.add(row['due_date'])
+        for business_id, (invoice_months, due_months) in months.items():
+            refresh_invoice_months(business_id, invoice_months, due_months)
+
+    def _reminder_alerts(self, row, today):
+        days_left = (row['due_date'] - today).days
+        yield Alert(
+            row['business__user_id'], row['business_id'], "Ödəniş xatırlatması",
+            f"{row['client__name']} tərəfindən ödənilməli olan #{row['invoice_number']} nömrəli fakturanın vaxtına {days_left} gün qalıb.",
+            'warning'
+        )
+        if row['client__assigned_to_id']:
+            yield Alert(
+                row['client__assigned_to_id'], row['business_id'], "Ödəniş xatırlatması",
+                f"Müştəriniz {row['client__name']} üçün #{row['invoice_number']} nömrəli fakturanın ödənişinə {days_left} gün qalıb.",
+                'warning'
+            )
+
+    def _overdue_alerts(self, row, today):
+        due = row['due_date'].strftime('%d.%m.%Y')
+        yield Alert(
+            row['business__user_id'], row['business_id'], "Vaxtı keçmiş ödəniş",
+            f"#{row['invoice_number']} nömrəli fakturanın ödəniş vaxtı ({due}) bitdi. Status 'Vaxtı keçib' olaraq yeniləndi.",
+            'error'
+        )
+        if row['client__assigned_to_id']:
+            yield Alert(
+                row['client__assigned_to_id'], row['business_id'], "Vaxtı keçmiş ödəniş",
+                f"Müştəriniz {row['client__name']} üçün #{row['invoice_number']} nömrəli fakturanın vaxtı ({due}) bitdi. Status 'Vaxtı keçib' olaraq yeniləndi.",
+                'error'
+            )
+
+    def _notify(self, alerts, setting_key=None):
+        """Insert in-app notifications (and queue emails) honouring each user's NotificationSetting."""
+        create_notifications_bulk(
+            [
+                (alert.user_id, {
+                    'business': alert.business_id,
+                    'title': alert.title,
+                    'message': alert.message,
+                    'type': alert.type,
+                })
+                for alert in alerts
+            ],
+            {'link': '/invoices', 'setting_key': setting_key, 'category': 'finance'}
+        )
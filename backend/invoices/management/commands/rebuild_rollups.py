@@ -0,0 +1,22 @@
+"""
+Recompute the MonthlyRollup table from invoices and expenses.
+Usage: python manage.py rebuild_rollups                 # every business
+       python manage.py rebuild_rollups --business 12   # one business
+
+Needed once after deploying the rollups, and after bulk changes made outside
+the ORM (raw SQL, data migrations).
+"""
+from django.core.management.base import BaseCommand
+
+from invoices.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly invoice/expense rollups used by analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', type=int, action='append', help='Only rebuild this business (repeatable)')
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(options['business'])
+        self.stdout.write(self.style.SUCCESS(f'Success: Wrote {written} rollup rows.'))
@@ -0,0 +1,47 @@
+"""
+Drain the PDF render queue (PdfRenderJob) off the request path.
+Usage: python manage.py run_pdf_worker            # run forever
+       python manage.py run_pdf_worker --once     # process what is queued and exit
+
+Run several instances for parallel rendering; jobs are claimed with a
+conditional UPDATE so each one is processed by a single worker.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from invoices.pdf import claim_pdf_jobs, requeue_stale_pdf_jobs, run_pdf_job
+
+
+class Command(BaseCommand):
+    help = 'Render queued invoice PDFs (and send queued invoice emails)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed per poll')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=600, help='Requeue jobs running longer than this (seconds)')
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        while True:
+            close_old_connections()
+            requeue_stale_pdf_jobs(options['stale_after'])
+            job_ids = claim_pdf_jobs(options['batch'])
+
+            for job_id in job_ids:
+                job = run_pdf_job(job_id)
+                if job.status == 'done':
+                    processed += 1
+                elif job.status == 'failed':
+                    failed += 1
+
+            if not job_ids:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Success: Processed {processed} PDF jobs ({failed} failed).'
+        ))
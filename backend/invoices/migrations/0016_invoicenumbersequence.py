@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Create a counter for every business that has invoices, starting after its highest number."""
+    Invoice = apps.get_model('invoices', 'Invoice')
+    InvoiceNumberSequence = apps.get_model('invoices', 'InvoiceNumberSequence')
+
+    prefix = getattr(settings, 'INVOICE_NUMBER_PREFIX', 'INV')
+    padding = getattr(settings, 'INVOICE_NUMBER_PADDING', 4)
+    start = getattr(settings, 'INVOICE_NUMBER_START', 1000)
+
+    last_values = {}
+    rows = Invoice.objects.values_list('business_id', 'invoice_number').iterator(chunk_size=2000)
+    for business_id, invoice_number in rows:
+        value = last_values.get(business_id, start)
+        head, sep, tail = (invoice_number or '').rpartition('-')
+        if sep and head == prefix and tail.isdigit():
+            value = max(value, int(tail))
+        last_values[business_id] = value
+
+    InvoiceNumberSequence.objects.bulk_create([
+        InvoiceNumberSequence(business_id=business_id, prefix=prefix, padding=padding, last_value=value)
+        for business_id, value in last_values.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0015_alter_expense_options_alter_invoice_options_and_more'),
+        ('users', '0020_add_full_plan_features'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(default='INV', max_length=20)),
+                ('padding', models.PositiveSmallIntegerField(default=4)),
+                ('last_value', models.PositiveIntegerField(default=1000)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('business', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_sequence', to='users.business')),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.11 on 2026-10-17 14:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_rollups(apps, schema_editor):
+    """Populate the rollups from existing (not soft-deleted) invoices and expenses."""
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Expense = apps.get_model('invoices', 'Expense')
+    MonthlyRollup = apps.get_model('invoices', 'MonthlyRollup')
+
+    sources = [
+        ('invoice', Invoice, 'invoice_date', ['currency', 'status', 'tax_rate'],
+         {'subtotal': 'subtotal', 'tax_amount': 'tax_amount', 'total': 'total', 'paid_amount': 'paid_amount'}),
+        ('invoice_due', Invoice, 'due_date', ['currency', 'status', 'tax_rate'],
+         {'subtotal': 'subtotal', 'tax_amount': 'tax_amount', 'total': 'total', 'paid_amount': 'paid_amount'}),
+        ('expense', Expense, 'date', ['currency', 'status', 'is_tax_deductible'], {'total': 'amount'}),
+    ]
+    for kind, model, date_field, dimensions, measures in sources:
+        rows = (
+            model.objects.filter(is_deleted=False)
+            .annotate(rollup_month=TruncMonth(date_field))
+            .values('business_id', 'rollup_month', *dimensions)
+            .annotate(rollup_count=Count('id'), **{f'rollup_{name}': Sum(field) for name, field in measures.items()})
+            .order_by()
+        )
+        MonthlyRollup.objects.bulk_create([
+            MonthlyRollup(
+                business_id=row['business_id'], kind=kind, month=row['rollup_month'], count=row['rollup_count'],
+                **{name: row[name] for name in dimensions},
+                **{name: row[f'rollup_{name}'] or 0 for name in measures},
+            )
+            for row in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0018_invoice_reminder_sent_at'),
+        ('users', '0020_add_full_plan_features'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('invoice', 'Faktura (faktura tarixi üzrə)'), ('invoice_due', 'Faktura (ödəniş tarixi üzrə)'), ('expense', 'Xərc')], max_length=20)),
+                ('month', models.DateField(help_text='Ayın ilk günü')),
+                ('currency', models.CharField(max_length=3)),
+                ('status', models.CharField(max_length=20)),
+                ('tax_rate', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('is_tax_deductible', models.BooleanField(default=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tax_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='users.business')),
+            ],
+            options={
+                'ordering': ['business', 'kind', 'month'],
+                'constraints': [models.UniqueConstraint(fields=('business', 'kind', 'month', 'currency', 'status', 'tax_rate', 'is_tax_deductible'), name='unique_monthly_rollup')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-17 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0019_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['client', 'invoice_date'], name='invoice_client_date_idx'),
+        ),
+    ]
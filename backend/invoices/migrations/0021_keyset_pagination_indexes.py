@@ -0,0 +1,21 @@
+# Generated by Django 5.2.11 on 2026-10-17 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0020_invoice_client_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['business', 'date', 'id'], name='expense_business_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['business', 'created_at', 'id'], name='invoice_business_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.11 on 2026-10-17 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0021_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['business', 'status', 'due_date'], name='invoice_biz_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['business', 'invoice_date'], name='invoice_biz_date_idx'),
+        ),
+    ]
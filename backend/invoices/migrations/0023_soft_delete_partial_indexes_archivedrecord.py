@@ -0,0 +1,54 @@
+# Generated by Django 5.2.11 on 2026-10-17 16:20
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0022_business_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='Model label, məs: invoices.Invoice', max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('business_id', models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+            options={
+                'ordering': ['archived_at'],
+                'constraints': [models.UniqueConstraint(fields=('model', 'object_id'), name='unique_archived_record')],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='invoice_biz_status_due_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='invoice_biz_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['business', 'status', 'due_date'], name='invoice_live_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['business', 'invoice_date'], name='invoice_live_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceitem',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['invoice'], name='invoiceitem_live_invoice_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['invoice'], name='payment_live_invoice_idx'),
+        ),
+    ]
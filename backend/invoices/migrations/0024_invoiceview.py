@@ -0,0 +1,26 @@
+# Generated by Django 5.2.11 on 2026-10-17 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0023_soft_delete_partial_indexes_archivedrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceView',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('viewed_at', models.DateTimeField(auto_now_add=True)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='views', to='invoices.invoice')),
+            ],
+            options={
+                'ordering': ['viewed_at'],
+                'indexes': [models.Index(fields=['invoice', 'viewed_at'], name='invoiceview_invoice_idx')],
+            },
+        ),
+    ]
@@ -2,15 +2,89 @@ from django.db import models
 from users.models import Business
 from clients.models import Client
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import Sum, F
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from notifications.utils import create_notification
+from notifications.utils import create_notification, create_notifications_bulk
 import uuid
-from utils.models import SoftDeleteModel
+from utils.models import LIVE, SoftDeleteModel, bulk_soft_deleted
+from utils.periods import business_timezone, date_range, in_range
 from decimal import Decimal
 
+class InvoiceNumberSequence(models.Model):
+    """
+    Per-business invoice number counter.
+    A number is allocated with an atomic UPDATE on this row (which holds its
+    lock until the transaction ends) instead of scanning the business's invoices.
+    """
+    business = models.OneToOneField(Business, on_delete=models.CASCADE, related_name='invoice_sequence')
+    prefix = models.CharField(max_length=20, default='INV')
+    padding = models.PositiveSmallIntegerField(default=4)
+    last_value = models.PositiveIntegerField(default=1000)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.business} - {self.format_number(self.last_value)}"
+
+    def format_number(self, value):
+        return self.build_number(self.prefix, self.padding, value)
+
+    @staticmethod
+    def build_number(prefix, padding, value):
+        return f"{prefix}-{value:0{padding}d}"
+
+    @staticmethod
+    def parse_number(prefix, invoice_number):
+        """Return the numeric part of `PREFIX-0001` style numbers, or None for other formats."""
+        if not invoice_number:
+            return None
+        head, sep, tail = invoice_number.rpartition('-')
+        if sep and head == prefix and tail.isdigit():
+            return int(tail)
+        return None
+
+    @classmethod
+    def seed_value(cls, business_id, prefix):
+        """Highest number already used by the business (soft-deleted rows included)."""
+        start = getattr(settings, 'INVOICE_NUMBER_START', 1000)
+        numbers = Invoice.all_objects.filter(
+            business_id=business_id,
+            invoice_number__startswith=f"{prefix}-"
+        ).values_list('invoice_number', flat=True)
+        parsed = [cls.parse_number(prefix, number) for number in numbers]
+        return max([start] + [n for n in parsed if n is not None])
+
+    @classmethod
+    def next_number(cls, business_id):
+        """
+        Allocate the next invoice number for a business.
+        Must run inside a transaction so the allocation commits (or rolls back)
+        together with the invoice that uses it.
+        """
+        updated = cls.objects.filter(business_id=business_id).update(
+            last_value=F('last_value') + 1, updated_at=timezone.now()
+        )
+        if updated:
+            # The UPDATE keeps the row locked, so this reads our own increment
+            row = cls.objects.filter(business_id=business_id).values_list('prefix', 'padding', 'last_value').get()
+            return cls.build_number(*row)
+
+        # First invoice since the counter was introduced: create the row seeded
+        # from existing numbers, then allocate from it.
+        prefix = getattr(settings, 'INVOICE_NUMBER_PREFIX', 'INV')
+        cls.objects.get_or_create(
+            business_id=business_id,
+            defaults={
+                'prefix': prefix,
+                'padding': getattr(settings, 'INVOICE_NUMBER_PADDING', 4),
+                'last_value': cls.seed_value(business_id, prefix),
+            }
+        )
+        return cls.next_number(business_id)
+
+
 class Invoice(SoftDeleteModel):
     STATUS_CHOICES = (
         ('draft', 'Draft'),
@@ -72,73 +146,107 @@ class Invoice(SoftDeleteModel):
     viewed_at = models.DateTimeField(blank=True, null=True)
     sent_at = models.DateTimeField(blank=True, null=True)
     paid_at = models.DateTimeField(blank=True, null=True)
+    # Set by check_due_invoices once the "due in N days" reminder went out
+    reminder_sent_at = models.DateTimeField(blank=True, null=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    soft_delete_cascade = (('invoices.InvoiceItem', 'invoice'), ('invoices.Payment', 'invoice'))
+
     class Meta:
         unique_together = ('business', 'invoice_number')
         ordering = ['-created_at']
+        indexes = [
+            # Due-date sweeps (check_due_invoices) filter on status + due_date
+            models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+            # Latest invoice per client (churn risk in forecast analytics)
+            models.Index(fields=['client', 'invoice_date'], name='invoice_client_date_idx'),
+            # Keyset pagination of the invoice list (utils.pagination)
+            models.Index(fields=['business', 'created_at', 'id'], name='invoice_business_keyset_idx'),
+            # Dashboard/overdue totals: status within a business, ranged on due_date.
+            # Partial (live rows only): they are read through the default manager only
+            models.Index(fields=['business', 'status', 'due_date'], condition=LIVE, name='invoice_live_status_due_idx'),
+            # Revenue and tax analytics ranged on invoice_date within a business
+            models.Index(fields=['business', 'invoice_date'], condition=LIVE, name='invoice_live_date_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.invoice_number:
-            from django.db import transaction, IntegrityError
-            
-            max_retries = 10
-            for attempt in range(max_retries):
-                try:
-                    with transaction.atomic():
-                        # IMPORTANT: Use all_objects to include soft-deleted invoices
-                        # The DB unique constraint covers ALL rows, not just active ones
-                        last_invoice = Invoice.all_objects.filter(business=self.business)\
-                            .select_for_update()\
-                            .order_by('id').last()
-                        
-                        next_num = 1001  # Default starting number
-                        
-                        if last_invoice and last_invoice.invoice_number:
-                            try:
-                                current_num_str = last_invoice.invoice_number.split('-')[-1]
-                                next_num = int(current_num_str) + 1
-                            except (IndexError, ValueError):
-                                count = Invoice.all_objects.filter(business=self.business).count()
-                                next_num = count + 1001
-                        
-                        # Check ALL records (including soft-deleted) for existing number
-                        while Invoice.all_objects.filter(
-                            business=self.business,
-                            invoice_number=f"INV-{next_num:04d}"
-                        ).exists():
-                            next_num += 1
-                        
-                        self.invoice_number = f"INV-{next_num:04d}"
-                        super().save(*args, **kwargs)
-                        return  # Success
-                except IntegrityError:
-                    self.invoice_number = None
-                    if attempt == max_retries - 1:
-                        raise
+            from django.db import transaction
+
+            # The counter row stays locked until this transaction commits, so a
+            # failed INSERT rolls the allocation back and the sequence stays gapless.
+            with transaction.atomic():
+                self.invoice_number = InvoiceNumberSequence.next_number(self.business_id)
+                super().save(*args, **kwargs)
         else:
             super().save(*args, **kwargs)
 
+    # Columns written back by the totals engine (only the ones that changed)
+    TOTALS_FIELDS = ('subtotal', 'tax_amount', 'total', 'paid_amount', 'status', 'paid_at')
+
+    def _aggregate_totals(self):
+        """
+        Subtotal, tax and paid amount computed by the database in a single query.
+        Item-level tax is used when set, otherwise the invoice-level rate.
+        """
+        from django.db.models import OuterRef, Subquery, Case, When, Value, DecimalField
+        from django.db.models.functions import Coalesce
+
+        money = DecimalField(max_digits=20, decimal_places=4)
+        effective_rate = Case(
+            When(tax_rate__gt=0, then=F('tax_rate')),
+            default=Value(self.tax_rate),
+            output_field=money
+        )
+        items = InvoiceItem.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice')
+        payments = Payment.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice')
+
+        row = Invoice.all_objects.filter(pk=self.pk).values(
+            items_subtotal=Coalesce(Subquery(items.annotate(s=Sum('amount')).values('s')), Value(0), output_field=money),
+            items_tax=Coalesce(Subquery(items.annotate(s=Sum(F('amount') * effective_rate, output_field=money)).values('s')), Value(0), output_field=money),
+            payments_total=Coalesce(Subquery(payments.annotate(s=Sum('amount')).values('s')), Value(0), output_field=money),
+        ).get()
+
+        cents = Decimal('0.01')
+        return (
+            Decimal(row['items_subtotal']).quantize(cents),
+            (Decimal(row['items_tax']) / Decimal('100')).quantize(cents),
+            Decimal(row['payments_total']).quantize(cents),
+        )
+
+    def _paid_total(self):
+        total = self.payments.aggregate(total=Sum('amount'))['total']
+        return Decimal(total or 0).quantize(Decimal('0.01'))
+
+    def _save_changed(self, original):
+        """Write back only the totals columns that differ from `original`. Returns the changed names."""
+        changed = [field for field, value in original.items() if getattr(self, field) != value]
+        if changed and self.pk:
+            self.save(update_fields=changed + ['updated_at'])
+        return changed
+
     def calculate_totals(self):
-        items = self.items.all()
-        self.subtotal = sum(item.amount for item in items)
-        
-        # Calculate tax: Use item-level tax if set, otherwise fallback to invoice-level tax
-        total_tax = 0
-        for item in items:
-            effective_tax_rate = item.tax_rate if item.tax_rate > 0 else self.tax_rate
-            total_tax += item.amount * (effective_tax_rate / Decimal('100'))
-            
-        self.tax_amount = total_tax
-        self.total = self.subtotal + self.tax_amount - self.discount
-        self.update_payment_status(save=False)
-        self.save()
+        original = {field: getattr(self, field) for field in self.TOTALS_FIELDS}
+
+        subtotal, tax_amount, paid_amount = self._aggregate_totals()
+        self.subtotal = subtotal
+        self.tax_amount = tax_amount
+        self.total = self.subtotal + self.tax_amount - Decimal(self.discount or 0)
+        self._apply_payment_status(paid_amount)
+
+        return self._save_changed(original)
 
     def update_payment_status(self, save=True):
-        payments = self.payments.all()
-        self.paid_amount = sum(p.amount for p in payments)
+        original = {field: getattr(self, field) for field in self.TOTALS_FIELDS}
+        self._apply_payment_status(self._paid_total())
+        if save:
+            return self._save_changed(original)
+        return []
+
+    def _apply_payment_status(self, paid_amount):
+        self.paid_amount = paid_amount
         
         if self.paid_amount >= self.total and self.total > 0:
             previous_status = self.status
@@ -153,45 +261,34 @@ class Invoice(SoftDeleteModel):
                 }
                 currency_symbol = currency_symbols.get(self.currency, '₼')
 
-                # Tam ödəniş bildirişi
-                # Notify business owner
-                create_notification(
-                    user=self.business.user,
-                    business=self.business,
-                    title="Faktura Tam Ödənildi",
-                    message=f"#{self.invoice_number} nömrəli faktura üzrə {self.paid_amount:.2f} {currency_symbol} ödəniş tamamlandı.",
-                    type='success',
-                    link='/invoices',
-                    setting_key='payment_received',
-                    category='finance'
+                # Tam ödəniş bildirişi: business owner and assigned user (Sales Rep) if applicable
+                create_notifications_bulk(
+                    [
+                        (self.business.user_id, {
+                            'message': f"#{self.invoice_number} nömrəli faktura üzrə {self.paid_amount:.2f} {currency_symbol} ödəniş tamamlandı.",
+                        }),
+                        (self.client.assigned_to_id if self.client else None, {
+                            'message': f"Müştəriniz {self.client.name} üçün #{self.invoice_number} nömrəli faktura üzrə {self.paid_amount:.2f} {currency_symbol} ödəniş tamamlandı.",
+                        }),
+                    ],
+                    {
+                        'business': self.business,
+                        'title': "Faktura Tam Ödənildi",
+                        'type': 'success',
+                        'link': '/invoices',
+                        'setting_key': 'payment_received',
+                        'category': 'finance',
+                    }
                 )
-                # Notify assigned user (Sales Rep) if applicable
-                if self.client and self.client.assigned_to:
-                    create_notification(
-                        user=self.client.assigned_to,
-                        business=self.business,
-                        title="Faktura Tam Ödənildi",
-                        message=f"Müştəriniz {self.client.name} üçün #{self.invoice_number} nömrəli faktura üzrə {self.paid_amount:.2f} {currency_symbol} ödəniş tamamlandı.",
-                        type='success',
-                        link='/invoices',
-                        setting_key='payment_received',
-                        category='finance'
-                    )
         elif self.status == 'paid' and self.paid_amount < self.total:
             self.status = 'sent' # Revert to sent if payment removed
             self.paid_at = None
-            
-        if save:
-            self.save()
 
 
 
     def __str__(self):
         return f"{self.invoice_number} - {self.client.name}"
 
-    def _get_related_soft_delete_objects(self):
-        return list(self.items.all()) + list(self.payments.all())
-
 class InvoiceItem(SoftDeleteModel):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey('inventory.Product', on_delete=models.SET_NULL, blank=True, null=True, related_name='invoice_items')
@@ -203,10 +300,28 @@ class InvoiceItem(SoftDeleteModel):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     order = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # Lines of an invoice (detail, totals, PDF), live rows only
+            models.Index(fields=['invoice'], condition=LIVE, name='invoiceitem_live_invoice_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         self.amount = self.quantity * self.unit_price
         super().save(*args, **kwargs)
 
+    @classmethod
+    def bulk_add(cls, invoice, rows):
+        """
+        INSERT `rows` (field dicts) as lines of `invoice` in one query. bulk_create
+        skips save() and the stock signals, so `amount` is computed here and the
+        caller applies stock for the whole invoice with inventory.stock.
+        """
+        items = [cls(invoice=invoice, **row) for row in rows]
+        for item in items:
+            item.amount = item.quantity * item.unit_price
+        return cls.objects.bulk_create(items)
+
 class Payment(SoftDeleteModel):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -218,6 +333,12 @@ class Payment(SoftDeleteModel):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Payments of an invoice (paid total, payment status), live rows only
+            models.Index(fields=['invoice'], condition=LIVE, name='payment_live_invoice_idx'),
+        ]
+
 class Expense(SoftDeleteModel):
     CATEGORY_CHOICES = (
         ('office', 'Ofis ləvazimatları'),
@@ -264,15 +385,66 @@ class Expense(SoftDeleteModel):
 
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            # Keyset pagination of the expense list (utils.pagination)
+            models.Index(fields=['business', 'date', 'id'], name='expense_business_keyset_idx'),
+        ]
 
     def __str__(self):
         return f"{self.description} - {self.amount}"
 
+class PdfRenderJob(models.Model):
+    """
+    Queued PDF render for an invoice, drained by `manage.py run_pdf_worker`.
+    The rendered bytes live in the PDF cache under `fingerprint`.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Növbədə'),
+        ('running', 'İcra olunur'),
+        ('done', 'Hazırdır'),
+        ('failed', 'Xəta'),
+    )
+    ACTION_CHOICES = (
+        ('render', 'PDF yarat'),
+        ('email', 'PDF yarat və email göndər'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='pdf_jobs')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default='render')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    fingerprint = models.CharField(max_length=64, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pdf_jobs'
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.invoice_id} - {self.action} ({self.status})"
+
 @receiver(post_save, sender=Payment)
 @receiver(post_delete, sender=Payment)
 def update_invoice_on_payment(sender, instance, **kwargs):
     instance.invoice.update_payment_status()
 
+@receiver(bulk_soft_deleted, sender=Payment)
+def update_invoices_on_bulk_payment_delete(sender, queryset, **kwargs):
+    # Invoices deleted along with their payments are skipped by the default manager
+    for invoice in Invoice.objects.filter(pk__in=queryset.values('invoice_id')):
+        invoice.update_payment_status()
+
 @receiver(post_save, sender=Expense)
 def expense_created_notification(sender, instance, created, **kwargs):
         currency_symbol = '₼'
@@ -295,13 +467,12 @@ def expense_created_notification(sender, instance, created, **kwargs):
 def check_budget_limit(sender, instance, created, **kwargs):
     if created:
         business = instance.business
-        now = timezone.now()
-        
-        # Calculate total expenses for the current month
+
+        # Calculate total expenses for the current month (in the business timezone)
+        month = date_range('month', tz=business_timezone(business))
         total_monthly_expenses = Expense.objects.filter(
             business=business,
-            date__year=now.year,
-            date__month=now.month
+            **in_range('date', month)
         ).aggregate(total=Sum('amount'))['total'] or 0
         
         if total_monthly_expenses > business.budget_limit:
@@ -313,8 +484,86 @@ def check_budget_limit(sender, instance, created, **kwargs):
                 user=business.user,
                 business=business,
                 title="Büdcə Limiti Keçildi!",
-                message=f"{now.strftime('%B')} ayı üçün təyin etdiyiniz {business.budget_limit} {currency_symbol} limit keçildi. Cari xərc: {total_monthly_expenses} {currency_symbol}",
+                message=f"{month[0].strftime('%B')} ayı üçün təyin etdiyiniz {business.budget_limit} {currency_symbol} limit keçildi. Cari xərc: {total_monthly_expenses} {currency_symbol}",
                 type='warning',
                 link='/expenses',
                 category='finance'
             )
+
+
+class MonthlyRollup(models.Model):
+    """
+    Invoice and expense totals per business, month, currency and status,
+    maintained by invoices.rollups and read by the forecast/tax analytics.
+    """
+    KIND_CHOICES = (
+        ('invoice', 'Faktura (faktura tarixi üzrə)'),
+        ('invoice_due', 'Faktura (ödəniş tarixi üzrə)'),
+        ('expense', 'Xərc'),
+    )
+
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='monthly_rollups')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    month = models.DateField(help_text="Ayın ilk günü")
+    currency = models.CharField(max_length=3)
+    status = models.CharField(max_length=20)
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    is_tax_deductible = models.BooleanField(default=False)
+
+    count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['business', 'kind', 'month']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['business', 'kind', 'month', 'currency', 'status', 'tax_rate', 'is_tax_deductible'],
+                name='unique_monthly_rollup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.business_id} {self.kind} {self.month:%Y-%m} {self.currency} {self.status}: {self.total}"
+
+
+class InvoiceView(models.Model):
+    """
+    One hit on the public (share link) page of an invoice. Append-only: recorded
+    by invoices.public without touching the invoice row.
+    """
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='views')
+    viewed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['viewed_at']
+        indexes = [
+            models.Index(fields=['invoice', 'viewed_at'], name='invoiceview_invoice_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.invoice_id} @ {self.viewed_at}"
+
+
+class ArchivedRecord(models.Model):
+    """
+    A soft-deleted row moved out of its table by `manage.py archive_soft_deleted`,
+    kept as a JSON snapshot of its field values.
+    """
+    model = models.CharField(max_length=50, help_text="Model label, məs: invoices.Invoice")
+    object_id = models.BigIntegerField()
+    business_id = models.BigIntegerField(blank=True, null=True, db_index=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        ordering = ['archived_at']
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id'], name='unique_archived_record'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
@@ -0,0 +1,422 @@
+"""
+Invoice PDF rendering and the persistent rendered-PDF cache.
+
+Rendered documents are stored on disk under a fingerprint of everything the
+template prints (invoice, items, client, business branding, theme and the
+white-label flag). Any change produces a new fingerprint, so stale files are
+never served; the fingerprint doubles as the HTTP ETag.
+
+Renders can also be queued as PdfRenderJob rows and processed off the request
+path by `manage.py run_pdf_worker`.
+"""
+import glob
+import hashlib
+import io
+import os
+import tempfile
+from datetime import timedelta
+
+import qrcode
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from users.plan_limits import check_feature
+
+try:
+    from xhtml2pdf import pisa
+except ImportError:
+    pisa = None
+
+PDF_TEMPLATE = 'invoices/invoice_pdf.html'
+PDF_CACHE_HITS_KEY = 'invoice_pdf_cache:hits'
+PDF_CACHE_MISSES_KEY = 'invoice_pdf_cache:misses'
+
+CURRENCY_SYMBOLS = {
+    'AZN': '₼',
+    'USD': '$',
+    'EUR': '€',
+    'TRY': '₺',
+    'RUB': '₽',
+    'GBP': '£'
+}
+
+_fonts_registered = False
+_template_digest = None
+
+
+def _fonts_dir():
+    return os.path.join(str(settings.BASE_DIR / "static"), "fonts")
+
+
+def register_fonts():
+    """Register the Arial TTFs with reportlab once per process."""
+    global _fonts_registered
+    if _fonts_registered:
+        return
+
+    arial_font_path = os.path.join(_fonts_dir(), "arial.ttf").replace('\\', '/')
+    arial_bold_font_path = os.path.join(_fonts_dir(), "arialbd.ttf").replace('\\', '/')
+    try:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.lib.fonts import addMapping
+
+        pdfmetrics.registerFont(TTFont('Arial', arial_font_path))
+        pdfmetrics.registerFont(TTFont('Arial-Bold', arial_bold_font_path))
+        addMapping('Arial', 0, 0, 'Arial')
+        addMapping('Arial', 1, 0, 'Arial-Bold')
+        _fonts_registered = True
+    except Exception as e:
+        print(f"Font registration error: {e}")
+
+
+def _get_template_digest():
+    """Hash of the template source so template edits invalidate cached PDFs."""
+    global _template_digest
+    if _template_digest is None:
+        from django.template.loader import get_template
+        template = get_template(PDF_TEMPLATE)
+        source = getattr(getattr(template, 'template', None), 'source', '')
+        _template_digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+    return _template_digest
+
+
+def has_white_label(invoice):
+    return check_feature(invoice.business.user, 'has_white_label', business=invoice.business)
+
+
+def get_invoice_fingerprint(invoice, white_label=None):
+    """
+    Content hash of everything that ends up in the rendered PDF.
+    Tracking-only changes (viewed_at, sent/viewed status) do not change it.
+    """
+    if white_label is None:
+        white_label = has_white_label(invoice)
+
+    business = invoice.business
+    client = invoice.client
+    parts = [
+        _get_template_digest(),
+        invoice.pk, invoice.invoice_number, invoice.invoice_date, invoice.due_date,
+        invoice.status == 'paid', invoice.currency, invoice.invoice_theme or 'modern',
+        invoice.subtotal, invoice.tax_amount, invoice.total, invoice.notes, invoice.share_token,
+        business.name, business.voen, business.logo.name if business.logo else '', business.address,
+        business.phone, business.email, business.default_currency,
+        client.name if client else '', client.email if client else '', client.address if client else '',
+        bool(white_label),
+    ]
+    parts.extend(invoice.items.order_by('id').values_list(
+        'id', 'description', 'quantity', 'unit', 'unit_price', 'amount'
+    ))
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _cache_dir():
+    return str(getattr(settings, 'PDF_CACHE_DIR', settings.BASE_DIR / 'pdf_cache'))
+
+
+def _cache_path(invoice_id, fingerprint):
+    return os.path.join(_cache_dir(), f"{invoice_id}-{fingerprint}.pdf")
+
+
+def read_cached_pdf(invoice_id, fingerprint):
+    try:
+        with open(_cache_path(invoice_id, fingerprint), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_cached(invoice, fingerprint, pdf_content):
+    """Store the PDF atomically and drop older renders of the same invoice."""
+    directory = _cache_dir()
+    path = _cache_path(invoice.pk, fingerprint)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"PDF cache write error: {e}")
+        return
+
+    for stale in glob.glob(os.path.join(directory, f"{invoice.pk}-*.pdf")):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def invalidate_invoice_pdf(invoice_id):
+    for path in glob.glob(os.path.join(_cache_dir(), f"{invoice_id}-*.pdf")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _count(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_pdf_cache_stats():
+    hits = cache.get(PDF_CACHE_HITS_KEY, 0)
+    misses = cache.get(PDF_CACHE_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def get_invoice_pdf(invoice, fingerprint=None):
+    """
+    Return (pdf_bytes, fingerprint), rendering only on a cache miss.
+    pdf_bytes is None when rendering fails.
+    """
+    white_label = has_white_label(invoice)
+    if fingerprint is None:
+        fingerprint = get_invoice_fingerprint(invoice, white_label)
+
+    pdf_content = read_cached_pdf(invoice.pk, fingerprint)
+    if pdf_content is not None:
+        _count(PDF_CACHE_HITS_KEY)
+        return pdf_content, fingerprint
+
+    _count(PDF_CACHE_MISSES_KEY)
+    pdf_content = render_invoice_pdf(invoice, white_label)
+    if pdf_content:
+        _write_cached(invoice, fingerprint, pdf_content)
+    return pdf_content, fingerprint
+
+
+def _link_callback(temp_files):
+    def link_callback(uri, rel):
+
+        if not uri: return uri
+
+        # Normalize path
+        uri_clean = uri.strip().replace('\\', '/')
+
+        # 1. Handle HTTP/HTTPS URLs (external images)
+        if uri_clean.startswith('http://') or uri_clean.startswith('https://'):
+            try:
+                response = requests.get(uri_clean, timeout=3)
+                if response.status_code == 200:
+                    temp_img = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
+                    temp_img.write(response.content)
+                    temp_img.close()
+                    temp_files.append(temp_img.name)
+                    return temp_img.name.replace('\\', '/')
+            except Exception as e:
+                print(f"PDF download error {uri_clean}: {e}")
+            return uri
+
+        # 2. Block any absolute paths or current-directory escapes for security (LFI prevention)
+        if os.path.isabs(uri_clean) or '..' in uri_clean or ':' in uri_clean:
+            return uri
+
+        # 3. Resolve Media/Static paths exclusively
+        if uri_clean.startswith('/media/'):
+            path = os.path.join(settings.MEDIA_ROOT, uri_clean[len('/media/'):])
+        elif uri_clean.startswith('/static/'):
+            path = os.path.join(settings.STATIC_ROOT, uri_clean[len('/static/'):])
+        else:
+            # Fallback for relative paths without prefix - check static then media
+            path = os.path.join(settings.STATIC_ROOT, uri_clean)
+            if not os.path.exists(path):
+                path = os.path.join(settings.MEDIA_ROOT, uri_clean)
+
+        # Verification: Ensure the resolved path exists and is within allowed roots
+        if path and os.path.isfile(path):
+            # Extra security check: Path must be subpath of STATIC_ROOT or MEDIA_ROOT
+            allowed_roots = [
+                os.path.abspath(settings.STATIC_ROOT),
+                os.path.abspath(settings.MEDIA_ROOT),
+            ]
+            abs_path = os.path.abspath(path)
+            if any(abs_path.startswith(root) for root in allowed_roots):
+                return abs_path.replace('\\', '/')
+
+        return uri
+    return link_callback
+
+
+def render_invoice_pdf(invoice, white_label=None):
+    """Render the invoice to PDF bytes with xhtml2pdf. Returns None on failure."""
+    if white_label is None:
+        white_label = has_white_label(invoice)
+
+    temp_files = []
+
+    # Generate QR code for payment
+    qr_code_path = None
+    try:
+        pay_url = f"https://invoiceaz.vercel.app/public/pay/{invoice.share_token}"
+        qr = qrcode.QRCode(version=1, box_size=15, border=4)
+        qr.add_data(pay_url)
+        qr.make(fit=True)
+        img = qr.make_image(fill_color="black", back_color="white")
+
+        temp_qr = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
+        temp_qr.close()
+        img.save(temp_qr.name)
+        temp_files.append(temp_qr.name)
+        qr_code_path = temp_qr.name.replace('\\', '/')
+    except Exception as e:
+        print(f"QR Code generation error: {e}")
+
+    # Skip passing font paths to template to avoid xhtml2pdf parsing bug on Windows
+    arial_font_path = os.path.join(_fonts_dir(), "arial.ttf").replace('\\', '/')
+    arial_bold_font_path = os.path.join(_fonts_dir(), "arialbd.ttf").replace('\\', '/')
+    register_fonts()
+
+    currency_symbol = CURRENCY_SYMBOLS.get(
+        invoice.currency or invoice.business.default_currency,
+        '₼'
+    )
+
+    context = {
+        'invoice': invoice,
+        'business': invoice.business,
+        'client': invoice.client,
+        'items': invoice.items.all(),
+        'qr_code_path': qr_code_path,
+        'theme': invoice.invoice_theme or 'modern',
+        'has_white_label': white_label,
+        'currency_symbol': currency_symbol,
+        'arial_font_path': arial_font_path,
+        'arial_bold_font_path': arial_bold_font_path,
+    }
+
+    html_string = render_to_string(PDF_TEMPLATE, context)
+
+    try:
+        result = io.BytesIO()
+        pisa_status = pisa.pisaDocument(
+            io.BytesIO(html_string.encode("UTF-8")),
+            result,
+            encoding='UTF-8',
+            link_callback=_link_callback(temp_files)
+        )
+
+        if pisa_status.err:
+            print(f"PISA ERROR: {pisa_status.err}")
+        return result.getvalue() if not pisa_status.err else None
+    except Exception as e:
+        print(f"PDF generation error: {e}")
+        return None
+    finally:
+        for path in temp_files:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Cleanup error: {e}")
+
+
+def enqueue_pdf_job(invoice, action='render', user=None):
+    """
+    Queue a background render of the invoice. A plain render that is already
+    cached is returned as a finished job; an identical unfinished job is reused.
+    """
+    from .models import PdfRenderJob
+
+    fingerprint = get_invoice_fingerprint(invoice)
+    if action == 'render':
+        if read_cached_pdf(invoice.pk, fingerprint) is not None:
+            now = timezone.now()
+            return PdfRenderJob.objects.create(
+                invoice=invoice, action=action, status='done', fingerprint=fingerprint,
+                requested_by=user, started_at=now, finished_at=now
+            )
+        pending = PdfRenderJob.objects.filter(
+            invoice=invoice, action=action, fingerprint=fingerprint, status__in=['queued', 'running']
+        )
+        if user is None:
+            # Anonymous (public link) callers may only poll anonymous jobs
+            pending = pending.filter(requested_by__isnull=True)
+        pending = pending.first()
+        if pending:
+            return pending
+
+    job = PdfRenderJob.objects.create(invoice=invoice, action=action, fingerprint=fingerprint, requested_by=user)
+    if getattr(settings, 'PDF_JOBS_EAGER', False):
+        transaction.on_commit(lambda: run_pdf_job(job.pk))
+    return job
+
+
+def claim_pdf_jobs(limit=10):
+    """Atomically move up to `limit` queued jobs to 'running' and return their ids."""
+    from .models import PdfRenderJob
+
+    candidates = PdfRenderJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:limit]
+    claimed = []
+    for job_id in list(candidates):
+        # Conditional UPDATE: only one worker can win the queued -> running transition.
+        # The attempt is counted here, so a job that kills its worker still runs out of attempts
+        if PdfRenderJob.objects.filter(pk=job_id, status='queued').update(
+            status='running', started_at=timezone.now(), attempts=F('attempts') + 1
+        ):
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale_pdf_jobs(timeout_seconds=600):
+    """Give jobs abandoned by a crashed worker another try (or fail them after the last attempt)."""
+    from .models import PdfRenderJob
+
+    max_attempts = getattr(settings, 'PDF_JOB_MAX_ATTEMPTS', 3)
+    cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+    stale = PdfRenderJob.objects.filter(status='running', started_at__lt=cutoff)
+    stale.filter(attempts__gte=max_attempts).update(
+        status='failed', error='Worker timed out', finished_at=timezone.now()
+    )
+    return stale.filter(attempts__lt=max_attempts).update(status='queued', started_at=None)
+
+
+def run_pdf_job(job_id):
+    """Render (and for 'email' jobs, send) one claimed job. Never raises."""
+    from .models import PdfRenderJob
+    from .emails import send_invoice_email
+
+    job = PdfRenderJob.objects.select_related('invoice__business__user', 'invoice__client').get(pk=job_id)
+    if job.status == 'queued':
+        # Run eagerly, without a claim: count the attempt here
+        job.started_at = timezone.now()
+        job.attempts += 1
+
+    try:
+        invoice = job.invoice
+        pdf_content, fingerprint = get_invoice_pdf(invoice)
+        if not pdf_content:
+            raise RuntimeError("PDF yaradıla bilmədi.")
+        job.fingerprint = fingerprint
+
+        if job.action == 'email':
+            if not invoice.client or not invoice.client.email:
+                raise RuntimeError("Müştərinin email ünvanı yoxdur.")
+            send_invoice_email(invoice, pdf_content)
+
+        job.status = 'done'
+        job.error = ''
+    except Exception as e:
+        max_attempts = getattr(settings, 'PDF_JOB_MAX_ATTEMPTS', 3)
+        job.status = 'queued' if job.attempts < max_attempts else 'failed'
+        job.error = str(e)
+        print(f"PDF job {job.pk} error: {e}")
+
+    job.finished_at = timezone.now() if job.status in ('done', 'failed') else None
+    job.save(update_fields=['status', 'fingerprint', 'error', 'attempts', 'started_at', 'finished_at'])
+    return job
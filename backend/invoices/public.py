@@ -0,0 +1,131 @@
+"""
+Public (share link) invoice page: cached payload and write-behind view tracking.
+
+The serialized invoice lives in Django's cache for PUBLIC_INVOICE_CACHE_TTL
+seconds under public_invoice:<share_token>. Saving or deleting the invoice, one
+of its lines or payments drops the entry right away and again once the
+transaction commits, since a view served meanwhile caches the old rows back.
+The TTL bounds drift from queryset.update()/bulk writes, from client/business
+edits and, without a shared cache (REDIS_URL), from the other processes.
+
+Every hit appends an InvoiceView row and nothing else. Only the first view
+(no viewed_at yet, or status still sent/finalized) changes the invoice, with
+one conditional UPDATE that skips save() and its post_save receivers; that
+view also notifies the owner and the assigned sales rep and refreshes the
+monthly rollups the status change moves.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from notifications.utils import create_notifications_bulk
+from utils.models import bulk_soft_deleted
+
+from .models import Invoice, InvoiceItem, InvoiceView, Payment
+from .rollups import refresh_invoice_months
+from .serializers import InvoiceSerializer
+
+# Statuses the first public view moves to 'viewed'
+UNVIEWED_STATUSES = ('sent', 'finalized')
+
+
+def _ttl():
+    return getattr(settings, 'PUBLIC_INVOICE_CACHE_TTL', 10)
+
+
+def snapshot_key(share_token):
+    return f'public_invoice:{share_token}'
+
+
+def public_snapshot(share_token):
+    """Serialized invoice behind `share_token` (cached), or None when there is none."""
+    try:
+        share_token = uuid.UUID(str(share_token))
+    except ValueError:
+        return None
+    key = snapshot_key(share_token)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        invoice = (
+            Invoice.objects.select_related('business', 'client')
+            .prefetch_related('items', 'payments').filter(share_token=share_token).first()
+        )
+        if not invoice:
+            return None
+        snapshot = dict(InvoiceSerializer(invoice).data)
+        cache.set(key, snapshot, _ttl())
+    return snapshot
+
+
+def invalidate_snapshots(share_tokens):
+    keys = [snapshot_key(share_token) for share_token in share_tokens if share_token]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def record_view(snapshot):
+    """
+    Log a public view of the invoice in `snapshot`. Returns True when it was the
+    first one and changed the invoice (the cached snapshot is then dropped).
+    """
+    InvoiceView.objects.create(invoice_id=snapshot['id'])
+    if snapshot['viewed_at'] and snapshot['status'] not in UNVIEWED_STATUSES:
+        return False
+
+    changed = Invoice.objects.filter(pk=snapshot['id']).filter(
+        Q(viewed_at__isnull=True) | Q(status__in=UNVIEWED_STATUSES)
+    ).update(
+        viewed_at=Coalesce(F('viewed_at'), Value(timezone.now())),
+        status=Case(When(status__in=UNVIEWED_STATUSES, then=Value('viewed')), default=F('status')),
+    )
+    invalidate_snapshots([snapshot['share_token']])
+    if not changed:
+        return False
+
+    invoice = Invoice.objects.select_related('business', 'client').get(pk=snapshot['id'])
+    refresh_invoice_months(invoice.business_id, invoice_dates=[invoice.invoice_date], due_dates=[invoice.due_date])
+    # Notify business owner and assigned Sales Rep if applicable
+    create_notifications_bulk(
+        [
+            (invoice.business.user_id, {
+                'message': f"#{invoice.invoice_number} nömrəli fakturaya müştəri tərəfindən baxıldı.",
+            }),
+            (invoice.client.assigned_to_id if invoice.client else None, {
+                'message': f"Müştəriniz {invoice.client.name} #{invoice.invoice_number} nömrəli fakturaya baxdı.",
+            }),
+        ],
+        {
+            'title': "Faktura Baxıldı",
+            'type': 'info',
+            'link': '/invoices',
+            'setting_key': 'invoice_viewed',
+        }
+    )
+    return True
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def drop_invoice_snapshot(sender, instance, **kwargs):
+    invalidate_snapshots([instance.share_token])
+
+
+@receiver(bulk_soft_deleted, sender=Invoice)
+def drop_snapshots_in_bulk(sender, queryset, **kwargs):
+    invalidate_snapshots(queryset.values_list('share_token', flat=True))
+
+
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_delete, sender=InvoiceItem)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def drop_parent_snapshot(sender, instance, **kwargs):
+    invalidate_snapshots([Invoice.all_objects.filter(pk=instance.invoice_id).values_list('share_token', flat=True).first()])
@@ -0,0 +1,208 @@
+"""
+Per-business monthly rollups (MonthlyRollup) behind the forecast and tax analytics.
+
+Whenever an invoice or expense is saved or deleted, the rollup rows for the
+months it touches (old and new) are recomputed from the source table once the
+transaction commits, so a rolled back write never reaches the rollups and the
+aggregate sees the committed rows. Each recompute is an indexed aggregate over
+one business and a few months, so writes never drift and reads never scan the
+invoice table. Recomputes of one business hold a lock on its row and upsert
+the groups in place, so two concurrent refreshes of the same month cannot
+collide on unique_monthly_rollup. Code that changes rows with
+queryset.update() must call the matching refresh_* function itself.
+`manage.py rebuild_rollups` recomputes everything from scratch.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from users.models import Business
+from utils.models import bulk_soft_deleted
+from utils.periods import add_months
+
+from .models import Expense, Invoice, MonthlyRollup
+
+DIMENSIONS = ('business_id', 'kind', 'month', 'currency', 'status', 'tax_rate', 'is_tax_deductible')
+MEASURES = ('count', 'subtotal', 'tax_amount', 'total', 'paid_amount')
+
+ZERO = Value(Decimal('0.00'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def month_start(date):
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    return date.replace(day=1)
+
+
+def _sum(field):
+    return Coalesce(Sum(field), ZERO)
+
+
+# kind -> (source queryset factory, date field, dimension -> source field, measure -> aggregate)
+SOURCES = {
+    'invoice': (
+        lambda: Invoice.objects.all(), 'invoice_date',
+        {'currency': 'currency', 'status': 'status', 'tax_rate': 'tax_rate'},
+        {'subtotal': 'subtotal', 'tax_amount': 'tax_amount', 'total': 'total', 'paid_amount': 'paid_amount'},
+    ),
+    'invoice_due': (
+        lambda: Invoice.objects.all(), 'due_date',
+        {'currency': 'currency', 'status': 'status', 'tax_rate': 'tax_rate'},
+        {'subtotal': 'subtotal', 'tax_amount': 'tax_amount', 'total': 'total', 'paid_amount': 'paid_amount'},
+    ),
+    'expense': (
+        lambda: Expense.objects.all(), 'date',
+        {'currency': 'currency', 'status': 'status', 'is_tax_deductible': 'is_tax_deductible'},
+        {'total': 'amount'},
+    ),
+}
+
+
+def _aggregate(kind, queryset):
+    """Yield unsaved MonthlyRollup rows for `queryset` grouped by month and the kind's dimensions."""
+    _, date_field, dimensions, measures = SOURCES[kind]
+    rows = (
+        queryset.annotate(rollup_month=TruncMonth(date_field))
+        .values('business_id', 'rollup_month', *dimensions.values())
+        .annotate(rollup_count=Count('id'), **{f'rollup_{name}': _sum(field) for name, field in measures.items()})
+        .order_by()
+    )
+    for row in rows:
+        yield MonthlyRollup(
+            business_id=row['business_id'],
+            kind=kind,
+            month=row['rollup_month'],
+            count=row['rollup_count'],
+            **{name: row[field] for name, field in dimensions.items()},
+            **{name: row[f'rollup_{name}'] for name in measures},
+        )
+
+
+def refresh_months(kind, business_id, months):
+    """Recompute the rollup rows of one business for the given months (any date inside a month works)."""
+    months = {month_start(m) for m in months if m}
+    if not months:
+        return
+    factory, date_field, _, _ = SOURCES[kind]
+
+    in_months = Q()
+    for month in months:
+        in_months |= Q(**{f'{date_field}__gte': month, f'{date_field}__lt': add_months(month, 1)})
+    source = factory().filter(in_months, business_id=business_id)
+
+    with transaction.atomic():
+        # Refreshes of one business run one at a time
+        list(Business.objects.select_for_update().filter(pk=business_id).values_list('pk', flat=True))
+        rows = list(_aggregate(kind, source))
+        stale = MonthlyRollup.objects.filter(business_id=business_id, kind=kind, month__in=months)
+        for row in rows:
+            stale = stale.exclude(**{field: getattr(row, field) for field in DIMENSIONS})
+        stale.delete()
+        MonthlyRollup.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=DIMENSIONS, update_fields=MEASURES,
+        )
+
+
+def refresh_invoice_months(business_id, invoice_dates=(), due_dates=()):
+    refresh_months('invoice', business_id, invoice_dates)
+    refresh_months('invoice_due', business_id, due_dates)
+
+
+def rebuild_rollups(business_ids=None):
+    """Drop and recompute all rollups (optionally for some businesses only). Returns rows written."""
+    written = 0
+    with transaction.atomic():
+        existing = MonthlyRollup.objects.all()
+        if business_ids is not None:
+            existing = existing.filter(business_id__in=business_ids)
+        existing.delete()
+
+        for kind, (factory, _, _, _) in SOURCES.items():
+            source = factory()
+            if business_ids is not None:
+                source = source.filter(business_id__in=business_ids)
+            written += len(MonthlyRollup.objects.bulk_create(_aggregate(kind, source), batch_size=1000))
+    return written
+
+
+# --------- Incremental maintenance ---------
+
+# Saves limited to other columns (viewed_at, sent_at, reminder_sent_at, ...) cannot move a rollup
+INVOICE_ROLLUP_FIELDS = {
+    'business', 'invoice_date', 'due_date', 'currency', 'status', 'tax_rate',
+    'subtotal', 'tax_amount', 'total', 'paid_amount', 'is_deleted',
+}
+EXPENSE_ROLLUP_FIELDS = {'business', 'date', 'currency', 'status', 'is_tax_deductible', 'amount', 'is_deleted'}
+
+
+def _affects_rollup(update_fields, relevant):
+    return update_fields is None or bool(relevant.intersection(update_fields))
+
+
+def _after_commit(refresh, *args, **kwargs):
+    transaction.on_commit(partial(refresh, *args, **kwargs))
+
+
+def _snapshot(instance, *fields):
+    # __dict__ lookup: a deferred field must not cost a query per loaded row
+    instance._rollup_original = tuple(instance.__dict__.get(f) for f in fields)
+
+
+@receiver(post_init, sender=Invoice)
+def remember_invoice_dates(sender, instance, **kwargs):
+    _snapshot(instance, 'invoice_date', 'due_date')
+
+
+@receiver(post_init, sender=Expense)
+def remember_expense_date(sender, instance, **kwargs):
+    _snapshot(instance, 'date')
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def refresh_invoice_rollups(sender, instance, **kwargs):
+    if not _affects_rollup(kwargs.get('update_fields'), INVOICE_ROLLUP_FIELDS):
+        return
+    old_invoice_date, old_due_date = getattr(instance, '_rollup_original', (None, None))
+    _after_commit(
+        refresh_invoice_months, instance.business_id,
+        invoice_dates={old_invoice_date, instance.invoice_date},
+        due_dates={old_due_date, instance.due_date},
+    )
+    _snapshot(instance, 'invoice_date', 'due_date')
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def refresh_expense_rollups(sender, instance, **kwargs):
+    if not _affects_rollup(kwargs.get('update_fields'), EXPENSE_ROLLUP_FIELDS):
+        return
+    (old_date,) = getattr(instance, '_rollup_original', (None,))
+    _after_commit(refresh_months, 'expense', instance.business_id, {old_date, instance.date})
+    _snapshot(instance, 'date')
+
+
+@receiver(bulk_soft_deleted, sender=Invoice)
+def refresh_rollups_on_bulk_invoice_delete(sender, queryset, **kwargs):
+    dates = defaultdict(lambda: (set(), set()))
+    for business_id, invoice_date, due_date in queryset.values_list('business_id', 'invoice_date', 'due_date'):
+        dates[business_id][0].add(invoice_date)
+        dates[business_id][1].add(due_date)
+    for business_id, (invoice_dates, due_dates) in dates.items():
+        _after_commit(refresh_invoice_months, business_id, invoice_dates=invoice_dates, due_dates=due_dates)
+
+
+@receiver(bulk_soft_deleted, sender=Expense)
+def refresh_rollups_on_bulk_expense_delete(sender, queryset, **kwargs):
+    dates = defaultdict(set)
+    for business_id, date in queryset.values_list('business_id', 'date'):
+        dates[business_id].add(date)
+    for business_id, months in dates.items():
+        _after_commit(refresh_months, 'expense', business_id, months)
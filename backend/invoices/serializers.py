@@ -1,8 +1,11 @@
 from rest_framework import serializers
-from invoices.models import Invoice, InvoiceItem, Payment, Expense
+from invoices.models import Invoice, InvoiceItem, Payment, Expense, PdfRenderJob
 from users.serializers import BusinessSerializer
 from clients.serializers import ClientSerializer
 from django.db import transaction
+from django.urls import reverse
+from utils.serializers import SparseFieldsetMixin
+from inventory.stock import apply_invoice_stock, item_quantities
 
 class ExpenseSerializer(serializers.ModelSerializer):
     class Meta:
@@ -11,10 +14,13 @@ class ExpenseSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'business', 'created_at', 'updated_at')
 
 class InvoiceItemSerializer(serializers.ModelSerializer):
+    # Writable so an invoice update can match lines it already has (see InvoiceSerializer.update)
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = InvoiceItem
         fields = '__all__'
-        read_only_fields = ('id', 'invoice', 'amount')
+        read_only_fields = ('invoice', 'amount')
 
 class PaymentSerializer(serializers.ModelSerializer):
     invoice_number = serializers.ReadOnlyField(source='invoice.invoice_number')
@@ -62,7 +68,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Invoice
         fields = '__all__'
-        read_only_fields = ('id', 'business', 'invoice_number', 'share_token', 'pdf_file', 'created_at', 'updated_at', 'paid_amount', 'paid_at')
+        read_only_fields = ('id', 'business', 'invoice_number', 'share_token', 'pdf_file', 'created_at', 'updated_at', 'paid_amount', 'paid_at', 'reminder_sent_at')
 
     def validate(self, data):
         request = self.context.get('request')
@@ -89,7 +95,9 @@ class InvoiceSerializer(serializers.ModelSerializer):
             items_data = validated_data.pop('items', [])
             invoice = Invoice.objects.create(**validated_data)
             for item_data in items_data:
-                InvoiceItem.objects.create(invoice=invoice, **item_data)
+                item_data.pop('id', None)
+            items = InvoiceItem.bulk_add(invoice, items_data)
+            apply_invoice_stock(invoice.pk, {}, item_quantities(items))
             invoice.calculate_totals()
             return invoice
 
@@ -107,12 +115,106 @@ class InvoiceSerializer(serializers.ModelSerializer):
                 setattr(instance, attr, value)
             instance.save()
             
-            # Update items
             if items_data:
-                # Use all_objects to bypass soft-delete filter and actually delete from DB
-                instance.items.model.all_objects.filter(invoice=instance).delete()
-                for item_data in items_data:
-                    InvoiceItem.objects.create(invoice=instance, **item_data)
-            
+                self._update_items(instance, items_data)
+
             instance.calculate_totals()
             return instance
+
+    def _update_items(self, instance, items_data):
+        """
+        Diff the submitted lines against the stored ones by id: unchanged lines
+        are left alone, changed ones go out in one bulk UPDATE, lines without an
+        id are bulk-inserted and missing ones soft-deleted. Stock then moves once
+        by the net change per product.
+        """
+        existing = {item.pk: item for item in InvoiceItem.objects.filter(invoice=instance)}
+        before = item_quantities(existing.values())
+
+        kept, changed, changed_fields, new_rows = [], [], set(), []
+        for item_data in items_data:
+            item_id = item_data.pop('id', None)
+            if item_id is None:
+                new_rows.append(item_data)
+                continue
+            item = existing.pop(item_id, None)
+            if item is None:
+                raise serializers.ValidationError({"items": f"#{item_id} sətri bu fakturaya aid deyil."})
+
+            fields = []
+            for attr, value in item_data.items():
+                current = item.product_id if attr == 'product' else getattr(item, attr)
+                if current != (value.pk if attr == 'product' and value else value):
+                    setattr(item, attr, value)
+                    fields.append(attr)
+            if {'quantity', 'unit_price'} & set(fields):
+                item.amount = item.quantity * item.unit_price
+                fields.append('amount')
+            if fields:
+                changed.append(item)
+                changed_fields.update(fields)
+            kept.append(item)
+
+        if changed:
+            InvoiceItem.objects.bulk_update(changed, sorted(changed_fields))
+        if existing:
+            InvoiceItem.objects.filter(pk__in=list(existing)).delete()
+        kept += InvoiceItem.bulk_add(instance, new_rows)
+
+        apply_invoice_stock(instance.pk, before, item_quantities(kept))
+
+
+class InvoiceListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Compact invoice representation for list endpoints: flat columns plus the
+    client's name and contacts (used to send from the list), no nested rows. Nested data is opt-in via ?expand=
+    (items, payments, client_details, business_details) and ?fields= selects columns.
+    """
+    client_name = serializers.ReadOnlyField(source='client.name')
+    client_phone = serializers.ReadOnlyField(source='client.phone')
+    client_email = serializers.ReadOnlyField(source='client.email')
+
+    expandable_fields = {
+        'items': (InvoiceItemSerializer, {'many': True, 'read_only': True}),
+        'payments': (PaymentSerializer, {'many': True, 'read_only': True}),
+        'client_details': (ClientSerializer, {'source': 'client', 'read_only': True}),
+        'business_details': (BusinessSerializer, {'source': 'business', 'read_only': True}),
+    }
+
+    class Meta:
+        model = Invoice
+        fields = (
+            'id', 'invoice_number', 'client', 'client_name', 'client_phone', 'client_email', 'created_by', 'status', 'currency',
+            'invoice_date', 'due_date', 'subtotal', 'tax_amount', 'discount', 'total', 'paid_amount',
+            'invoice_theme', 'notes', 'share_token', 'sent_at', 'viewed_at', 'paid_at', 'created_at', 'updated_at',
+        )
+        read_only_fields = fields
+
+
+class PdfRenderJobSerializer(serializers.ModelSerializer):
+    status_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PdfRenderJob
+        fields = ('id', 'invoice', 'action', 'status', 'error', 'attempts', 'created_at', 'finished_at', 'status_url', 'download_url')
+        read_only_fields = fields
+
+    def _absolute(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def _job_url(self, name, obj):
+        # Public jobs (context share_token) are scoped to their link, others to the active business
+        share_token = self.context.get('share_token')
+        if share_token:
+            return self._absolute(reverse(f'invoice-public-{name}', kwargs={'share_token': share_token, 'job_id': obj.pk}))
+        return self._absolute(reverse(f'invoice-{name}', kwargs={'job_id': obj.pk}))
+
+    def get_status_url(self, obj):
+        return self._job_url('pdf-job', obj)
+
+    def get_download_url(self, obj):
+        if obj.status != 'done' or obj.action != 'render':
+            return None
+        return self._job_url('pdf-job-download', obj)
@@ -99,3 +99,93 @@ class InvoiceStockTest(TestCase):
         item.delete()
         self.product.refresh_from_db()
         self.assertEqual(self.product.stock_quantity, 10.00)
+
+    def test_invoice_stock_is_applied_once_per_product(self):
+        """
+        Serializer writes bulk-insert the lines and move stock by the net change per product.
+        """
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from inventory.models import StockMovement
+        from invoices.serializers import InvoiceSerializer
+
+        other = Product.objects.create(business=self.business, name='Other', stock_quantity=100)
+        lines = [{'product': self.product.id, 'description': 'A', 'quantity': '1', 'unit_price': '10'} for _ in range(3)]
+        lines += [{'product': other.id, 'description': 'B', 'quantity': '2', 'unit_price': '5'} for _ in range(40)]
+        data = {'client': self.client.id, 'invoice_date': '2024-01-01', 'due_date': '2024-01-15', 'items': lines}
+
+        def create(items):
+            serializer = InvoiceSerializer(data={**data, 'items': items})
+            serializer.is_valid(raise_exception=True)
+            with CaptureQueriesContext(connection) as queries:
+                invoice = serializer.save(business=self.business)
+            return invoice, len(queries)
+
+        # The query count does not grow with the number of lines (the first invoice also sets up numbering)
+        Invoice.objects.create(business=self.business, client=self.client, invoice_date=timezone.now().date(), due_date=timezone.now().date())
+        small, small_queries = create(lines[:1] + lines[-1:])
+        small.delete()
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, other.stock_quantity), (10, 100))
+        invoice, queries = create(lines)
+        self.assertEqual(queries, small_queries)
+
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, other.stock_quantity), (7, 20))
+        self.assertEqual(invoice.total, 430)
+        movements = StockMovement.objects.filter(source_id=invoice.id).order_by('product_id')
+        self.assertEqual(
+            list(movements.values_list('movement_type', 'quantity', 'stock_before', 'stock_after')),
+            [('OUT', 3, 10, 7), ('OUT', 80, 100, 20)]
+        )
+
+        # Dropping one line of the first product returns just that quantity
+        serializer = InvoiceSerializer(invoice, data={**data, 'items': lines[1:]})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, other.stock_quantity), (8, 20))
+        self.assertEqual(StockMovement.objects.filter(source_id=invoice.id).count(), 3)
+        self.assertEqual(InvoiceItem.objects.filter(invoice=invoice).count(), 42)
+
+    def test_invoice_delete_cascades_set_based(self):
+        """
+        Deleting an invoice soft-deletes its lines and payments with one UPDATE each
+        and returns the stock with one movement per product.
+        """
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from inventory.models import StockMovement
+        from inventory.stock import apply_invoice_stock
+        from invoices.models import Payment
+
+        def build(lines):
+            invoice = Invoice.objects.create(
+                business=self.business, client=self.client,
+                invoice_date=timezone.now().date(), due_date=timezone.now().date()
+            )
+            InvoiceItem.bulk_add(invoice, [
+                {'product': self.product, 'description': 'A', 'quantity': 1, 'unit_price': 10} for _ in range(lines)
+            ])
+            apply_invoice_stock(invoice.id, {}, {self.product.id: lines})
+            Payment.objects.create(invoice=invoice, amount=5, payment_date=timezone.now().date())
+            return invoice
+
+        def delete(invoice):
+            with CaptureQueriesContext(connection) as queries:
+                invoice.delete()
+            return len(queries)
+
+        small = build(1)
+        small_queries = delete(small)
+        large = build(5)
+        self.assertEqual(delete(large), small_queries)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 10.00)
+        self.assertFalse(InvoiceItem.objects.filter(invoice=large).exists())
+        self.assertFalse(Payment.objects.filter(invoice=large).exists())
+        self.assertEqual(StockMovement.objects.filter(source_id=large.id, movement_type='RETURN').count(), 1)
@@ -2,9 +2,15 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from users.models import Business
 from clients.models import Client
-from invoices.models import Invoice, InvoiceItem, Payment, Expense
+from invoices.models import Invoice, InvoiceItem, Payment, Expense, InvoiceNumberSequence, MonthlyRollup
 from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from notifications.models import Notification, NotificationSetting, OutboundEmail
 from datetime import timedelta
+from io import StringIO
+from unittest import mock
 import decimal
 
 User = get_user_model()
@@ -70,6 +76,176 @@ class InvoiceModelTestCase(TestCase):
         self.assertEqual(invoice.paid_amount, decimal.Decimal('100.00'))
         self.assertEqual(invoice.status, 'paid')
 
+class InvoiceTotalsEngineTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='totals@invoices.com', password='password')
+        self.business = Business.objects.create(name='Totals Business', user=self.user)
+        self.client = Client.objects.create(name='Totals Client', business=self.business)
+        self.invoice = Invoice.objects.create(
+            business=self.business,
+            client=self.client,
+            invoice_date=timezone.now().date(),
+            due_date=timezone.now().date(),
+            tax_rate=18,
+            status='sent'
+        )
+        InvoiceItem.objects.create(invoice=self.invoice, description='Taxed', quantity=3, unit_price=10.00, tax_rate=10.00)
+        InvoiceItem.objects.create(invoice=self.invoice, description='Default tax', quantity=1, unit_price=50.00)
+
+    def test_totals_use_item_tax_with_invoice_fallback(self):
+        self.invoice.calculate_totals()
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.subtotal, decimal.Decimal('80.00'))
+        self.assertEqual(self.invoice.tax_amount, decimal.Decimal('12.00'))  # 3 + 9
+        self.assertEqual(self.invoice.total, decimal.Decimal('92.00'))
+
+    def test_recalculation_is_one_read_and_one_partial_write(self):
+        # MonthlyRollup upkeep on save is measured separately (AnalyticsRollupTestCase)
+        with mock.patch('invoices.rollups.refresh_invoice_months'), CaptureQueriesContext(connection) as ctx:
+            changed = self.invoice.calculate_totals()
+        self.assertEqual(set(changed), {'subtotal', 'tax_amount', 'total'})
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "invoices_invoice"')]
+        self.assertEqual(len(selects), 1)
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"notes"', updates[0])
+
+    def test_unchanged_totals_skip_the_write(self):
+        self.invoice.calculate_totals()
+        with CaptureQueriesContext(connection) as ctx:
+            changed = self.invoice.calculate_totals()
+        self.assertEqual(changed, [])
+        self.assertFalse(any(q['sql'].startswith('UPDATE') for q in ctx.captured_queries))
+
+    def test_payment_updates_only_payment_columns(self):
+        self.invoice.calculate_totals()
+        Payment.objects.create(invoice=self.invoice, amount=92, payment_date=timezone.now().date())
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.paid_amount, decimal.Decimal('92.00'))
+        self.assertEqual(self.invoice.status, 'paid')
+        self.assertIsNotNone(self.invoice.paid_at)
+
+class InvoiceNumberSequenceTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='seq@invoices.com', password='password')
+        self.business = Business.objects.create(name='Sequence Business', user=self.user)
+        self.client = Client.objects.create(name='Sequence Client', business=self.business)
+
+    def _create_invoice(self, **kwargs):
+        return Invoice.objects.create(
+            business=self.business,
+            client=self.client,
+            invoice_date=timezone.now().date(),
+            due_date=timezone.now().date(),
+            **kwargs
+        )
+
+    def test_numbers_are_sequential(self):
+        first = self._create_invoice()
+        second = self._create_invoice()
+        self.assertEqual(first.invoice_number, 'INV-1001')
+        self.assertEqual(second.invoice_number, 'INV-1002')
+        self.assertEqual(InvoiceNumberSequence.objects.get(business=self.business).last_value, 1002)
+
+    def test_counter_is_seeded_from_existing_numbers(self):
+        self._create_invoice(invoice_number='INV-1500').delete()
+        self._create_invoice(invoice_number='LEGACY-9999')
+        invoice = self._create_invoice()
+        self.assertEqual(invoice.invoice_number, 'INV-1501')
+
+    def test_prefix_and_padding_are_configurable(self):
+        InvoiceNumberSequence.objects.create(business=self.business, prefix='AZ', padding=6, last_value=41)
+        invoice = self._create_invoice()
+        self.assertEqual(invoice.invoice_number, 'AZ-000042')
+
+    def test_allocation_is_one_update_and_one_read(self):
+        self._create_invoice()
+        with CaptureQueriesContext(connection) as ctx:
+            number = InvoiceNumberSequence.next_number(self.business.id)
+        self.assertEqual([q['sql'].split()[0] for q in ctx.captured_queries], ['UPDATE', 'SELECT'])
+        self.assertEqual(number, 'INV-1002')
+
+class CheckDueInvoicesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='due@invoices.com', password='password')
+        self.rep = User.objects.create_user(email='rep@invoices.com', password='password')
+        self.business = Business.objects.create(name='Due Business', user=self.user)
+        self.client = Client.objects.create(name='Due Client', business=self.business, assigned_to=self.rep)
+        self.today = timezone.now().date()
+        Notification.objects.all().delete()
+
+    def _create_invoice(self, days, status='sent'):
+        invoice = Invoice.objects.create(
+            business=self.business, client=self.client, invoice_date=self.today,
+            due_date=self.today + timedelta(days=days)
+        )
+        Invoice.objects.filter(pk=invoice.pk).update(status=status)
+        return invoice
+
+    def _run(self):
+        call_command('check_due_invoices', stdout=StringIO())
+
+    def test_marks_every_past_due_invoice_overdue(self):
+        missed = self._create_invoice(-5)
+        due_today = self._create_invoice(0, status='viewed')
+        future = self._create_invoice(10)
+        paid = self._create_invoice(-5, status='paid')
+        Notification.objects.all().delete()
+
+        self._run()
+
+        statuses = dict(Invoice.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[missed.id], 'overdue')
+        self.assertEqual(statuses[due_today.id], 'overdue')
+        self.assertEqual(statuses[future.id], 'sent')
+        self.assertEqual(statuses[paid.id], 'paid')
+        # Owner and assigned sales rep are told about each overdue invoice
+        self.assertEqual(Notification.objects.filter(title='Vaxtı keçmiş ödəniş', user=self.user).count(), 2)
+        self.assertEqual(Notification.objects.filter(title='Vaxtı keçmiş ödəniş', user=self.rep).count(), 2)
+
+    def test_sweep_is_idempotent(self):
+        self._create_invoice(-1)
+        self._create_invoice(2)
+        Notification.objects.all().delete()
+
+        self._run()
+        first_run = Notification.objects.count()
+        self._run()
+
+        self.assertEqual(first_run, 4)
+        self.assertEqual(Notification.objects.count(), first_run)
+        self.assertEqual(Notification.objects.filter(title='Ödəniş xatırlatması').count(), 2)
+
+    def test_notification_settings_are_honoured(self):
+        NotificationSetting.objects.update_or_create(user=self.user, defaults={'in_app_overdue_invoice': False, 'email_overdue_invoice': True})
+        NotificationSetting.objects.update_or_create(user=self.rep, defaults={'in_app_overdue_invoice': True, 'email_overdue_invoice': False})
+        self._create_invoice(-1)
+        Notification.objects.all().delete()
+
+        self._run()
+
+        self.assertFalse(Notification.objects.filter(user=self.user).exists())
+        self.assertTrue(Notification.objects.filter(user=self.rep).exists())
+        self.assertEqual(list(OutboundEmail.objects.values_list('to', flat=True)), [[self.user.email]])
+
+    def test_overdue_sweep_refreshes_rollups(self):
+        invoice = self._create_invoice(-1)
+        self._run()
+        statuses = set(MonthlyRollup.objects.filter(business=self.business, month=invoice.invoice_date.replace(day=1), kind='invoice').values_list('status', flat=True))
+        self.assertEqual(statuses, {'overdue'})
+
+    def test_query_count_does_not_grow_with_invoices(self):
+        self._create_invoice(-1)
+        with CaptureQueriesContext(connection) as small:
+            self._run()
+
+        for _ in range(20):
+            self._create_invoice(-1)
+        with CaptureQueriesContext(connection) as large:
+            self._run()
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
 class ExpenseModelTestCase(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(email='test2@invoices.com', password='password')
@@ -83,3 +259,60 @@ class ExpenseModelTestCase(TestCase):
             date=timezone.now().date()
         )
         self.assertEqual(str(expense), 'Office Supplies - 150.5')
+
+    def test_expense_over_budget_notifies(self):
+        from utils.periods import business_timezone, local_date
+        self.business.budget_limit = 100
+        self.business.save()
+        today = local_date(business_timezone(self.business))
+
+        Expense.objects.create(business=self.business, description='Rent', amount=150, date=today)
+
+        notification = Notification.objects.get(title='Büdcə Limiti Keçildi!')
+        self.assertTrue(notification.message.startswith(f"{today.strftime('%B')} ayı"))
+
+class ArchiveSoftDeletedTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='archive@invoices.com', password='password')
+        self.business = Business.objects.create(name='Archive Business', user=self.user)
+        self.client = Client.objects.create(name='Archive Client', business=self.business)
+
+    def _create_invoice(self):
+        invoice = Invoice.objects.create(
+            business=self.business, client=self.client,
+            invoice_date=timezone.now().date(), due_date=timezone.now().date()
+        )
+        InvoiceItem.objects.create(invoice=invoice, description='Line', quantity=1, unit_price=10)
+        return invoice
+
+    def test_archives_old_soft_deleted_rows_children_first(self):
+        from invoices.models import ArchivedRecord
+
+        old, recent, live = self._create_invoice(), self._create_invoice(), self._create_invoice()
+        old.delete()
+        recent.delete()
+        Invoice.all_objects.filter(pk=old.pk).update(deleted_at=timezone.now() - timedelta(days=100))
+        InvoiceItem.all_objects.filter(invoice=old).update(deleted_at=timezone.now() - timedelta(days=100))
+        self.client.delete()
+        Client.all_objects.filter(pk=self.client.pk).update(deleted_at=timezone.now() - timedelta(days=100))
+
+        out = StringIO()
+        call_command('archive_soft_deleted', '--dry-run', stdout=out)
+        # Only the line is archivable yet: the invoice is still referenced by it
+        self.assertIn('Success: 1 rows can be archived.', out.getvalue())
+        self.assertTrue(Invoice.all_objects.filter(pk=old.pk).exists())
+
+        out = StringIO()
+        call_command('archive_soft_deleted', '--batch-size', '1', stdout=out)
+        self.assertIn('Archived 2 rows', out.getvalue())
+        self.assertFalse(Invoice.all_objects.filter(pk=old.pk).exists())
+        self.assertFalse(InvoiceItem.all_objects.filter(invoice_id=old.pk).exists())
+        # Recently deleted and live rows stay, and so does a client that invoices still reference
+        self.assertTrue(Invoice.all_objects.filter(pk=recent.pk).exists())
+        self.assertTrue(Invoice.objects.filter(pk=live.pk).exists())
+        self.assertTrue(Client.all_objects.filter(pk=self.client.pk).exists())
+
+        record = ArchivedRecord.objects.get(model='invoices.Invoice')
+        self.assertEqual((record.object_id, record.business_id), (old.pk, self.business.pk))
+        self.assertEqual(record.data['invoice_number'], old.invoice_number)
+        self.assertEqual(ArchivedRecord.objects.filter(model='invoices.InvoiceItem').count(), 1)
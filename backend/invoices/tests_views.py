@@ -4,9 +4,25 @@ from rest_framework import status
 from django.contrib.auth import get_user_model
 from users.models import Business, SubscriptionPlan
 from clients.models import Client
-from invoices.models import Invoice, Expense
+from invoices.models import Invoice, InvoiceItem, Expense, MonthlyRollup, Payment
+from invoices.public import snapshot_key
+from invoices.rollups import add_months
+from notifications.models import OutboundEmail
 from django.test import override_settings
 from django.utils import timezone
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import datetime
+from datetime import timedelta
+import decimal
+from io import BytesIO, StringIO
+from unittest import mock
+import os
+import shutil
+import tempfile
 
 User = get_user_model()
 
@@ -41,6 +57,141 @@ class InvoiceViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(Invoice.objects.filter(business=self.business).exists())
 
+    def _invoice_with_items(self, count=2):
+        invoice = Invoice.objects.create(business=self.business, client=self.client_obj, invoice_date=timezone.now().date(), due_date=timezone.now().date())
+        for i in range(count):
+            InvoiceItem.objects.create(invoice=invoice, description=f'Line {i}', quantity=1, unit_price=10)
+        return invoice
+
+    def test_list_is_compact_by_default(self):
+        self._invoice_with_items()
+        Client.objects.filter(pk=self.client_obj.pk).update(phone='+994501234567', email='client@test.az')
+        response = self.client.get(reverse('invoice-list'), HTTP_X_BUSINESS_ID=self.business.id)
+        row = response.data['results'][0]
+        self.assertEqual(row['client_name'], 'Test Client')
+        # WhatsApp/email sending from the list reads the client's contacts off the row
+        self.assertEqual((row['client_phone'], row['client_email']), ('+994501234567', 'client@test.az'))
+        for nested in ('items', 'payments', 'client_details', 'business_details'):
+            self.assertNotIn(nested, row)
+
+        # Detail keeps the full representation
+        response = self.client.get(reverse('invoice-detail', args=[row['id']]), HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertIn('business_details', response.data)
+
+    def test_list_fields_and_expand(self):
+        self._invoice_with_items()
+        response = self.client.get(reverse('invoice-list'), {'fields': 'id,total', 'expand': 'items,client_details'},
+                                   HTTP_X_BUSINESS_ID=self.business.id)
+        row = response.data['results'][0]
+        self.assertEqual(set(row), {'id', 'total', 'items', 'client_details'})
+        self.assertEqual(len(row['items']), 2)
+        self.assertEqual(row['client_details']['name'], 'Test Client')
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        def count_queries(params):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse('invoice-list'), params, HTTP_X_BUSINESS_ID=self.business.id)
+            return len(ctx.captured_queries)
+
+        self._invoice_with_items()
+        count_queries({})  # warm the plan usage cache
+        small = [count_queries({}), count_queries({'expand': 'items,payments'})]
+        for _ in range(5):
+            self._invoice_with_items(3)
+        self.assertEqual([count_queries({}), count_queries({'expand': 'items,payments'})], small)
+
+    def test_cursor_pagination_walks_every_row_once(self):
+        created = [self._invoice_with_items(0).id for _ in range(5)]
+        url = reverse('invoice-list')
+        response = self.client.get(url, {'pagination': 'cursor', 'page_size': 2}, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+
+        seen, pages = [], []
+        while True:
+            seen += [row['id'] for row in response.data['results']]
+            pages.append(response)
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'], HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(seen, created[::-1])
+
+        previous = self.client.get(pages[-1].data['previous'], HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual([row['id'] for row in previous.data['results']], seen[2:4])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse('invoice-list'), {'pagination': 'cursor', 'cursor': 'bogus'}, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn('count', self.client.get(reverse('invoice-list'), HTTP_X_BUSINESS_ID=self.business.id).data)
+
+    def test_update_diffs_items_by_id(self):
+        from inventory.models import Product, StockMovement
+        product = Product.objects.create(business=self.business, name='Stock', stock_quantity=100)
+        url = reverse('invoice-list')
+        lines = [{'description': f'Line {n}', 'quantity': '1', 'unit_price': '10.00', 'product': product.id if n < 2 else None}
+                 for n in range(20)]
+        data = {'client': self.client_obj.id, 'invoice_date': '2024-01-01', 'due_date': '2024-01-15', 'items': lines}
+        invoice_id = self.client.post(url, data, format='json', HTTP_X_BUSINESS_ID=self.business.id).data['id']
+        items = list(InvoiceItem.objects.filter(invoice_id=invoice_id).order_by('order', 'id').values('id', 'description', 'quantity', 'unit_price', 'product', 'order'))
+        untouched = InvoiceItem.objects.get(pk=items[5]['id'])
+
+        # Raise the first line to 4, drop the second, add one line; the other 18 are sent back unchanged
+        items[0]['quantity'] = '4'
+        payload = {**data, 'items': [items[0]] + items[2:] + [{'description': 'New', 'quantity': '2', 'unit_price': '5.00'}]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(reverse('invoice-detail', args=[invoice_id]), payload, format='json', HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item_writes = [q['sql'].split(' ', 1)[0] for q in queries.captured_queries
+                       if q['sql'].startswith(('UPDATE "invoices_invoiceitem"', 'INSERT INTO "invoices_invoiceitem"'))]
+        # One bulk UPDATE for the changed line, one soft-delete UPDATE, one INSERT
+        self.assertEqual(sorted(item_writes), ['INSERT', 'UPDATE', 'UPDATE'])
+
+        self.assertEqual(InvoiceItem.objects.get(pk=items[5]['id']).amount, untouched.amount)
+        self.assertTrue(InvoiceItem.all_objects.get(pk=items[1]['id']).is_deleted)
+        self.assertEqual(InvoiceItem.objects.filter(invoice_id=invoice_id).count(), 20)
+        self.assertEqual(InvoiceItem.objects.get(pk=items[0]['id']).amount, decimal.Decimal('40.00'))
+        self.assertEqual(Invoice.objects.get(pk=invoice_id).subtotal, decimal.Decimal('230.00'))
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 96)
+        # One OUT for the new invoice, one net OUT (+3 -1) for the edit
+        self.assertEqual(list(StockMovement.objects.filter(source_id=invoice_id).order_by('id').values_list('movement_type', 'quantity')),
+                         [('OUT', 2), ('OUT', 2)])
+
+        other = Invoice.objects.create(business=self.business, client=self.client_obj, invoice_date=timezone.now().date(), due_date=timezone.now().date())
+        foreign = InvoiceItem.objects.create(invoice=other, description='Foreign', quantity=1, unit_price=1)
+        payload['items'] = [{'id': foreign.id, 'description': 'Taken', 'quantity': '1', 'unit_price': '1.00'}]
+        response = self.client.put(reverse('invoice-detail', args=[invoice_id]), payload, format='json', HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.description, 'Foreign')
+
+    def test_export_requires_csv_export_feature(self):
+        response = self.client.get(reverse('invoice-export'), HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.data['code'], 'plan_limit')
+
+    def test_export_streams_filtered_invoices_as_csv(self):
+        SubscriptionPlan.objects.filter(pk=self.user.subscription_plan_id).update(has_csv_export=True)
+        today = timezone.now().date()
+        Invoice.objects.create(business=self.business, client=self.client_obj, invoice_number='EXP-1', invoice_date=today, due_date=today, total=10)
+        Invoice.objects.create(business=self.business, client=self.client_obj, invoice_number='=HYPERLINK()', invoice_date=today, due_date=today)
+        other = Business.objects.create(name='Other', user=User.objects.create_user(email='other@invoicesviews.com', password='password'))
+        Invoice.objects.create(business=other, client=Client.objects.create(name='Other', business=other), invoice_number='EXP-2', invoice_date=today, due_date=today)
+
+        response = self.client.get(reverse('invoice-export'), HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="fakturalar_', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['Faktura №', 'Müştəri'])
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith("'=HYPERLINK()"))
+        self.assertTrue(lines[2].startswith('EXP-1,Test Client,'))
+
+        response = self.client.get(reverse('invoice-export'), {'search': 'EXP'}, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()), 2)
+
 @override_settings(SECURE_SSL_REDIRECT=False)
 class ExpenseViewSetTestCase(APITestCase):
     def setUp(self):
@@ -67,3 +218,505 @@ class ExpenseViewSetTestCase(APITestCase):
         response = self.client.post(url, data, HTTP_X_BUSINESS_ID=self.business.id)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(Expense.objects.filter(business=self.business, description='Travel').exists())
+
+    def test_cursor_pagination_breaks_date_ties_by_id(self):
+        day = timezone.now().date()
+        created = [Expense.objects.create(business=self.business, description=f'E{i}', amount=1, date=day).id for i in range(3)]
+        url = reverse('expense-list')
+        response = self.client.get(url, {'pagination': 'cursor', 'page_size': 1}, HTTP_X_BUSINESS_ID=self.business.id)
+        seen = [row['id'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'], HTTP_X_BUSINESS_ID=self.business.id)
+            seen += [row['id'] for row in response.data['results']]
+        self.assertEqual(seen, created[::-1])
+
+    def test_export_streams_expenses_as_xlsx(self):
+        import openpyxl
+        SubscriptionPlan.objects.filter(pk=self.user.subscription_plan_id).update(has_csv_export=True)
+        Expense.objects.create(business=self.business, description='Ofis', amount='50.00', date=datetime.date(2024, 5, 1))
+
+        response = self.client.get(reverse('expense-export'), {'file_format': 'xlsx'}, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:2], ('Tarix', 'Təsvir'))
+        self.assertEqual(rows[1][:2], (datetime.datetime(2024, 5, 1), 'Ofis'))
+
+        response = self.client.get(reverse('expense-export'), {'file_format': 'pdf'}, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_xlsx_export_escapes_formulas(self):
+        import openpyxl
+        SubscriptionPlan.objects.filter(pk=self.user.subscription_plan_id).update(has_csv_export=True)
+        payload = '=HYPERLINK("http://evil.example","Klik")'
+        Expense.objects.create(business=self.business, description=payload, amount='50.00', date=datetime.date(2024, 5, 1))
+
+        response = self.client.get(reverse('expense-export'), {'file_format': 'xlsx'}, HTTP_X_BUSINESS_ID=self.business.id)
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+        cell = workbook.active.cell(row=2, column=2)
+        self.assertEqual(cell.data_type, 's')
+        self.assertEqual(cell.value, f"'{payload}")
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class InvoicePdfCacheTestCase(APITestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(PDF_CACHE_DIR=self.cache_dir)
+        self.settings_override.enable()
+        cache.clear()
+
+        plan = SubscriptionPlan.objects.create(name='pdfcache', label='PDF Cache')
+        self.user = User.objects.create_user(email='pdfcache@invoicesviews.com', password='password', subscription_plan=plan)
+        self.business = Business.objects.create(name='PDF Business', user=self.user)
+        self.client_obj = Client.objects.create(name='PDF Client', business=self.business)
+        self.invoice = Invoice.objects.create(business=self.business, client=self.client_obj, invoice_date=timezone.now().date(), due_date=timezone.now().date())
+        self.item = InvoiceItem.objects.create(invoice=self.invoice, description='Service', quantity=1, unit_price=100)
+        self.invoice.calculate_totals()
+        self.url = reverse('invoice-public-pdf', kwargs={'share_token': self.invoice.share_token})
+
+        patcher = mock.patch('invoices.pdf.render_invoice_pdf', return_value=b'%PDF-1.4 test')
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_repeat_downloads_are_served_from_cache(self):
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, b'%PDF-1.4 test')
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(self.render.call_count, 1)
+        self.assertEqual(cache.get('invoice_pdf_cache:hits'), 1)
+        self.assertEqual(cache.get('invoice_pdf_cache:misses'), 1)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_content_change_invalidates_entry(self):
+        etag = self.client.get(self.url)['ETag']
+        self.item.quantity = 2
+        self.item.save()
+        self.invoice.calculate_totals()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.render.call_count, 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_viewed_status_does_not_invalidate(self):
+        self.invoice.status = 'sent'
+        self.invoice.save()
+        etag = self.client.get(self.url)['ETag']
+        self.client.get(reverse('invoice-public-view', kwargs={'share_token': self.invoice.share_token}))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PDF_JOBS_EAGER=False)
+class PdfRenderJobTestCase(APITestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(PDF_CACHE_DIR=self.cache_dir)
+        self.settings_override.enable()
+
+        plan = SubscriptionPlan.objects.create(name='pdfjobs', label='PDF Jobs')
+        self.user = User.objects.create_user(email='pdfjobs@invoicesviews.com', password='password', subscription_plan=plan)
+        self.business = Business.objects.create(name='Jobs Business', user=self.user)
+        self.client_obj = Client.objects.create(name='Jobs Client', email='client@jobs.az', business=self.business)
+        self.invoice = Invoice.objects.create(business=self.business, client=self.client_obj, invoice_date=timezone.now().date(), due_date=timezone.now().date())
+        InvoiceItem.objects.create(invoice=self.invoice, description='Service', quantity=1, unit_price=100)
+        self.invoice.calculate_totals()
+        self.client.force_authenticate(user=self.user)
+
+        patcher = mock.patch('invoices.pdf.render_invoice_pdf', return_value=b'%PDF-1.4 job')
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _run_worker(self):
+        call_command('run_pdf_worker', '--once', stdout=StringIO())
+
+    def test_render_job_is_processed_by_worker(self):
+        url = reverse('invoice-render-pdf', kwargs={'pk': self.invoice.pk})
+        response = self.client.post(url, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'queued')
+        self.render.assert_not_called()
+
+        self._run_worker()
+
+        job = self.client.get(response.data['status_url'], HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(job.data['status'], 'done')
+        download = self.client.get(job.data['download_url'], HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        self.assertEqual(download.content, b'%PDF-1.4 job')
+        self.assertEqual(self.render.call_count, 1)
+
+        # The job id alone is not enough: anonymous callers and other businesses get nothing
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(job.data['status_url']).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get(job.data['download_url']).status_code, status.HTTP_401_UNAUTHORIZED)
+        other = User.objects.create_user(email='other@jobs.az', password='password')
+        other_business = Business.objects.create(name='Other Business', user=other)
+        self.client.force_authenticate(user=other)
+        download = self.client.get(job.data['download_url'], HTTP_X_BUSINESS_ID=other_business.id)
+        self.assertEqual(download.status_code, status.HTTP_404_NOT_FOUND)
+        # Nor can the public link reach a job queued by the owner
+        public_url = reverse('invoice-public-pdf-job-download', kwargs={'share_token': self.invoice.share_token, 'job_id': job.data['id']})
+        self.assertEqual(self.client.get(public_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_async_public_pdf_miss_returns_job(self):
+        self.client.force_authenticate(user=None)
+        url = reverse('invoice-public-pdf', kwargs={'share_token': self.invoice.share_token})
+        response = self.client.get(url, {'async': '1'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        again = self.client.get(url, {'async': '1'})
+        self.assertEqual(again.data['id'], response.data['id'])
+        self.render.assert_not_called()
+        self.assertIn(str(self.invoice.share_token), response.data['status_url'])
+
+        self._run_worker()
+        job = self.client.get(response.data['status_url'])
+        self.assertEqual(job.data['status'], 'done')
+        self.assertEqual(self.client.get(job.data['download_url']).content, b'%PDF-1.4 job')
+
+    def test_job_that_crashes_the_worker_runs_out_of_attempts(self):
+        from invoices.models import PdfRenderJob
+        from invoices.pdf import claim_pdf_jobs, enqueue_pdf_job, requeue_stale_pdf_jobs
+
+        job = enqueue_pdf_job(self.invoice, user=self.user)
+        with self.settings(PDF_JOB_MAX_ATTEMPTS=2):
+            for expected in ('queued', 'failed'):
+                # Claimed, then the worker dies mid-render
+                self.assertEqual(claim_pdf_jobs(), [job.pk])
+                PdfRenderJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+                requeue_stale_pdf_jobs()
+                job.refresh_from_db()
+                self.assertEqual(job.status, expected)
+        self.assertEqual(job.attempts, 2)
+
+    def test_send_email_is_sent_by_worker(self):
+        url = reverse('invoice-send-email', kwargs={'pk': self.invoice.pk})
+        response = self.client.post(url, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self._run_worker()
+        # The PDF worker only queues the message; the outbox worker delivers it
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.filter(status='pending').count(), 1)
+        call_command('run_email_worker', '--once', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['client@jobs.az'])
+        self.assertEqual(mail.outbox[0].attachments[0][2], 'application/pdf')
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, 'sent')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AnalyticsRollupTestCase(APITestCase):
+    def setUp(self):
+        plan = SubscriptionPlan.objects.create(name='pro', label='Pro')
+        self.user = User.objects.create_user(email='rollup@invoicesviews.com', password='password', subscription_plan=plan)
+        self.business = Business.objects.create(name='Rollup Business', user=self.user)
+        self.client_obj = Client.objects.create(name='Rollup Client', business=self.business)
+        self.client.force_authenticate(user=self.user)
+        self.month = timezone.now().date().replace(day=1)
+
+    def _invoice(self, date, subtotal, status='sent', tax_rate=0, tax_amount=0, due_date=None):
+        # rollups are refreshed once the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return Invoice.objects.create(
+                business=self.business, client=self.client_obj, invoice_date=date, due_date=due_date or date,
+                status=status, subtotal=subtotal, tax_rate=tax_rate, tax_amount=tax_amount, total=subtotal + tax_amount
+            )
+
+    def _expense(self, description, amount, date, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Expense.objects.create(business=self.business, description=description, amount=amount, date=date, **fields)
+
+    def _rollup(self, kind='invoice'):
+        return list(MonthlyRollup.objects.filter(business=self.business, kind=kind).values_list('month', 'status', 'count', 'total'))
+
+    def test_rollup_follows_invoice_changes(self):
+        invoice = self._invoice(self.month, 100)
+        self.assertEqual(self._rollup(), [(self.month, 'sent', 1, decimal.Decimal('100.00'))])
+
+        invoice.status = 'paid'
+        invoice.invoice_date = add_months(self.month, -1)
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+        self.assertEqual(self._rollup(), [(add_months(self.month, -1), 'paid', 1, decimal.Decimal('100.00'))])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.delete()
+        self.assertEqual(self._rollup(), [])
+        self.assertEqual(self._rollup('invoice_due'), [])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self._invoice(self.month, 100)
+        self._invoice(add_months(self.month, -3), 40, status='paid')
+        self._expense('Rent', 30, self.month)
+        before = sorted(MonthlyRollup.objects.values_list('kind', 'month', 'status', 'count', 'total'))
+
+        call_command('rebuild_rollups', stdout=StringIO())
+
+        self.assertEqual(sorted(MonthlyRollup.objects.values_list('kind', 'month', 'status', 'count', 'total')), before)
+
+    def test_forecast_reads_rollups(self):
+        self._invoice(self.month, 100)
+        self._invoice(add_months(self.month, -1), 50, status='paid')
+        self._invoice(add_months(self.month, -12), 25, status='overdue')
+        self._invoice(self.month, 999, status='draft')
+        self._invoice(self.month, 60, due_date=add_months(self.month, 1))
+
+        response = self.client.get(reverse('forecast-analytics'), HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # current 160 vs last month 50 and same month last year 25
+        self.assertEqual(response.data['growth']['mom'], 220)
+        self.assertEqual(response.data['growth']['yoy'], 540)
+        self.assertEqual(response.data['revenue_chart'][11]['revenue'], 160.0)
+        self.assertEqual(response.data['cashflow'][0]['inflow'], 60.0)
+
+    def test_tax_reads_rollups(self):
+        self._invoice(datetime.date(2023, 2, 10), 100, tax_rate=18, tax_amount=18)
+        self._invoice(datetime.date(2023, 5, 10), 200, status='paid')
+        self._invoice(datetime.date(2023, 5, 11), 500, status='draft')
+        self._expense('Rent', 30, datetime.date(2023, 2, 1))
+        self._expense('Gift', 10, datetime.date(2023, 8, 1), is_tax_deductible=False)
+
+        response = self.client.get(reverse('tax-analytics'), {'year': 2023}, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data['vat']['total'], 18.0)
+        self.assertEqual(data['vat']['by_rate'], {'rate_18': 18.0, 'rate_0': 0.0})
+        self.assertEqual(data['vat']['monthly'], [
+            {'month': 'Fevral', 'vat': 18.0, 'revenue': 100.0},
+            {'month': 'May', 'vat': 0.0, 'revenue': 200.0},
+        ])
+        self.assertEqual(data['income_tax']['revenue'], 300.0)
+        self.assertEqual(data['income_tax']['expenses'], 40.0)
+        self.assertEqual(data['income_tax']['tax_base'], 270.0)
+        self.assertEqual(data['quarterly'][0], {'name': 'Q1', 'revenue': 100.0, 'vat': 18.0, 'expenses': 30.0, 'profit': 70.0})
+        self.assertEqual(data['quarterly'][2]['expenses'], 10.0)
+        self.assertEqual(data['summary'], {'customer_count': 1, 'best_month': 'May'})
+
+    def test_query_count_does_not_grow_with_invoices(self):
+        def count_queries(name):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse(name), HTTP_X_BUSINESS_ID=self.business.id)
+            return len(ctx.captured_queries)
+
+        self._invoice(self.month, 10)
+        count_queries('forecast-analytics')  # warm the plan usage cache
+        small = {name: count_queries(name) for name in ('forecast-analytics', 'tax-analytics')}
+        for i in range(24):
+            self._invoice(add_months(self.month, -i), 10)
+        large = {name: count_queries(name) for name in ('forecast-analytics', 'tax-analytics')}
+        self.assertEqual(small, large)
+
+    def test_churn_list_is_ranked_in_sql(self):
+        today = timezone.now().date()
+
+        def client_with_invoices(name, *days_ago):
+            client = Client.objects.create(name=name, business=self.business)
+            for days in days_ago:
+                Invoice.objects.create(
+                    business=self.business, client=client, invoice_date=today - timedelta(days=days),
+                    due_date=today, status='paid', subtotal=10, total=10
+                )
+            return client
+
+        for i in range(6):
+            client_with_invoices(f'Dormant {i}', 100 + i * 10)
+        client_with_invoices('Active', 400, 10)
+        client_with_invoices('Never invoiced')
+        client_with_invoices('Deleted recent', 200, 5).invoices.order_by('-invoice_date').first().delete()
+
+        self.client.get(reverse('forecast-analytics'), HTTP_X_BUSINESS_ID=self.business.id)  # warm the plan usage cache
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('forecast-analytics'), HTTP_X_BUSINESS_ID=self.business.id)
+        churn_list = response.data['risks']['churn_list']
+        self.assertEqual([c['name'] for c in churn_list], ['Deleted recent', 'Dormant 5', 'Dormant 4', 'Dormant 3', 'Dormant 2'])
+        self.assertEqual(churn_list[0]['days_inactive'], 200)
+        self.assertEqual(churn_list[1]['last_seen'], (today - timedelta(days=150)).strftime('%Y-%m-%d'))
+
+        # one more dormant client does not add queries
+        client_with_invoices('Dormant 6', 120)
+        with CaptureQueriesContext(connection) as more:
+            self.client.get(reverse('forecast-analytics'), HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(len(ctx.captured_queries), len(more.captured_queries))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ProblematicInvoicesViewTestCase(APITestCase):
+    def setUp(self):
+        plan = SubscriptionPlan.objects.create(name='pro', label='Pro')
+        self.user = User.objects.create_user(email='issues@invoicesviews.com', password='password', subscription_plan=plan)
+        self.business = Business.objects.create(name='Issues Business', user=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.today = timezone.now().date()
+        self.url = reverse('issue-analytics')
+
+    def _overdue(self, client, days, total, paid=0, status='overdue'):
+        return Invoice.objects.create(
+            business=self.business, client=client, invoice_date=self.today - timedelta(days=days + 10),
+            due_date=self.today - timedelta(days=days), status=status, total=total, paid_amount=paid
+        )
+
+    def test_aging_and_debtors_are_aggregated(self):
+        acme = Client.objects.create(name='Acme', business=self.business, email='acme@example.com')
+        beta = Client.objects.create(name='Beta', business=self.business)
+        self._overdue(acme, 10, 100, paid=40)   # 60 in 1-30
+        self._overdue(acme, 95, 200)            # 200 in 90+
+        self._overdue(beta, 45, 80, status='sent')  # 80 in 31-60
+        self._overdue(beta, 5, 500, status='paid')  # ignored
+        self._overdue(beta, -5, 70, status='sent')  # not due yet
+
+        response = self.client.get(self.url, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['kpi'], {'total_overdue': 340.0, 'critical_debt': 200.0, 'debtors_count': 2})
+        self.assertEqual([a['amount'] for a in response.data['aging']], [60.0, 80.0, 0.0, 200.0])
+        self.assertEqual(response.data['debtors'][0], {
+            'id': acme.id, 'name': 'Acme', 'email': 'acme@example.com', 'phone': None,
+            'total_debt': 260.0, 'invoices_count': 2, 'max_overdue_days': 95,
+        })
+        self.assertEqual(response.data['debtors'][1]['total_debt'], 80.0)
+
+    def test_debtors_are_paginated(self):
+        for i in range(3):
+            self._overdue(Client.objects.create(name=f'Client {i}', business=self.business), 10, 100 + i)
+
+        response = self.client.get(self.url, {'page_size': 2, 'page': 2}, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.data['debtors_pagination']['count'], 3)
+        self.assertEqual([d['name'] for d in response.data['debtors']], ['Client 0'])
+        self.assertIsNone(response.data['debtors_pagination']['next'])
+
+    def test_query_count_does_not_grow_with_debtors(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(self.url, HTTP_X_BUSINESS_ID=self.business.id)
+            return len(ctx.captured_queries)
+
+        self._overdue(Client.objects.create(name='First', business=self.business), 10, 100)
+        count_queries()  # warm the plan usage cache
+        small = count_queries()
+        for i in range(20):
+            self._overdue(Client.objects.create(name=f'Client {i}', business=self.business), i * 7 + 1, 50)
+        self.assertEqual(count_queries(), small)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PaymentAnalyticsViewTestCase(APITestCase):
+    def setUp(self):
+        plan = SubscriptionPlan.objects.create(name='pro', label='Pro')
+        self.user = User.objects.create_user(email='payments@invoicesviews.com', password='password', subscription_plan=plan)
+        self.business = Business.objects.create(name='Payments Business', user=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('payment-analytics')
+
+    def _paid(self, client, issued, due_in, paid_after):
+        invoice_date = datetime.date(2024, 1, 1) + timedelta(days=issued)
+        invoice = Invoice.objects.create(
+            business=self.business, client=client, invoice_date=invoice_date,
+            due_date=invoice_date + timedelta(days=due_in), status='sent', total=100
+        )
+        return Payment.objects.create(invoice=invoice, amount=100, payment_date=invoice_date + timedelta(days=paid_after))
+
+    def test_speed_buckets_and_ratings_are_computed_in_sql(self):
+        prompt = Client.objects.create(name='Prompt', business=self.business)
+        slow = Client.objects.create(name='Slow', business=self.business)
+        self._paid(prompt, 0, 10, 5)    # 5 days, 5 early
+        self._paid(prompt, 3, 10, 12)   # 12 days, 2 late
+        self._paid(slow, 0, 10, 40)     # 40 days, 30 late
+        self._paid(slow, 0, 10, 20)     # 20 days, 10 late
+
+        response = self.client.get(self.url, HTTP_X_BUSINESS_ID=self.business.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['behavior'], {'on_time_pct': 25.0, 'late_pct': 75.0, 'avg_overdue_days': 14.0})
+        self.assertEqual([b['count'] for b in response.data['speed']], [1, 1, 1, 1])
+        ratings = response.data['customer_ratings']
+        self.assertEqual([(r['name'], r['avg_delay'], r['rating']) for r in ratings], [('Prompt', -1.5, 'A'), ('Slow', 20.0, 'C')])
+
+    def test_query_count_does_not_grow_with_payments(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(self.url, HTTP_X_BUSINESS_ID=self.business.id)
+            return len(ctx.captured_queries)
+
+        client_obj = Client.objects.create(name='Client', business=self.business)
+        self._paid(client_obj, 0, 10, 5)
+        count_queries()  # warm the plan usage cache
+        small = count_queries()
+        for i in range(15):
+            self._paid(client_obj, i, 10, i * 3)
+        self.assertEqual(count_queries(), small)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PublicInvoiceViewTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        plan = SubscriptionPlan.objects.create(name='public', label='Public')
+        self.user = User.objects.create_user(email='public@invoicesviews.com', password='password', subscription_plan=plan)
+        self.business = Business.objects.create(name='Public Business', user=self.user)
+        self.client_obj = Client.objects.create(name='Public Client', business=self.business)
+        self.invoice = Invoice.objects.create(business=self.business, client=self.client_obj, invoice_date=timezone.now().date(), due_date=timezone.now().date())
+        InvoiceItem.objects.create(invoice=self.invoice, description='Service', quantity=1, unit_price=100)
+        self.invoice.calculate_totals()
+        Invoice.objects.filter(pk=self.invoice.pk).update(status='sent')
+        self.url = reverse('invoice-public-view', kwargs={'share_token': self.invoice.share_token})
+
+    def test_only_first_view_updates_invoice_and_notifies(self):
+        from invoices.models import InvoiceView
+        from notifications.models import Notification
+        Notification.objects.all().delete()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'viewed')
+        self.invoice.refresh_from_db()
+        viewed_at = self.invoice.viewed_at
+        self.assertIsNotNone(viewed_at)
+        self.assertEqual(Notification.objects.filter(title='Faktura Baxıldı').count(), 1)
+
+        # Repeat views come from the cached snapshot and only append a view event
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                self.assertEqual(self.client.get(self.url).data['status'], 'viewed')
+        self.assertFalse(any(q['sql'].startswith('UPDATE') for q in queries.captured_queries))
+        self.assertEqual(InvoiceView.objects.filter(invoice=self.invoice).count(), 4)
+        self.assertEqual(Notification.objects.filter(title='Faktura Baxıldı').count(), 1)
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.viewed_at, viewed_at)
+
+    def test_payment_drops_cached_snapshot(self):
+        self.client.get(self.url)
+        Payment.objects.create(invoice=self.invoice, amount=100, payment_date=timezone.now().date())
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['status'], 'paid')
+        self.assertEqual(len(response.data['payments']), 1)
+
+    def test_snapshot_cached_before_commit_is_dropped_on_commit(self):
+        stale = self.client.get(self.url).data
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(invoice=self.invoice, amount=100, payment_date=timezone.now().date())
+            # a view served by another request, still seeing the committed rows, caches them again
+            cache.set(snapshot_key(self.invoice.share_token), dict(stale))
+        self.assertEqual(self.client.get(self.url).data['status'], 'paid')
+
+    def test_unknown_token_returns_404(self):
+        response = self.client.get(reverse('invoice-public-view', kwargs={'share_token': 'not-a-token'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
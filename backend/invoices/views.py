@@ -1,44 +1,53 @@
-from rest_framework import viewsets, permissions, status, filters, pagination
+from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied, ValidationError
-from .models import Invoice, Expense, Payment, InvoiceItem
-from .serializers import InvoiceSerializer, ExpenseSerializer, PaymentSerializer
+from .models import Invoice, Expense, Payment, InvoiceItem, PdfRenderJob
+from .serializers import InvoiceSerializer, InvoiceListSerializer, ExpenseSerializer, PaymentSerializer, PdfRenderJobSerializer
 from users.models import Business
 from users.mixins import BusinessContextMixin
-from users.plan_limits import check_invoice_limit, check_expense_limit, check_storage_limit, get_full_plan_status
+from users.plan_limits import check_invoice_limit, check_expense_limit, check_storage_limit
 from users.permissions import IsRoleAuthorized
-from notifications.utils import create_notification
 from django.http import HttpResponse
 from django.template.loader import render_to_string
 from django.utils import timezone
-from django.conf import settings
 from django.db.models import Sum, F
-from django.core.mail import EmailMessage
-import io
-import os
+from .public import public_snapshot, record_view
+from .pdf import get_invoice_pdf, get_invoice_fingerprint, get_pdf_cache_stats, read_cached_pdf, enqueue_pdf_job
 import uuid
-import base64
-import qrcode
-import tempfile
-import requests
-try:
-    from xhtml2pdf import pisa
-except ImportError:
-    pisa = None
-
-class StandardResultsSetPagination(pagination.PageNumberPagination):
+from inventory.stock import apply_invoice_stock, item_quantities
+from utils.exports import ExportMixin
+from utils.pagination import OptionalKeysetPagination
+from utils.serializers import query_param_set
+
+class StandardResultsSetPagination(OptionalKeysetPagination):
     page_size = 50
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
-class ExpenseViewSet(BusinessContextMixin, viewsets.ModelViewSet):
+class ExpenseViewSet(BusinessContextMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = Expense.objects.all()
     serializer_class = ExpenseSerializer
     permission_classes = [permissions.IsAuthenticated, IsRoleAuthorized]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-date', '-id')
     filter_backends = [filters.SearchFilter]
     search_fields = ['description', 'category']
+    export_ordering = keyset_ordering
+    export_filename = 'xercler'
+    export_title = 'Xərclər'
+    export_columns = (
+        ('Tarix', 'date'),
+        ('Təsvir', 'description'),
+        ('Təchizatçı', 'vendor'),
+        ('Kateqoriya', 'category'),
+        ('Məbləğ', 'amount'),
+        ('Valyuta', 'currency'),
+        ('Status', 'status'),
+        ('Ödəniş Üsulu', 'payment_method'),
+        ('Müştəri', 'client__name'),
+        ('Vergidən çıxılır', 'is_tax_deductible'),
+    )
 
     def perform_create(self, serializer):
         business = self.get_active_business()
@@ -97,20 +106,59 @@ class PaymentViewSet(BusinessContextMixin, viewsets.ModelViewSet):
 
         serializer.save()
 
-class InvoiceViewSet(BusinessContextMixin, viewsets.ModelViewSet):
+class InvoiceViewSet(BusinessContextMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
     permission_classes = [permissions.IsAuthenticated, IsRoleAuthorized]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-created_at', '-id')
     filter_backends = [filters.SearchFilter]
     search_fields = ['invoice_number', 'client__name']
+    export_ordering = keyset_ordering
+    export_filename = 'fakturalar'
+    export_title = 'Fakturalar'
+    export_columns = (
+        ('Faktura №', 'invoice_number'),
+        ('Müştəri', 'client__name'),
+        ('Tarix', 'invoice_date'),
+        ('Son Tarix', 'due_date'),
+        ('Status', 'status'),
+        ('Valyuta', 'currency'),
+        ('Ara cəm', 'subtotal'),
+        ('ƏDV', 'tax_amount'),
+        ('Endirim', 'discount'),
+        ('Məbləğ', 'total'),
+        ('Ödənilib', 'paid_amount'),
+        ('Yaradılıb', 'created_at'),
+    )
+
+    # ?expand= name -> (select_related, prefetch_related) it needs on the list endpoint
+    LIST_EXPANSIONS = {
+        'items': ((), ('items',)),
+        'payments': ((), ('payments',)),
+        'client_details': ((), ()),
+        'business_details': (('business',), ()),
+    }
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return InvoiceListSerializer
+        return super().get_serializer_class()
 
     def get_queryset(self):
         # Still use mixin's filtered queryset but add performance optimizations
         queryset = super().get_queryset()
-        if queryset is not None:
-             return queryset.select_related('client', 'business').prefetch_related('items', 'payments')
-        return Invoice.objects.none()
+        if queryset is None:
+            return Invoice.objects.none()
+        if self.action != 'list':
+            return queryset.select_related('client', 'business').prefetch_related('items', 'payments')
+
+        # The list only loads the relations the client asked to expand
+        related, prefetch = ['client'], []
+        for name in query_param_set(self.request, 'expand') & self.LIST_EXPANSIONS.keys():
+            related.extend(self.LIST_EXPANSIONS[name][0])
+            prefetch.extend(self.LIST_EXPANSIONS[name][1])
+        return queryset.select_related(*related).prefetch_related(*prefetch)
 
     def perform_create(self, serializer):
         business = self.get_active_business()
@@ -179,257 +227,130 @@ class InvoiceViewSet(BusinessContextMixin, viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def duplicate(self, request, pk=None):
         invoice = self.get_object()
-        items = invoice.items.all()
-        
+        rows = list(invoice.items.order_by('order', 'id').values(
+            'product_id', 'description', 'quantity', 'unit', 'unit_price', 'tax_rate', 'order'
+        ))
+
         # Clone invoice
         invoice.pk = None
         invoice.invoice_number = None # Let model's save() generate a new number
         invoice.share_token = uuid.uuid4()
         invoice.status = 'draft'
         invoice.save()
-        
-        # Clone items
-        for item in items:
-            item.pk = None
-            item.invoice = invoice
-            item.save()
-        
+
+        # Clone items in one INSERT and take their stock in one batch
+        items = InvoiceItem.bulk_add(invoice, rows)
+        apply_invoice_stock(invoice.pk, {}, item_quantities(items))
+
         invoice.calculate_totals()
             
         return Response(InvoiceSerializer(invoice).data, status=status.HTTP_201_CREATED)
 
     def _generate_pdf(self, invoice):
-        invoice.calculate_totals()
-        
-        # Generate QR code for payment
-        qr_code_path = None
+        pdf_content, _ = get_invoice_pdf(invoice)
+        return pdf_content
+
+    def _wants_async(self, request):
+        return request.query_params.get('async') in ('1', 'true') or 'respond-async' in request.headers.get('Prefer', '')
+
+    def _job_response(self, request, job, share_token=None):
+        # Jobs queued from a public link are polled through that link's URLs
+        data = PdfRenderJobSerializer(job, context={'request': request, 'share_token': share_token}).data
+        code = status.HTTP_200_OK if job.status == 'done' else status.HTTP_202_ACCEPTED
+        return Response(data, status=code)
+
+    def _job_download_response(self, job):
+        if not job:
+            return Response({"error": "PDF hələ hazır deyil"}, status=status.HTTP_404_NOT_FOUND)
+
+        pdf_content = read_cached_pdf(job.invoice_id, job.fingerprint)
+        if pdf_content is None:
+            # The invoice changed (or the cache was cleared) after this render
+            return Response({"error": "PDF köhnəlib, yenidən yaradın."}, status=status.HTTP_410_GONE)
+        return self._pdf_file_response(pdf_content, job.invoice, job.fingerprint)
+
+    def _public_jobs(self, share_token):
+        """Render jobs queued anonymously through the public link `share_token`."""
         try:
-            pay_url = f"https://invoiceaz.vercel.app/public/pay/{invoice.share_token}"
-            qr = qrcode.QRCode(version=1, box_size=15, border=4)
-            qr.add_data(pay_url)
-            qr.make(fit=True)
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            temp_qr = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-            temp_qr.close()
-            img.save(temp_qr.name)
-            qr_code_path = temp_qr.name.replace('\\', '/')
-        except Exception as e:
-            print(f"QR Code generation error: {e}")
+            share_token = uuid.UUID(share_token)
+        except ValueError:
+            return PdfRenderJob.objects.none()
+        return PdfRenderJob.objects.filter(invoice__share_token=share_token, requested_by__isnull=True, action='render')
+
+    def _pdf_file_response(self, pdf_content, invoice, fingerprint):
+        response = HttpResponse(pdf_content, content_type='application/pdf')
+        filename = f"invoice_{invoice.invoice_number}.pdf"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['ETag'] = f'"{fingerprint}"'
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def _pdf_response(self, request, invoice, error_message):
+        """
+        Serve the cached PDF, answering conditional requests with 304 via the content ETag.
+        On a cache miss, `?async=1` (or `Prefer: respond-async`) queues a render job instead.
+        """
+        fingerprint = get_invoice_fingerprint(invoice)
+        etag = f'"{fingerprint}"'
+
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
 
-        # Prepare font paths for template
-        static_dir = str(settings.BASE_DIR / "static")
-        fonts_dir = os.path.join(static_dir, "fonts")
-        
-        # Skip passing font paths to template to avoid xhtml2pdf parsing bug on Windows
-        arial_font_path = os.path.join(fonts_dir, "arial.ttf").replace('\\', '/')
-        arial_bold_font_path = os.path.join(fonts_dir, "arialbd.ttf").replace('\\', '/')
-        
-        try:
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-            from reportlab.lib.fonts import addMapping
-            
-            pdfmetrics.registerFont(TTFont('Arial', arial_font_path))
-            pdfmetrics.registerFont(TTFont('Arial-Bold', arial_bold_font_path))
-            addMapping('Arial', 0, 0, 'Arial')
-            addMapping('Arial', 1, 0, 'Arial-Bold')
-        except Exception as e:
-            print(f"Font registration error: {e}")
-
-        # Check for white label permission
-        plan_status = get_full_plan_status(invoice.business.user, business_id=invoice.business_id)
-        has_white_label = plan_status.get('limits', {}).get('white_label', False)
-
-        currency_symbols = {
-            'AZN': '₼',
-            'USD': '$',
-            'EUR': '€',
-            'TRY': '₺',
-            'RUB': '₽',
-            'GBP': '£'
-        }
-        currency_symbol = currency_symbols.get(
-            invoice.currency or invoice.business.default_currency, 
-            '₼'
-        )
+        if self._wants_async(request) and read_cached_pdf(invoice.pk, fingerprint) is None:
+            if request.user.is_authenticated:
+                return self._job_response(request, enqueue_pdf_job(invoice, user=request.user))
+            return self._job_response(request, enqueue_pdf_job(invoice), share_token=invoice.share_token)
 
-        context = {
-            'invoice': invoice,
-            'business': invoice.business,
-            'client': invoice.client,
-            'items': invoice.items.all(),
-            'qr_code_path': qr_code_path,
-            'theme': invoice.invoice_theme or 'modern',
-            'has_white_label': has_white_label,
-            'currency_symbol': currency_symbol,
-            'arial_font_path': arial_font_path,
-            'arial_bold_font_path': arial_bold_font_path,
-        }
-        
-        html_string = render_to_string('invoices/invoice_pdf.html', context)
-        
-        # Font registration
-        # Font registration with reportlab is NOT needed for xhtml2pdf when using @font-face in CSS
-        # We perform it only if strictly necessary for other reportlab features, but for xhtml2pdf
-        # the CSS @font-face with base64 should be sufficient.
-        # However, to be safe and avoid "Can't open file" errors from reportlab trying to load
-        # fonts from temp paths if xhtml2pdf falls back, we skip explicit file registration here
-        # and rely 100% on the HTML/CSS embedding.
-
-        def link_callback(uri, rel):
-            
-            if not uri: return uri
-            
-            # Normalize path
-            uri_clean = uri.strip().replace('\\', '/')
-            
-            # 1. Handle HTTP/HTTPS URLs (external images)
-            if uri_clean.startswith('http://') or uri_clean.startswith('https://'):
-                try:
-                    response = requests.get(uri_clean, timeout=3)
-                    if response.status_code == 200:
-                        temp_img = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-                        temp_img.write(response.content)
-                        temp_img.close()
-                        return temp_img.name.replace('\\', '/')
-                except Exception as e:
-                    print(f"PDF download error {uri_clean}: {e}")
-                return uri
-
-            # 2. Block any absolute paths or current-directory escapes for security (LFI prevention)
-            if os.path.isabs(uri_clean) or '..' in uri_clean or ':' in uri_clean:
-                return uri
-
-            # 3. Resolve Media/Static paths exclusively
-            if uri_clean.startswith('/media/'):
-                path = os.path.join(settings.MEDIA_ROOT, uri_clean[len('/media/'):])
-            elif uri_clean.startswith('/static/'):
-                path = os.path.join(settings.STATIC_ROOT, uri_clean[len('/static/'):])
-            else:
-                # Fallback for relative paths without prefix - check static then media
-                path = os.path.join(settings.STATIC_ROOT, uri_clean)
-                if not os.path.exists(path):
-                    path = os.path.join(settings.MEDIA_ROOT, uri_clean)
-
-            # Verification: Ensure the resolved path exists and is within allowed roots
-            if path and os.path.isfile(path):
-                # Extra security check: Path must be subpath of STATIC_ROOT or MEDIA_ROOT
-                allowed_roots = [
-                    os.path.abspath(settings.STATIC_ROOT),
-                    os.path.abspath(settings.MEDIA_ROOT),
-                ]
-                abs_path = os.path.abspath(path)
-                if any(abs_path.startswith(root) for root in allowed_roots):
-                    return abs_path.replace('\\', '/')
-            
-            return uri
+        pdf_content, _ = get_invoice_pdf(invoice, fingerprint=fingerprint)
+        if pdf_content:
+            return self._pdf_file_response(pdf_content, invoice, fingerprint)
 
-        try:
-            result = io.BytesIO()
-            pisa_status = pisa.pisaDocument(
-                io.BytesIO(html_string.encode("UTF-8")), 
-                result, 
-                encoding='UTF-8',
-                link_callback=link_callback
-            )
-            
-            if qr_code_path and os.path.exists(qr_code_path):
-                try:
-                    os.remove(qr_code_path)
-                except Exception as e:
-                    print(f"Cleanup error: {e}")
-            
-            if pisa_status.err:
-                print(f"PISA ERROR: {pisa_status.err}")
-            return result.getvalue() if not pisa_status.err else None
-        except Exception as e:
-            print(f"PDF generation error: {e}")
-            return None
+        return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['post'])
+    def render_pdf(self, request, pk=None):
+        invoice = self.get_object()
+        return self._job_response(request, enqueue_pdf_job(invoice, user=request.user))
+
+    @action(detail=False, methods=['get'], url_path='pdf-jobs/(?P<job_id>[0-9a-f-]+)', url_name='pdf-job')
+    def pdf_job(self, request, job_id=None):
+        # Only jobs of invoices the caller can see in the active business
+        job = PdfRenderJob.objects.filter(pk=job_id, invoice__in=self.get_queryset()).first()
+        if not job:
+            return Response({"error": "Tapşırıq tapılmadı"}, status=status.HTTP_404_NOT_FOUND)
+        return self._job_response(request, job)
+
+    @action(detail=False, methods=['get'], url_path='pdf-jobs/(?P<job_id>[0-9a-f-]+)/download', url_name='pdf-job-download')
+    def pdf_job_download(self, request, job_id=None):
+        job = PdfRenderJob.objects.select_related('invoice').filter(
+            pk=job_id, invoice__in=self.get_queryset(), status='done', action='render'
+        ).first()
+        return self._job_download_response(job)
 
     @action(detail=True, methods=['get'])
     def pdf(self, request, pk=None):
         invoice = self.get_object()
-        pdf_content = self._generate_pdf(invoice)
-        
-        if pdf_content:
-            response = HttpResponse(pdf_content, content_type='application/pdf')
-            filename = f"invoice_{invoice.invoice_number}.pdf"
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
-            
-        return Response({"error": "PDF generation failed"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return self._pdf_response(request, invoice, "PDF generation failed")
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser], url_path='pdf-cache-stats')
+    def pdf_cache_stats(self, request):
+        return Response(get_pdf_cache_stats())
 
     @action(detail=True, methods=['post'])
     def send_email(self, request, pk=None):
-        print(f"--- send_email started for pk={pk} ---")
         invoice = self.get_object()
-        print(f"Invoice fetched: {invoice.invoice_number}")
         client = invoice.client
-        print(f"Client: {client.name if client else 'None'}, Email: {client.email if client else 'None'}")
         
         if not client or not client.email:
-            print("Client or email missing, returning 400")
             return Response({"error": "Müştərinin email ünvanı yoxdur."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        print("Calling _generate_pdf...")
-        pdf_content = self._generate_pdf(invoice)
-        print("PDF generated successfully." if pdf_content else "PDF generation returned None")
-        if not pdf_content:
-            return Response({"error": "PDF yaradıla bilmədi."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-        try:
-            print("Building email content...")
-            
-            subject = f"Faktura #{invoice.invoice_number} - {invoice.business.name}"
-            
-            # Simple body with link
-            frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:5173').rstrip('/')
-            public_link = f"{frontend_url}/view/{invoice.share_token}"
-            currency_symbols = {
-                'AZN': '₼',
-                'USD': '$',
-                'EUR': '€',
-                'TRY': '₺',
-                'RUB': '₽',
-                'GBP': '£'
-            }
-            currency_symbol = currency_symbols.get(
-                invoice.currency or invoice.business.default_currency, 
-                '₼'
-            )
-            
-            body = f"Salam {client.name},\n\n"
-            body += f"{invoice.business.name} tərəfindən sizə {invoice.invoice_number} nömrəli faktura göndərilib.\n"
-            body += f"Məbləğ: {invoice.total} {currency_symbol}\n\n"
-            body += f"Fakturanı onlayn izləmək və ödəmək üçün aşağıdakı linkə daxil olun:\n{public_link}\n\n"
-            body += "Təşəkkürlər!"
-            
-            email = EmailMessage(
-                subject,
-                body,
-                settings.DEFAULT_FROM_EMAIL or 'noreply@invoiceaz.com',
-                [client.email],
-            )
-            
-            email.attach(f"invoice_{invoice.invoice_number}.pdf", pdf_content, 'application/pdf')
-            print("Sending email...")
-            email.send()
-            print("Email sent successfully.")
-            
-            # Update status if needed
-            if invoice.status in ['draft', 'finalized']:
-                invoice.status = 'sent'
-                invoice.sent_at = timezone.now()
-                invoice.save()
-                print("Invoice status updated to sent.")
-                
-            return Response({"message": "Email uğurla göndərildi."})
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            print(f"Email error block reached: {str(e)}")
-            return Response({"error": f"Email göndərmək mümkün olmadı: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # Rendering and SMTP both happen in the PDF worker, off the request thread
+        job = enqueue_pdf_job(invoice, action='email', user=request.user)
+        data = PdfRenderJobSerializer(job, context={'request': request}).data
+        data['message'] = "Email göndərilmək üçün növbəyə əlavə edildi."
+        return Response(data, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=True, methods=['post'])
     def mark_as_sent(self, request, pk=None):
@@ -442,45 +363,13 @@ class InvoiceViewSet(BusinessContextMixin, viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny], url_path='public/(?P<share_token>[^/.]+)')
     def public_view(self, request, share_token=None):
-        try:
-            invoice = Invoice.objects.get(share_token=share_token)
-            
-            # Tracking logic
-            should_notify = False
-            if invoice.status in ['sent', 'finalized']:
-                invoice.status = 'viewed'
-                should_notify = True
-            
-            if not invoice.viewed_at:
-                invoice.viewed_at = timezone.now()
-                should_notify = True
-            
-            invoice.save()
-
-            if should_notify:
-                # Notify business owner
-                create_notification(
-                    user=invoice.business.user,
-                    title="Faktura Baxıldı",
-                    message=f"#{invoice.invoice_number} nömrəli fakturaya müştəri tərəfindən baxıldı.",
-                    type='info',
-                    link='/invoices',
-                    setting_key='invoice_viewed'
-                )
-                # Notify assigned Sales Rep if applicable
-                if invoice.client and invoice.client.assigned_to:
-                    create_notification(
-                        user=invoice.client.assigned_to,
-                        title="Faktura Baxıldı",
-                        message=f"Müştəriniz {invoice.client.name} #{invoice.invoice_number} nömrəli fakturaya baxdı.",
-                        type='info',
-                        link='/invoices',
-                        setting_key='invoice_viewed'
-                    )
-            
-            return Response(InvoiceSerializer(invoice).data)
-        except Invoice.DoesNotExist:
+        # Served from the cached snapshot; only the first view writes to the invoice
+        snapshot = public_snapshot(share_token)
+        if snapshot is None:
             return Response({"error": "Faktura tapılmadı"}, status=status.HTTP_404_NOT_FOUND)
+        if record_view(snapshot):
+            snapshot = public_snapshot(share_token)
+        return Response(snapshot)
 
     @action(detail=False, methods=['post'], permission_classes=[permissions.AllowAny], url_path='public/(?P<share_token>[^/.]+)/pay')
     def public_pay(self, request, share_token=None):
@@ -505,18 +394,30 @@ class InvoiceViewSet(BusinessContextMixin, viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny], url_path='public/(?P<share_token>[^/.]+)/pdf')
     def public_pdf(self, request, share_token=None):
         try:
-            invoice = Invoice.objects.get(share_token=share_token)
-            pdf_content = self._generate_pdf(invoice)
-            
-            if pdf_content:
-                response = HttpResponse(pdf_content, content_type='application/pdf')
-                filename = f"invoice_{invoice.invoice_number}.pdf"
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                return response
-            
-            return Response({"error": "PDF yaradıla bilmədi."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            invoice = Invoice.objects.select_related('business__user', 'client').get(share_token=share_token)
+            return self._pdf_response(request, invoice, "PDF yaradıla bilmədi.")
         except Invoice.DoesNotExist:
             return Response({"error": "Faktura tapılmadı"}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.AllowAny], url_path='public/(?P<share_token>[^/.]+)/pdf/render')
+    def public_render_pdf(self, request, share_token=None):
+        invoice = Invoice.objects.select_related('business__user', 'client').filter(share_token=share_token).first()
+        if not invoice:
+            return Response({"error": "Faktura tapılmadı"}, status=status.HTTP_404_NOT_FOUND)
+        return self._job_response(request, enqueue_pdf_job(invoice), share_token=invoice.share_token)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny], url_path='public/(?P<share_token>[^/.]+)/pdf-jobs/(?P<job_id>[0-9a-f-]+)', url_name='public-pdf-job')
+    def public_pdf_job(self, request, share_token=None, job_id=None):
+        job = self._public_jobs(share_token).filter(pk=job_id).first()
+        if not job:
+            return Response({"error": "Tapşırıq tapılmadı"}, status=status.HTTP_404_NOT_FOUND)
+        return self._job_response(request, job, share_token=share_token)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny], url_path='public/(?P<share_token>[^/.]+)/pdf-jobs/(?P<job_id>[0-9a-f-]+)/download', url_name='public-pdf-job-download')
+    def public_pdf_job_download(self, request, share_token=None, job_id=None):
+        job = self._public_jobs(share_token).select_related('invoice').filter(pk=job_id, status='done').first()
+        return self._job_download_response(job)
+
     @action(detail=False, methods=['get'], url_path='top-products')
     def top_products(self, request):
         
@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import OutboundEmail
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'category', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'category')
+    search_fields = ('subject', 'to')
+    readonly_fields = ('created_at', 'sent_at', 'locked_at', 'last_error')
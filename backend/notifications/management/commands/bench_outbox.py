@@ -0,0 +1,85 @@
+"""
+Benchmark the outbound email outbox against inline sending.
+Usage: python manage.py bench_outbox --messages 500 --batch 50
+
+For each backend (console, locmem) it compares:
+  inline   - one EmailMessage.send() per message, each opening its own connection
+             (what request handlers used to do)
+  enqueue  - the request-side cost of queue_email()
+  worker   - draining the queue in batches over one connection per batch
+The queued rows are removed afterwards.
+"""
+import io
+import math
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+
+from notifications.models import OutboundEmail
+from notifications.outbox import claim_outbound_emails, deliver_outbound_emails, queue_email
+
+BACKENDS = {
+    'console': 'django.core.mail.backends.console.EmailBackend',
+    'locmem': 'django.core.mail.backends.locmem.EmailBackend',
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark queued batch email delivery against inline sending'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--batch', type=int, default=50)
+
+    def _connection(self, backend):
+        # Keep console output out of the report
+        if backend == 'console':
+            return get_connection(BACKENDS[backend], stream=io.StringIO())
+        return get_connection(BACKENDS[backend])
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        batch = options['batch']
+        attachment = [('invoice.pdf', b'%PDF-1.4 ' + b'0' * 20_000, 'application/pdf')]
+
+        self.stdout.write(f"Messages: {count}, batch size: {batch}")
+        self.stdout.write(f"{'backend':<9}{'inline ms/msg':>15}{'enqueue ms/msg':>16}{'worker ms/msg':>15}{'connections':>14}")
+
+        try:
+            for backend in BACKENDS:
+                started = time.perf_counter()
+                for i in range(count):
+                    message = EmailMessage(f'Bench {i}', 'Body', 'bench@invoice.az', [f'to{i}@example.com'],
+                                           connection=self._connection(backend))
+                    message.attach(*attachment[0])
+                    message.send()
+                inline = time.perf_counter() - started
+
+                started = time.perf_counter()
+                for i in range(count):
+                    queue_email(f'Bench {i}', 'Body', [f'to{i}@example.com'],
+                                attachments=attachment, category='bench')
+                enqueue = time.perf_counter() - started
+
+                started = time.perf_counter()
+                while True:
+                    email_ids = claim_outbound_emails(batch)
+                    if not email_ids:
+                        break
+                    deliver_outbound_emails(email_ids, connection=self._connection(backend))
+                worker = time.perf_counter() - started
+
+                pending = OutboundEmail.objects.filter(category='bench').exclude(status='sent').count()
+                if pending:
+                    self.stdout.write(self.style.WARNING(f'{pending} bench emails were not sent'))
+                OutboundEmail.objects.filter(category='bench').delete()
+
+                self.stdout.write(
+                    f"{backend:<9}{inline * 1000 / count:>15.3f}{enqueue * 1000 / count:>16.3f}"
+                    f"{worker * 1000 / count:>15.3f}{f'{count} -> {math.ceil(count / batch)}':>14}"
+                )
+        finally:
+            OutboundEmail.objects.filter(category='bench').delete()
+
+        self.stdout.write(self.style.SUCCESS('Success: Outbox benchmark finished.'))
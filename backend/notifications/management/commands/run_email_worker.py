@@ -0,0 +1,44 @@
+"""
+Deliver queued outbound emails (OutboundEmail) off the request path.
+Usage: python manage.py run_email_worker            # run forever
+       python manage.py run_email_worker --once     # send what is due and exit
+
+Each batch is sent over one mail connection. Failed emails are retried with
+exponential backoff and marked 'dead' after EMAIL_OUTBOX_MAX_ATTEMPTS.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notifications.outbox import claim_outbound_emails, deliver_outbound_emails, requeue_stale_outbound_emails
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound emails in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when no email is due')
+        parser.add_argument('--batch', type=int, default=50, help='Emails sent per connection')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when nothing is due')
+        parser.add_argument('--stale-after', type=int, default=600, help='Release emails stuck in sending longer than this (seconds)')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            close_old_connections()
+            requeue_stale_outbound_emails(options['stale_after'])
+            email_ids = claim_outbound_emails(options['batch'])
+
+            if email_ids:
+                sent, failed = deliver_outbound_emails(email_ids)
+                total_sent += sent
+                total_failed += failed
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Success: Sent {total_sent} emails ({total_failed} failed).'
+        ))
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Notification(models.Model):
     NOTIFICATION_TYPES = (
@@ -90,3 +91,42 @@ class ActivityLog(models.Model):
 
     def __str__(self):
         return f"[{self.get_action_display()}] {self.user} - {self.description}"
+
+
+class OutboundEmail(models.Model):
+    """
+    Email waiting in the outbox. Requests only insert rows here; delivery is done
+    by `manage.py run_email_worker` over one reused mail connection per batch.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Növbədə'),
+        ('sending', 'Göndərilir'),
+        ('sent', 'Göndərildi'),
+        ('dead', 'Göndərilə bilmədi'),
+    )
+
+    category = models.CharField(max_length=50, blank=True, default='')
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True, default='')
+    from_email = models.CharField(max_length=255, blank=True, default='')
+    to = models.JSONField(default=list)
+    # [{"filename": ..., "mimetype": ..., "content": <base64>}]
+    attachments = models.JSONField(default=list, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{', '.join(self.to)} - {self.subject} ({self.status})"
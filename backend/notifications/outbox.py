@@ -0,0 +1,197 @@
+"""
+Persistent outbound email queue.
+
+Callers use `queue_email` / `queue_email_message` instead of `send_mail()` /
+`EmailMessage.send()`, so a slow or failing mail server never blocks a request.
+`manage.py run_email_worker` claims due rows and delivers them in batches over
+a single `get_connection()`, retrying failures with exponential backoff and
+dead-lettering them after EMAIL_OUTBOX_MAX_ATTEMPTS.
+"""
+import base64
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+def _default_from_email():
+    return settings.DEFAULT_FROM_EMAIL or 'noreply@invoiceaz.com'
+
+
+def queue_email(subject, body, to, from_email=None, attachments=None, category=''):
+    """
+    Store an email in the outbox. `attachments` is a list of
+    (filename, content_bytes, mimetype) tuples, as with EmailMessage.attach().
+    """
+    if isinstance(to, str):
+        to = [to]
+    outbound = OutboundEmail.objects.create(
+        category=category,
+        subject=subject[:255],
+        body=body,
+        from_email=from_email or _default_from_email(),
+        to=list(to),
+        attachments=[
+            {
+                'filename': filename,
+                'mimetype': mimetype or 'application/octet-stream',
+                'content': base64.b64encode(
+                    content.encode('utf-8') if isinstance(content, str) else content
+                ).decode('ascii'),
+            }
+            for filename, content, mimetype in (attachments or [])
+        ],
+    )
+    if getattr(settings, 'EMAIL_OUTBOX_EAGER', False):
+        transaction.on_commit(lambda: deliver_outbound_emails(claim_outbound_emails(ids=[outbound.pk])))
+    return outbound
+
+
+def queue_emails(messages, category=''):
+    """Queue many plain (subject, body, to) emails with a single INSERT."""
+    from_email = _default_from_email()
+    created = OutboundEmail.objects.bulk_create([
+        OutboundEmail(
+            category=category,
+            subject=subject[:255],
+            body=body,
+            from_email=from_email,
+            to=[to] if isinstance(to, str) else list(to),
+        )
+        for subject, body, to in messages
+    ])
+    if created and getattr(settings, 'EMAIL_OUTBOX_EAGER', False):
+        ids = [outbound.pk for outbound in created]
+        transaction.on_commit(lambda: deliver_outbound_emails(claim_outbound_emails(limit=len(ids), ids=ids)))
+    return created
+
+
+def queue_email_message(message, category=''):
+    """Queue an already built EmailMessage (body, recipients and attachments are kept)."""
+    return queue_email(
+        message.subject,
+        message.body,
+        message.to,
+        from_email=message.from_email,
+        attachments=[a for a in message.attachments if isinstance(a, tuple)],
+        category=category,
+    )
+
+
+def build_message(outbound, connection=None):
+    message = EmailMessage(
+        outbound.subject,
+        outbound.body,
+        outbound.from_email or _default_from_email(),
+        outbound.to,
+        connection=connection,
+    )
+    for attachment in outbound.attachments:
+        message.attach(
+            attachment['filename'],
+            base64.b64decode(attachment['content']),
+            attachment.get('mimetype'),
+        )
+    return message
+
+
+def claim_outbound_emails(limit=50, ids=None):
+    """Atomically move up to `limit` due pending emails to 'sending' and return their ids."""
+    candidates = OutboundEmail.objects.filter(status='pending', next_attempt_at__lte=timezone.now())
+    if ids is not None:
+        candidates = candidates.filter(pk__in=ids)
+    candidates = candidates.order_by('next_attempt_at').values_list('id', flat=True)[:limit]
+
+    claimed = []
+    for email_id in list(candidates):
+        # Conditional UPDATE: only one worker can win the pending -> sending transition.
+        # The attempt is counted here, so a message that kills its worker still gets dead-lettered
+        if OutboundEmail.objects.filter(pk=email_id, status='pending').update(
+            status='sending', locked_at=timezone.now(), attempts=F('attempts') + 1
+        ):
+            claimed.append(email_id)
+    return claimed
+
+
+def requeue_stale_outbound_emails(timeout_seconds=600):
+    """Release emails left in 'sending' by a crashed worker (or dead-letter them after the last attempt)."""
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+    stale = OutboundEmail.objects.filter(status='sending', locked_at__lt=cutoff)
+    stale.filter(attempts__gte=max_attempts).update(
+        status='dead', locked_at=None, last_error='Worker timed out'
+    )
+    return stale.filter(attempts__lt=max_attempts).update(status='pending', locked_at=None)
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2*base, 4*base, ... capped at EMAIL_OUTBOX_BACKOFF_MAX."""
+    base = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_BASE', 30)
+    cap = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_MAX', 3600)
+    return timedelta(seconds=min(base * (2 ** max(attempts - 1, 0)), cap))
+
+
+def _mark_failed(outbound, error):
+    # attempts was already counted when the email was claimed
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    outbound.last_error = str(error)
+    outbound.locked_at = None
+    if outbound.attempts >= max_attempts:
+        outbound.status = 'dead'
+    else:
+        outbound.status = 'pending'
+        outbound.next_attempt_at = timezone.now() + retry_delay(outbound.attempts)
+    outbound.save(update_fields=['status', 'attempts', 'last_error', 'locked_at', 'next_attempt_at'])
+    print(f"Outbound email {outbound.pk} error: {error}")
+
+
+def deliver_outbound_emails(email_ids, connection=None):
+    """
+    Send claimed emails over one mail connection. Returns (sent, failed).
+    Failed emails are rescheduled with backoff or dead-lettered; never raises.
+    """
+    if not email_ids:
+        return 0, 0
+
+    outbound_emails = list(OutboundEmail.objects.filter(pk__in=email_ids, status='sending'))
+    connection = connection or get_connection(fail_silently=False)
+    sent_ids = []
+    failed = 0
+
+    try:
+        connection.open()
+    except Exception as e:
+        for outbound in outbound_emails:
+            _mark_failed(outbound, e)
+        return 0, len(outbound_emails)
+
+    try:
+        for outbound in outbound_emails:
+            try:
+                connection.send_messages([build_message(outbound, connection)])
+                sent_ids.append(outbound.pk)
+            except Exception as e:
+                _mark_failed(outbound, e)
+                failed += 1
+                # The server may have dropped us; start the rest of the batch on a fresh connection
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception as reopen_error:
+                    print(f"Mail connection error: {reopen_error}")
+    finally:
+        try:
+            connection.close()
+        except Exception as e:
+            print(f"Mail connection close error: {e}")
+
+    if sent_ids:
+        OutboundEmail.objects.filter(pk__in=sent_ids).update(
+            status='sent', sent_at=timezone.now(), locked_at=None, last_error=''
+        )
+    return len(sent_ids), failed
@@ -4,7 +4,7 @@ from users.models import Business
 from clients.models import Client
 from invoices.models import Invoice, Payment, Expense
 from inventory.models import Product
-from .utils import create_notification
+from .utils import create_notification, create_notifications_bulk
 from .models import ActivityLog
 from .middleware import get_current_user
 
@@ -23,75 +23,68 @@ def business_created(sender, instance, created, **kwargs):
 @receiver(post_save, sender=Client)
 def client_created(sender, instance, created, **kwargs):
     if created:
-        create_notification(
-            user=instance.business.user,
-            business=instance.business,
-            title="Yeni Müştəri",
-            message=f"'{instance.name}' adlı yeni müştəri əlavə edildi.",
-            type='info',
-            setting_key='client_created',
-            category='clients'
+        create_notifications_bulk(
+            [
+                (instance.business.user_id, {'message': f"'{instance.name}' adlı yeni müştəri əlavə edildi."}),
+                (instance.assigned_to_id, {
+                    'title': "Sizə Müştəri Təyin Edildi",
+                    'message': f"'{instance.name}' adlı yeni müştəri sizə təyin edildi.",
+                }),
+            ],
+            {
+                'business': instance.business,
+                'title': "Yeni Müştəri",
+                'type': 'info',
+                'setting_key': 'client_created',
+                'category': 'clients',
+            }
         )
-        if instance.assigned_to:
-            create_notification(
-                user=instance.assigned_to,
-                business=instance.business,
-                title="Sizə Müştəri Təyin Edildi",
-                message=f"'{instance.name}' adlı yeni müştəri sizə təyin edildi.",
-                type='info',
-                setting_key='client_created',
-                category='clients'
-            )
 
 @receiver(post_save, sender=Invoice)
 def invoice_created(sender, instance, created, **kwargs):
     if created:
-        create_notification(
-            user=instance.business.user,
-            business=instance.business,
-            title="Yeni Faktura",
-            message=f"#{instance.invoice_number} nömrəli yeni faktura yaradıldı.",
-            type='info',
-            link='/invoices',
-            setting_key='invoice_created',
-            category='finance'
+        assigned_to = instance.client.assigned_to_id if instance.client else None
+        create_notifications_bulk(
+            [
+                (instance.business.user_id, {'message': f"#{instance.invoice_number} nömrəli yeni faktura yaradıldı."}),
+                (assigned_to, {
+                    'title': "Yeni Faktura Yaradıldı",
+                    'message': f"Müştəriniz {instance.client.name} üçün #{instance.invoice_number} nömrəli yeni faktura yaradıldı.",
+                }),
+            ],
+            {
+                'business': instance.business,
+                'title': "Yeni Faktura",
+                'type': 'info',
+                'link': '/invoices',
+                'setting_key': 'invoice_created',
+                'category': 'finance',
+            }
         )
-        if instance.client and instance.client.assigned_to:
-            create_notification(
-                user=instance.client.assigned_to,
-                business=instance.business,
-                title="Yeni Faktura Yaradıldı",
-                message=f"Müştəriniz {instance.client.name} üçün #{instance.invoice_number} nömrəli yeni faktura yaradıldı.",
-                type='info',
-                link='/invoices',
-                setting_key='invoice_created',
-                category='finance'
-            )
 
 @receiver(post_save, sender=Payment)
 def payment_received(sender, instance, created, **kwargs):
     if created:
-        create_notification(
-            user=instance.invoice.business.user,
-            business=instance.invoice.business,
-            title="Yeni Ödəniş",
-            message=f"#{instance.invoice.invoice_number} nömrəli faktura üzrə {instance.amount:.2f} AZN ödəniş qəbul edildi.",
-            type='success',
-            link='/invoices',
-            setting_key='payment_received',
-            category='finance'
+        invoice = instance.invoice
+        assigned_to = invoice.client.assigned_to_id if invoice.client else None
+        create_notifications_bulk(
+            [
+                (invoice.business.user_id, {
+                    'message': f"#{invoice.invoice_number} nömrəli faktura üzrə {instance.amount:.2f} AZN ödəniş qəbul edildi.",
+                }),
+                (assigned_to, {
+                    'message': f"Müştəriniz {invoice.client.name} tərəfindən #{invoice.invoice_number} nömrəli faktura üzrə {instance.amount:.2f} AZN ödəniş qəbul edildi.",
+                }),
+            ],
+            {
+                'business': invoice.business,
+                'title': "Yeni Ödəniş",
+                'type': 'success',
+                'link': '/invoices',
+                'setting_key': 'payment_received',
+                'category': 'finance',
+            }
         )
-        if instance.invoice.client and instance.invoice.client.assigned_to:
-            create_notification(
-                user=instance.invoice.client.assigned_to,
-                business=instance.invoice.business,
-                title="Yeni Ödəniş",
-                message=f"Müştəriniz {instance.invoice.client.name} tərəfindən #{instance.invoice.invoice_number} nömrəli faktura üzrə {instance.amount:.2f} AZN ödəniş qəbul edildi.",
-                type='success',
-                link='/invoices',
-                setting_key='payment_received',
-                category='finance'
-            )
 
 # ============================================================
 # AUDIT TRAIL / ACTIVITY LOGGING SIGNALS
@@ -113,16 +106,8 @@ def _log(business, action, module, description):
             
         user_role = None
         if business and user:
-            from users.models import TeamMember
-            try:
-                member = TeamMember.objects.filter(owner=business.user, user=user).first()
-                if member:
-                    user_role = member.role
-            except Exception:
-                pass
-                
-            if not user_role and hasattr(business, 'user') and user == business.user:
-                user_role = 'OWNER'
+            from users.context import get_owner_role
+            user_role = get_owner_role(user, business.user_id)
                     
         from django.db import transaction
         with transaction.atomic():
@@ -1,8 +1,19 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 from users.models import Business
-from notifications.models import Notification, NotificationSetting, ActivityLog
-from notifications.utils import create_notification, log_activity
+from notifications.models import Notification, NotificationSetting, ActivityLog, OutboundEmail
+from notifications.utils import create_notification, create_notifications_bulk, log_activity
+from inventory.models import Product
+from users.models import TeamMember
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from notifications.outbox import queue_email, claim_outbound_emails, deliver_outbound_emails, requeue_stale_outbound_emails
 
 User = get_user_model()
 
@@ -57,3 +68,165 @@ class NotificationsModelTestCase(TestCase):
         )
         self.assertEqual(log.action, 'UPDATE')
         self.assertEqual(log.user_role, 'OWNER')
+
+
+@override_settings(EMAIL_OUTBOX_EAGER=False)
+class CreateNotificationsBulkTestCase(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@bulk.com', password='password')
+        self.business = Business.objects.create(name='Bulk Business', user=self.owner)
+        self.users = [User.objects.create_user(email=f'user{i}@bulk.com', password='password') for i in range(5)]
+        Notification.objects.all().delete()
+        self.payload = {
+            'business': self.business,
+            'title': 'Ödəniş',
+            'message': 'Ödəniş alındı',
+            'type': 'success',
+            'link': '/invoices',
+            'setting_key': 'payment_received',
+            'category': 'finance',
+        }
+
+    def test_bulk_uses_constant_queries(self):
+        with CaptureQueriesContext(connection) as per_user:
+            for user in self.users:
+                create_notification(user, **self.payload)
+        Notification.objects.all().delete()
+        OutboundEmail.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as bulk:
+            create_notifications_bulk(self.users, self.payload)
+
+        # settings lookup + notifications INSERT + outbox INSERT
+        self.assertEqual(len(bulk.captured_queries), 3)
+        self.assertEqual(len(per_user.captured_queries), 3 * len(self.users))
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(OutboundEmail.objects.count(), 5)
+
+    def test_overrides_settings_and_missing_recipients(self):
+        NotificationSetting.objects.update_or_create(user=self.users[0], defaults={'in_app_payment_received': False})
+        NotificationSetting.objects.update_or_create(user=self.users[1], defaults={'email_payment_received': False})
+
+        created = create_notifications_bulk(
+            [self.users[0], (self.users[1].pk, {'message': 'Sizin müştəri ödədi'}), None],
+            self.payload
+        )
+
+        self.assertEqual(len(created), 1)
+        self.assertEqual(created[0].user_id, self.users[1].pk)
+        self.assertEqual(created[0].message, 'Sizin müştəri ödədi')
+        self.assertEqual(created[0].business_id, self.business.pk)
+        self.assertEqual(list(OutboundEmail.objects.values_list('to', flat=True)), [[self.users[0].email]])
+
+    def test_without_setting_key_only_in_app(self):
+        payload = {**self.payload, 'setting_key': None}
+        with CaptureQueriesContext(connection) as ctx:
+            create_notifications_bulk(self.users, payload)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_low_stock_fans_out_to_managers_in_one_batch(self):
+        for user, role in zip(self.users, ['MANAGER', 'INVENTORY_MANAGER', 'SALES_REP']):
+            TeamMember.objects.create(owner=self.owner, business=self.business, user=user, role=role)
+        product = Product.objects.create(business=self.business, name='Widget', sku='W-1', stock_quantity=10, min_stock_level=2)
+        Notification.objects.all().delete()
+
+        product.stock_quantity = 1
+        with CaptureQueriesContext(connection) as ctx:
+            product.save()
+
+        notified = set(Notification.objects.filter(category='inventory').values_list('user_id', flat=True))
+        self.assertEqual(notified, {self.owner.pk, self.users[0].pk, self.users[1].pk})
+        notification_inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "notifications_notification"')]
+        self.assertEqual(len(notification_inserts), 1)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_OUTBOX_EAGER=False,
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_BACKOFF_BASE=60,
+)
+class OutboundEmailTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='outbox@notifications.com', password='password')
+
+    def _run_worker(self):
+        call_command('run_email_worker', '--once', stdout=StringIO())
+
+    def test_create_notification_queues_email_instead_of_sending(self):
+        NotificationSetting.objects.create(user=self.user, email_payment_received=True)
+        create_notification(self.user, 'Ödəniş', 'Ödəniş alındı', setting_key='payment_received', category='payment')
+
+        self.assertEqual(len(mail.outbox), 0)
+        outbound = OutboundEmail.objects.get()
+        self.assertEqual(outbound.to, [self.user.email])
+        self.assertEqual(outbound.subject, 'InvoiceAZ: Ödəniş')
+
+        self._run_worker()
+        self.assertEqual(len(mail.outbox), 1)
+        outbound.refresh_from_db()
+        self.assertEqual(outbound.status, 'sent')
+        self.assertEqual(outbound.attempts, 1)
+        self.assertIsNotNone(outbound.sent_at)
+
+    def test_batch_reuses_one_connection_and_keeps_attachments(self):
+        for i in range(3):
+            queue_email(f'Subject {i}', 'Body', [f'to{i}@example.com'], attachments=[('a.pdf', b'%PDF-1.4', 'application/pdf')])
+
+        with mock.patch('notifications.outbox.get_connection', wraps=mail.get_connection) as get_connection:
+            self._run_worker()
+        get_connection.assert_called_once()
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].attachments[0], ('a.pdf', b'%PDF-1.4', 'application/pdf'))
+        self.assertEqual(OutboundEmail.objects.filter(status='sent').count(), 3)
+
+    def test_failure_backs_off_exponentially_then_dead_letters(self):
+        outbound = queue_email('Subject', 'Body', ['to@example.com'])
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('SMTP down')):
+            deliver_outbound_emails(claim_outbound_emails())
+            outbound.refresh_from_db()
+            self.assertEqual(outbound.status, 'pending')
+            self.assertEqual(outbound.attempts, 1)
+            self.assertEqual(outbound.last_error, 'SMTP down')
+            first_delay = (outbound.next_attempt_at - timezone.now()).total_seconds()
+            self.assertAlmostEqual(first_delay, 60, delta=5)
+
+            # Not due yet: the worker leaves it alone
+            self.assertEqual(claim_outbound_emails(), [])
+
+            OutboundEmail.objects.filter(pk=outbound.pk).update(next_attempt_at=timezone.now())
+            deliver_outbound_emails(claim_outbound_emails())
+            outbound.refresh_from_db()
+            second_delay = (outbound.next_attempt_at - timezone.now()).total_seconds()
+            self.assertAlmostEqual(second_delay, 120, delta=5)
+
+            OutboundEmail.objects.filter(pk=outbound.pk).update(next_attempt_at=timezone.now())
+            deliver_outbound_emails(claim_outbound_emails())
+            outbound.refresh_from_db()
+
+        self.assertEqual(outbound.status, 'dead')
+        self.assertEqual(outbound.attempts, 3)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_email_that_crashes_the_worker_is_dead_lettered(self):
+        outbound = queue_email('Subject', 'Body', ['to@example.com'])
+        with self.settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2):
+            for expected in ('pending', 'dead'):
+                # Claimed, then the worker dies before the send returns
+                self.assertEqual(claim_outbound_emails(), [outbound.pk])
+                OutboundEmail.objects.filter(pk=outbound.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+                requeue_stale_outbound_emails()
+                outbound.refresh_from_db()
+                self.assertEqual(outbound.status, expected)
+        self.assertEqual(outbound.attempts, 2)
+
+    def test_eager_mode_sends_after_commit(self):
+        with self.settings(EMAIL_OUTBOX_EAGER=True), self.captureOnCommitCallbacks(execute=True):
+            outbound = queue_email('Subject', 'Body', ['to@example.com'])
+
+        self.assertEqual(len(mail.outbox), 1)
+        outbound.refresh_from_db()
+        self.assertEqual(outbound.status, 'sent')
@@ -1,48 +1,118 @@
-from django.core.mail import send_mail
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from .models import Notification, NotificationSetting, ActivityLog
+from .outbox import queue_emails
 
-def create_notification(user, title, message, type='info', link=None, setting_key=None, business=None, category=None):
+def notification_email(title, message, link=None):
+    """Return (subject, body) of the email sent alongside a notification."""
+    subject = f"InvoiceAZ: {title}"
+    body = f"{message}\n\nİzləmək üçün daxil olun: {getattr(settings, 'FRONTEND_URL', 'https://invoiceaz.vercel.app')}{link if link else ''}"
+    return subject, body
+
+def _notification_preferences(user_ids, setting_key):
     """
-    Utility function to create a new notification for a user.
-    Checks user's NotificationSetting if setting_key is provided.
-    Sends email if email setting is enabled.
+    Map user id -> (in_app_enabled, email or None) for `setting_key` with one query.
+    Users without a NotificationSetting row get the model defaults.
     """
-    in_app_enabled = True
-    email_enabled = False
+    field_names = {f.name for f in NotificationSetting._meta.get_fields()}
+    in_app_field = f"in_app_{setting_key}"
+    email_field = f"email_{setting_key}"
+    columns = ['id', 'email']
+    columns += [f"notification_settings__{name}" for name in (in_app_field, email_field) if name in field_names]
+
+    defaults = {
+        name: NotificationSetting._meta.get_field(name).default
+        for name in (in_app_field, email_field) if name in field_names
+    }
 
-    if setting_key:
-        settings_obj, _ = NotificationSetting.objects.get_or_create(user=user)
-        in_app_enabled = getattr(settings_obj, f"in_app_{setting_key}", True)
-        email_enabled = getattr(settings_obj, f"email_{setting_key}", False)
+    preferences = {}
+    for row in get_user_model().objects.filter(pk__in=user_ids).values(*columns):
+        def enabled(name, missing):
+            if name not in field_names:
+                return missing
+            value = row[f"notification_settings__{name}"]
+            return defaults[name] if value is None else value
 
-    notification = None
-    if in_app_enabled:
-        notification = Notification.objects.create(
-            user=user,
-            business=business,
-            title=title,
-            message=message,
-            type=type,
-            category=category,
-            link=link
+        preferences[row['id']] = (
+            enabled(in_app_field, True),
+            row['email'] if enabled(email_field, False) else None,
         )
+    return preferences
+
+def create_notifications_bulk(recipients, payload):
+    """
+    Create the same notification for many users at once.
+
+    `recipients` holds users (or user ids), optionally as (user, overrides)
+    pairs whose overrides replace payload keys for that user, e.g. a differently
+    worded message for the assigned sales rep. `payload` takes the keyword
+    arguments of create_notification: title, message, type, link, setting_key,
+    business and category.
+
+    NotificationSetting is resolved for all recipients in one query, the
+    notifications are inserted with one bulk_create and the emails are queued
+    with one INSERT. Returns the created notifications.
+    """
+    entries = []
+    for recipient in recipients:
+        user, overrides = recipient if isinstance(recipient, tuple) else (recipient, {})
+        if user is None:
+            continue
+        entries.append((getattr(user, 'pk', user), {**payload, **overrides}))
+    if not entries:
+        return []
 
-    if email_enabled and user.email:
+    setting_keys = {data.get('setting_key') for _, data in entries} - {None}
+    preferences = {
+        key: _notification_preferences({user_id for user_id, data in entries if data.get('setting_key') == key}, key)
+        for key in setting_keys
+    }
+
+    notifications, emails = [], []
+    for user_id, data in entries:
+        in_app_enabled, email = True, None
+        if data.get('setting_key'):
+            in_app_enabled, email = preferences[data['setting_key']].get(user_id, (True, None))
+
+        business = data.get('business')
+        if in_app_enabled:
+            notifications.append(Notification(
+                user_id=user_id,
+                business_id=getattr(business, 'pk', business),
+                title=data['title'],
+                message=data['message'],
+                type=data.get('type', 'info'),
+                category=data.get('category'),
+                link=data.get('link'),
+            ))
+        if email:
+            subject, body = notification_email(data['title'], data['message'], data.get('link'))
+            emails.append((subject, body, [email]))
+
+    created = Notification.objects.bulk_create(notifications)
+    if emails:
         try:
-            subject = f"InvoiceAZ: {title}"
-            email_body = f"{message}\n\nİzləmək üçün daxil olun: {getattr(settings, 'FRONTEND_URL', 'https://invoiceaz.vercel.app')}{link if link else ''}"
-            send_mail(
-                subject,
-                email_body,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=True,
-            )
+            queue_emails(emails, category=payload.get('category') or 'notification')
         except Exception as e:
-            print(f"Error sending notification email: {e}")
+            print(f"Error queueing notification email: {e}")
+    return created
 
-    return notification
+def create_notification(user, title, message, type='info', link=None, setting_key=None, business=None, category=None):
+    """
+    Utility function to create a new notification for a user.
+    Checks user's NotificationSetting if setting_key is provided.
+    Queues an email (see notifications.outbox) if email setting is enabled.
+    """
+    created = create_notifications_bulk([user], {
+        'title': title,
+        'message': message,
+        'type': type,
+        'link': link,
+        'setting_key': setting_key,
+        'business': business,
+        'category': category,
+    })
+    return created[0] if created else None
 
 def log_activity(business, user, action, module, description, details=None, ip_address=None):
     """
@@ -50,13 +120,8 @@ def log_activity(business, user, action, module, description, details=None, ip_a
     """
     user_role = None
     if user and business:
-        from users.models import TeamMember
-        try:
-            member = TeamMember.objects.get(owner=business.user, user=user)
-            user_role = member.role
-        except TeamMember.DoesNotExist:
-            if user == business.user:
-                user_role = 'OWNER'
+        from users.context import get_owner_role
+        user_role = get_owner_role(user, business.user_id)
     
     return ActivityLog.objects.create(
         business=business,
@@ -65,20 +65,14 @@ class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
             return ActivityLog.objects.none()
 
         # Only Owner or Manager should see this
-        user = self.request.user
-        from users.models import TeamMember, Business
-        
-        try:
-            business = Business.objects.get(id=business_id)
-        except Business.DoesNotExist:
+        from users.context import get_owner_role
+        from users.models import Business
+
+        owner_id = Business.objects.filter(id=business_id).values_list('user_id', flat=True).first()
+        if not owner_id:
             return ActivityLog.objects.none()
 
-        if user != business.user:
-            try:
-                member = TeamMember.objects.get(owner=business.user, user=user)
-                if member.role not in ['OWNER', 'MANAGER']:
-                    return ActivityLog.objects.none()
-            except TeamMember.DoesNotExist:
-                return ActivityLog.objects.none()
+        if get_owner_role(self.request.user, owner_id) not in ['OWNER', 'MANAGER']:
+            return ActivityLog.objects.none()
                 
         return ActivityLog.objects.filter(business_id=business_id)
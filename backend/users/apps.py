@@ -6,3 +6,5 @@ class UsersConfig(AppConfig):
 
     def ready(self):
         import users.signals  # noqa: F401
+        import users.storage_usage  # noqa: F401
+        import users.plan_usage  # noqa: F401
@@ -0,0 +1,68 @@
+"""
+Business context of an authenticated request: the active business (from the
+X-Business-ID header or ?business_id=), the caller's role in it and its owner.
+
+DRF authenticates inside the view, after Django middleware has run, so the
+context is resolved on first use and memoized on the underlying HttpRequest;
+every later caller in the same request (mixin, permissions, views, signal
+handlers) gets the same object. Resolving it costs one query: the business row
+with the caller's TeamMember role as a subquery. Memberships are not cached
+across requests, so a removed team member loses access on their next request
+in every worker.
+"""
+from collections import namedtuple
+
+from django.db.models import OuterRef, Subquery
+
+from .models import Business, TeamMember
+
+BusinessContext = namedtuple('BusinessContext', 'business role owner_id is_team_member')
+NO_BUSINESS = BusinessContext(None, None, None, False)
+
+
+def get_owner_role(user, owner_id):
+    """Role of `user` in the team of `owner_id` ('OWNER' for the owner), or None."""
+    if not user or not owner_id:
+        return None
+    role = TeamMember.objects.filter(user_id=user.pk, owner_id=owner_id).order_by('id').values_list('role', flat=True).first()
+    if not role and user.pk == owner_id:
+        role = 'OWNER'
+    return role
+
+
+def requested_business_id(request):
+    business_id = request.headers.get('X-Business-ID') or request.GET.get('business_id')
+    try:
+        return int(business_id) if business_id else None
+    except (TypeError, ValueError):
+        return None
+
+
+def get_business_context(request):
+    """Resolve (once per request) the active business, role and owner of an authenticated request."""
+    http_request = getattr(request, '_request', request)
+    user = getattr(request, 'user', None)
+    if not user or not user.is_authenticated:
+        return NO_BUSINESS
+
+    context = getattr(http_request, 'business_context', None)
+    if context is None:
+        context = _resolve(user, requested_business_id(http_request))
+        http_request.business_context = context
+    return context
+
+
+def _resolve(user, business_id):
+    if not business_id:
+        return NO_BUSINESS
+    member_role = TeamMember.objects.filter(business_id=OuterRef('pk'), user_id=user.pk).order_by('id').values('role')[:1]
+    business = (
+        Business.objects.select_related('user').filter(pk=business_id, is_active=True)
+        .annotate(member_role=Subquery(member_role)).first()
+    )
+    if not business:
+        return NO_BUSINESS
+    role = 'OWNER' if business.user_id == user.pk else business.member_role
+    if not role:
+        return NO_BUSINESS
+    return BusinessContext(business, role, business.user_id, role != 'OWNER')
@@ -0,0 +1,40 @@
+"""
+Recompute each user's storage ledger (User.storage_bytes) from the files on disk.
+Usage: python manage.py reconcile_storage                  # every user
+       python manage.py reconcile_storage --user 12        # one user
+       python manage.py reconcile_storage --dry-run        # only report drift
+
+The ledger is kept current by signals; run this after bulk changes that bypass
+them (queryset.update(), raw SQL, files removed from storage by hand).
+"""
+from django.core.management.base import BaseCommand
+
+from users.models import User
+from users.storage_usage import scan_storage_bytes
+
+
+class Command(BaseCommand):
+    help = 'Correct drift between the storage ledger and the uploaded files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', help='Only reconcile this user id (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing it')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk').only('pk', 'email', 'avatar', 'storage_bytes')
+        if options['user']:
+            users = users.filter(pk__in=options['user'])
+
+        checked = drifted = 0
+        for user in users.iterator():
+            checked += 1
+            actual = scan_storage_bytes(user)
+            if actual == user.storage_bytes:
+                continue
+            drifted += 1
+            self.stdout.write(f'{user.email}: ledger {user.storage_bytes} B, files {actual} B')
+            if not options['dry_run']:
+                User.objects.filter(pk=user.pk).update(storage_bytes=actual)
+
+        action = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'Success: Checked {checked} users. {action} {drifted} drifted ledgers.'))
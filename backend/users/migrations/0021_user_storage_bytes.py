@@ -0,0 +1,55 @@
+# Generated by Django 5.2.11 on 2026-10-17 14:13
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def _size(name):
+    if not name:
+        return 0
+    try:
+        return default_storage.size(name)
+    except (OSError, ValueError, NotImplementedError):
+        return 0
+
+
+def fill_storage_bytes(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Business = apps.get_model('users', 'Business')
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Payment = apps.get_model('invoices', 'Payment')
+    Expense = apps.get_model('invoices', 'Expense')
+
+    totals = {}
+    files = [
+        (User.objects.all(), 'id', 'avatar'),
+        (Business.objects.all(), 'user_id', 'logo'),
+        (Invoice.objects.filter(is_deleted=False), 'business__user_id', 'pdf_file'),
+        (Payment.objects.filter(is_deleted=False), 'invoice__business__user_id', 'receipt_file'),
+        (Expense.objects.filter(is_deleted=False), 'business__user_id', 'attachment'),
+    ]
+    for queryset, owner, field in files:
+        rows = queryset.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(owner, field)
+        for user_id, name in rows.iterator():
+            totals[user_id] = totals.get(user_id, 0) + _size(name)
+
+    for user_id, total in totals.items():
+        if total:
+            User.objects.filter(pk=user_id).update(storage_bytes=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0020_add_full_plan_features'),
+        ('invoices', '0020_invoice_client_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='storage_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_storage_bytes, migrations.RunPython.noop),
+    ]
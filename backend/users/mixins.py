@@ -1,4 +1,4 @@
-from .models import Business, TeamMember
+from .context import get_business_context
 from rest_framework.exceptions import ValidationError
 from django.db.models import Q
 
@@ -6,6 +6,7 @@ class BusinessContextMixin:
     """
     Mixin to retrieve the active business from the X-Business-ID header.
     Must be used in a ViewSet where request.user is authenticated.
+    The lookup itself is done once per request by users.context.get_business_context.
     """
     def get_active_business(self):
         # Return cached valid business if already resolved
@@ -22,42 +23,15 @@ class BusinessContextMixin:
         except ImportError:
             pass
 
-        business_id = self.request.headers.get('X-Business-ID')
-        if not business_id:
-            business_id = self.request.query_params.get('business_id')
-
-        if not business_id:
+        context = get_business_context(self.request)
+        if not context.business:
             return None
 
-        try:
-            # First, try to find if the user owns this business directly
-            business = Business.objects.get(id=business_id, user=self.request.user, is_active=True)
-            self.request._active_business = business
-            self.request._is_team_member = False
-            return business
-        except Business.DoesNotExist:
-            pass
-            
-        # If not the owner, check if they are a team member assigned to THIS specific business
-        try:
-            business = Business.objects.filter(id=business_id, is_active=True).first()
-            if not business:
-                return None
-
-            # Check if user is a team member for this specific business
-            team_member = TeamMember.objects.filter(
-                business=business, user=self.request.user
-            ).first()
-            
-            if team_member:
-                self.request._active_business = business
-                self.request._is_team_member = True
-                self.request._team_role = team_member.role
-                return business
-                
-            return None
-        except Business.DoesNotExist:
-            return None
+        self.request._active_business = context.business
+        self.request._is_team_member = context.is_team_member
+        if context.is_team_member:
+            self.request._team_role = context.role
+        return context.business
 
     def get_queryset(self):
         """
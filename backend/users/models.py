@@ -137,6 +137,9 @@ class User(AbstractUser):
     referral_count = models.PositiveIntegerField(default=0)
     referral_rewarded = models.BooleanField(default=False)
 
+    # Bytes of uploaded files owned by this user (kept by users.storage_usage)
+    storage_bytes = models.BigIntegerField(default=0)
+
     # Timestamps (AbstractUser has date_joined, but docs asked for created_at/updated_at)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -1,29 +1,23 @@
 from rest_framework import permissions
 
+from .context import get_business_context
+
 class IsRoleAuthorized(permissions.BasePermission):
     """
     Checks if the user has a sufficient role to perform an action on a model.
-    Assumes `request._team_role` and `request._is_team_member` are set by BusinessContextMixin.
-    If they are not set, it assumes the user is the owner and allows access.
+    The role comes from the request's business context (users.context); owners and
+    requests without an active team business are allowed.
     """
     def has_permission(self, request, view):
-        # Determine role from active business or fallback
-        is_team_member = getattr(request, '_is_team_member', None)
-        role = getattr(request, '_team_role', None)
-        
-        # If mixin hasn't run yet, try to run its helper logic if possible
-        if is_team_member is None and hasattr(view, 'get_active_business'):
-            view.get_active_business()
-            is_team_member = getattr(request, '_is_team_member', False)
-            role = getattr(request, '_team_role', 'SALES_REP')
+        # Role in the active business, resolved once per request
+        context = get_business_context(request)
 
-        # Allow owners to do whatever
-        if is_team_member is False:
+        # Allow owners (and requests without a team business) to do whatever
+        if not context.is_team_member:
             return True
-            
+
         # Default role for team members is SALES_REP if not specified
-        if role is None:
-            role = 'SALES_REP'
+        role = context.role or 'SALES_REP'
         
         # Determine model name from serializer
         model = getattr(getattr(view, 'serializer_class', None), 'Meta', None)
@@ -3,10 +3,7 @@ Plan limits configuration and enforcement utilities.
 Defines resource limits per membership tier and provides
 helper functions to check if a user can create new resources.
 """
-import os
-from django.conf import settings
-from django.utils import timezone
-from django.db.models import Count
+from users.plan_usage import get_business_usage, get_owner_usage
 
 
 def get_plan_limits(user):
@@ -59,13 +56,7 @@ def check_invoice_limit(user, business):
     if not plan:
         return {'allowed': True, 'current': 0, 'limit': None}
 
-    from invoices.models import Invoice
-    now = timezone.now()
-    current_count = Invoice.all_objects.filter(
-        business=business,
-        created_at__year=now.year,
-        created_at__month=now.month
-    ).count()
+    current_count = get_business_usage([business.pk])[business.pk]['invoices_created_this_month']
     return _check_limit(plan.invoices_per_month, current_count)
 
 
@@ -79,11 +70,10 @@ def check_client_limit(user, business=None):
     if not plan:
         return {'allowed': True, 'current': 0, 'limit': None}
 
-    from clients.models import Client
     if business:
-        current_count = Client.objects.filter(business=business).count()
+        current_count = get_business_usage([business.pk])[business.pk]['clients']
     else:
-        current_count = Client.objects.filter(business__user=owner).count()
+        current_count = get_owner_usage(owner)['clients']
     return _check_limit(plan.clients_limit, current_count)
 
 
@@ -97,13 +87,7 @@ def check_expense_limit(user, business):
     if not plan:
         return {'allowed': True, 'current': 0, 'limit': None}
 
-    from invoices.models import Expense
-    now = timezone.now()
-    current_count = Expense.all_objects.filter(
-        business=business,
-        date__year=now.year,
-        date__month=now.month
-    ).count()
+    current_count = get_business_usage([business.pk])[business.pk]['expenses_dated_this_month']
     return _check_limit(plan.expenses_per_month, current_count)
 
 
@@ -116,8 +100,7 @@ def check_business_limit(user):
     if not plan:
         return {'allowed': True, 'current': 0, 'limit': None}
 
-    from users.models import Business
-    current_count = Business.objects.filter(user=user).count()
+    current_count = get_owner_usage(user)['businesses']
     return _check_limit(plan.businesses_limit, current_count)
 
 
@@ -131,8 +114,7 @@ def check_product_limit(user, business):
     if not plan:
         return {'allowed': True, 'current': 0, 'limit': None}
 
-    from inventory.models import Product
-    current_count = Product.objects.filter(business=business).count()
+    current_count = get_business_usage([business.pk])[business.pk]['products']
     return _check_limit(plan.products_limit, current_count)
 
 
@@ -146,8 +128,7 @@ def check_warehouse_limit(user, business):
     if not plan:
         return {'allowed': True, 'current': 0, 'limit': None}
 
-    from inventory.models import Warehouse
-    current_count = Warehouse.objects.filter(business=business).count()
+    current_count = get_business_usage([business.pk])[business.pk]['warehouses']
     return _check_limit(plan.warehouses_limit, current_count)
 
 
@@ -161,13 +142,7 @@ def check_purchase_order_limit(user, business):
     if not plan:
         return {'allowed': True, 'current': 0, 'limit': None}
 
-    from inventory.models import PurchaseOrder
-    now = timezone.now()
-    current_count = PurchaseOrder.objects.filter(
-        business=business,
-        created_at__year=now.year,
-        created_at__month=now.month
-    ).count()
+    current_count = get_business_usage([business.pk])[business.pk]['purchase_orders_this_month']
     return _check_limit(plan.purchase_orders_per_month, current_count)
 
 
@@ -180,52 +155,14 @@ def check_team_member_limit(user, business=None):
     if not plan:
         return {'allowed': True, 'current': 0, 'limit': None}
 
-    from users.models import TeamMember
-    current_count = TeamMember.objects.filter(owner=user).count()
+    current_count = get_owner_usage(user)['team_members']
     return _check_limit(plan.team_members_limit, current_count)
 
 
 def calculate_storage_usage_mb(user):
-    """Calculate total storage used by a user across all file fields (in MB)."""
-    from users.models import Business
-    from invoices.models import Invoice, Payment, Expense
-
-    total_bytes = 0
-    media_root = str(settings.MEDIA_ROOT)
-
-    def _file_size(file_field):
-        """Get file size in bytes, handling missing files gracefully."""
-        if not file_field:
-            return 0
-        try:
-            path = os.path.join(media_root, str(file_field))
-            if os.path.isfile(path):
-                return os.path.getsize(path)
-        except (OSError, ValueError):
-            pass
-        return 0
-
-    # User avatar
-    total_bytes += _file_size(user.avatar)
-
-    # Business logos
-    businesses = Business.objects.filter(user=user)
-    for biz in businesses:
-        total_bytes += _file_size(biz.logo)
-
-    # Invoice PDFs
-    for pdf in Invoice.objects.filter(business__user=user).exclude(pdf_file='').exclude(pdf_file__isnull=True).values_list('pdf_file', flat=True):
-        total_bytes += _file_size(pdf)
-
-    # Payment receipts
-    for receipt in Payment.objects.filter(invoice__business__user=user).exclude(receipt_file='').exclude(receipt_file__isnull=True).values_list('receipt_file', flat=True):
-        total_bytes += _file_size(receipt)
-
-    # Expense attachments
-    for attachment in Expense.objects.filter(business__user=user).exclude(attachment='').exclude(attachment__isnull=True).values_list('attachment', flat=True):
-        total_bytes += _file_size(attachment)
-
-    return round(total_bytes / (1024 * 1024), 2)
+    """Total storage used by a user across all file fields (in MB), read from the storage ledger."""
+    from users.storage_usage import get_storage_bytes
+    return round(get_storage_bytes(user) / (1024 * 1024), 2)
 
 
 def check_storage_limit(user, additional_bytes=0):
@@ -263,14 +200,26 @@ def check_feature(user, feature_name, business=None):
     return getattr(plan, feature_name, False)
 
 
-def get_full_plan_status(user, business_id=None):
-    """Get complete plan status with all limits and current usage."""
-    from invoices.models import Invoice, Expense
-    from clients.models import Client
-    from users.models import Business, SubscriptionPlan, TeamMember
-    from inventory.models import Product, Warehouse, PurchaseOrder
+def get_full_plan_status(user, business_id=None, request=None):
+    """
+    Get complete plan status with all limits and current usage.
+    Usage counters come from the plan_usage cache; with `request` the result is
+    also memoized for the rest of that request.
+    """
+    if request is None:
+        return _build_plan_status(user, business_id)
 
-    now = timezone.now()
+    memo = getattr(request, '_plan_status_memo', None)
+    if memo is None:
+        memo = request._plan_status_memo = {}
+    key = (user.pk, str(business_id) if business_id else None)
+    if key not in memo:
+        memo[key] = _build_plan_status(user, business_id)
+    return memo[key]
+
+
+def _build_plan_status(user, business_id=None):
+    from users.models import Business, TeamMember
 
     # Detect organization owner
     organization_owner = user
@@ -297,30 +246,8 @@ def get_full_plan_status(user, business_id=None):
             'usage': {}
         }
 
-    active_businesses = Business.objects.filter(user=organization_owner)
-
     # Current usage
-    invoices_this_month = Invoice.objects.filter(
-        business__user=organization_owner,
-        created_at__year=now.year,
-        created_at__month=now.month
-    ).count()
-    expenses_this_month = Expense.objects.filter(
-        business__user=organization_owner,
-        date__year=now.year,
-        date__month=now.month
-    ).count()
-    purchase_orders_this_month = PurchaseOrder.objects.filter(
-        business__user=organization_owner,
-        created_at__year=now.year,
-        created_at__month=now.month
-    ).count()
-
-    total_clients = Client.objects.filter(business__user=organization_owner).count()
-    total_businesses = active_businesses.count()
-    total_products = Product.objects.filter(business__user=organization_owner).count()
-    total_warehouses = Warehouse.objects.filter(business__user=organization_owner).count()
-    total_team_members = TeamMember.objects.filter(owner=organization_owner).count()
+    usage = get_owner_usage(organization_owner)
 
     is_demo = user.email == 'demo_user@invoice.az'
     is_privileged = user.is_superuser or user.is_staff or is_demo
@@ -384,14 +311,14 @@ def get_full_plan_status(user, business_id=None):
             'vip_support': _val(plan.has_vip_support),
         },
         'usage': {
-            'invoices_this_month': invoices_this_month,
-            'clients': total_clients,
-            'expenses_this_month': expenses_this_month,
-            'businesses': total_businesses,
-            'products': total_products,
-            'warehouses': total_warehouses,
-            'team_members': total_team_members,
-            'purchase_orders_this_month': purchase_orders_this_month,
+            'invoices_this_month': usage['invoices_this_month'],
+            'clients': usage['clients'],
+            'expenses_this_month': usage['expenses_this_month'],
+            'businesses': usage['businesses'],
+            'products': usage['products'],
+            'warehouses': usage['warehouses'],
+            'team_members': usage['team_members'],
+            'purchase_orders_this_month': usage['purchase_orders_this_month'],
             'storage_used_mb': calculate_storage_usage_mb(organization_owner),
         }
     }
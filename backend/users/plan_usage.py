@@ -0,0 +1,198 @@
+"""
+Cached usage counters behind the plan limit checks and the plan status.
+
+Counters live in Django's cache for PLAN_USAGE_CACHE_TTL seconds:
+  plan_usage:business:<id>  per-business counts (invoices, expenses, clients,
+                            products, warehouses, purchase orders)
+  plan_usage:owner:<id>     the owner's business ids and team size
+Saving or deleting a counted row drops the affected entry right away, for
+checks later in the same transaction, and again once the transaction commits,
+since a request that read the old rows meanwhile may have cached them back.
+The TTL bounds drift from queryset.update()/bulk writes, which skip the
+signals. Entries are only dropped in the cache the writing process uses, so
+deployments with several processes need a shared backend (REDIS_URL, see
+config.settings). Missing business entries are filled with one grouped
+COUNT per model for all businesses sharing a timezone.
+
+Monthly counters cover the calendar month in the business timezone
+(utils.periods); each entry records when that month ends and is recomputed
+after it.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from utils.models import bulk_soft_deleted
+from utils.periods import date_range, datetime_range, get_timezone, in_range
+
+BUSINESS_COUNTERS = (
+    'invoices_this_month', 'invoices_created_this_month', 'expenses_this_month', 'expenses_dated_this_month',
+    'clients', 'products', 'warehouses', 'purchase_orders_this_month',
+)
+
+
+def _ttl():
+    return getattr(settings, 'PLAN_USAGE_CACHE_TTL', 60)
+
+
+def business_key(business_id):
+    return f'plan_usage:business:{business_id}'
+
+
+def owner_key(owner_id):
+    return f'plan_usage:owner:{owner_id}'
+
+
+def _count_businesses(business_ids):
+    """Counters for several businesses with one grouped query per model and timezone."""
+    from users.models import Business
+
+    owner_timezones = dict(Business.objects.filter(pk__in=business_ids).values_list('id', 'user__timezone'))
+    timezones = {}
+    for business_id in business_ids:
+        timezones.setdefault(owner_timezones.get(business_id), []).append(business_id)
+
+    counters = {business_id: dict.fromkeys(BUSINESS_COUNTERS, 0) for business_id in business_ids}
+    for tz_name, ids in timezones.items():
+        tz = get_timezone(tz_name)
+        month = datetime_range('month', tz=tz)
+        for business_id, values in _count_month(ids, month, tz).items():
+            counters[business_id].update(values)
+            counters[business_id]['period_end'] = month[1]
+    return counters
+
+
+def _count_month(business_ids, month, tz):
+    from invoices.models import Invoice, Expense
+    from clients.models import Client
+    from inventory.models import Product, Warehouse, PurchaseOrder
+
+    counters = {business_id: {} for business_id in business_ids}
+    live = Q(is_deleted=False)
+    days = date_range('month', month[0].date(), tz)
+
+    # (queryset, counters); deleted invoices/expenses still count against the monthly quota
+    sources = [
+        (Invoice.all_objects.filter(**in_range('created_at', month)),
+         {'invoices_this_month': Count('id', filter=live), 'invoices_created_this_month': Count('id')}),
+        (Expense.all_objects.filter(**in_range('date', days)),
+         {'expenses_this_month': Count('id', filter=live), 'expenses_dated_this_month': Count('id')}),
+        (Client.objects.all(), {'clients': Count('id')}),
+        (Product.objects.all(), {'products': Count('id')}),
+        (Warehouse.objects.all(), {'warehouses': Count('id')}),
+        (PurchaseOrder.objects.filter(**in_range('created_at', month)),
+         {'purchase_orders_this_month': Count('id')}),
+    ]
+    for queryset, annotations in sources:
+        rows = queryset.filter(business_id__in=business_ids).values('business_id').annotate(**annotations).order_by()
+        for row in rows:
+            counters[row['business_id']].update({name: row[name] for name in annotations})
+    return counters
+
+
+def get_business_usage(business_ids):
+    """{business_id: counters} for the current month, computing only what is not cached."""
+    business_ids = list(business_ids)
+    if not business_ids:
+        return {}
+    now = timezone.now()
+    keys = {business_key(business_id): business_id for business_id in business_ids}
+    usage = {
+        keys[key]: value for key, value in cache.get_many(keys).items()
+        if value.get('period_end') and value['period_end'] > now
+    }
+
+    missing = [business_id for business_id in business_ids if business_id not in usage]
+    if missing:
+        computed = _count_businesses(missing)
+        cache.set_many({business_key(business_id): value for business_id, value in computed.items()}, _ttl())
+        usage.update(computed)
+    return usage
+
+
+def get_owner_usage(owner):
+    """Owner-level counters: business ids, team members and the summed business counters."""
+    from users.models import Business, TeamMember
+
+    entry = cache.get(owner_key(owner.pk))
+    if entry is None:
+        entry = {
+            'business_ids': list(Business.objects.filter(user=owner).values_list('id', flat=True)),
+            'team_members': TeamMember.objects.filter(owner=owner).count(),
+        }
+        cache.set(owner_key(owner.pk), entry, _ttl())
+
+    totals = dict.fromkeys(BUSINESS_COUNTERS, 0)
+    for counters in get_business_usage(entry['business_ids']).values():
+        for name in BUSINESS_COUNTERS:
+            totals[name] += counters[name]
+    totals['businesses'] = len(entry['business_ids'])
+    totals['team_members'] = entry['team_members']
+    return totals
+
+
+# --------- Invalidation ---------
+
+def _drop(key):
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def invalidate_business(business_id):
+    if business_id:
+        _drop(business_key(business_id))
+
+
+def invalidate_owner(owner_id):
+    if owner_id:
+        _drop(owner_key(owner_id))
+
+
+@receiver(post_save, sender='invoices.Invoice')
+@receiver(post_delete, sender='invoices.Invoice')
+@receiver(post_save, sender='invoices.Expense')
+@receiver(post_delete, sender='invoices.Expense')
+@receiver(post_save, sender='clients.Client')
+@receiver(post_delete, sender='clients.Client')
+@receiver(post_save, sender='inventory.Product')
+@receiver(post_delete, sender='inventory.Product')
+@receiver(post_save, sender='inventory.Warehouse')
+@receiver(post_delete, sender='inventory.Warehouse')
+@receiver(post_save, sender='inventory.PurchaseOrder')
+@receiver(post_delete, sender='inventory.PurchaseOrder')
+def drop_business_usage(sender, instance, **kwargs):
+    invalidate_business(instance.business_id)
+
+
+@receiver(bulk_soft_deleted, sender='invoices.Invoice')
+@receiver(bulk_soft_deleted, sender='invoices.Expense')
+@receiver(bulk_soft_deleted, sender='clients.Client')
+@receiver(bulk_soft_deleted, sender='inventory.Product')
+@receiver(bulk_soft_deleted, sender='inventory.Warehouse')
+@receiver(bulk_soft_deleted, sender='inventory.PurchaseOrder')
+def drop_business_usage_in_bulk(sender, queryset, **kwargs):
+    for business_id in queryset.order_by().values_list('business_id', flat=True).distinct():
+        invalidate_business(business_id)
+
+
+@receiver(post_save, sender='users.Business')
+@receiver(post_delete, sender='users.Business')
+def drop_business_and_owner_usage(sender, instance, **kwargs):
+    invalidate_business(instance.pk)
+    invalidate_owner(instance.user_id)
+
+
+@receiver(post_save, sender='users.TeamMember')
+@receiver(post_delete, sender='users.TeamMember')
+def drop_team_usage(sender, instance, **kwargs):
+    invalidate_owner(instance.owner_id)
+
+
+@receiver(post_save, sender='users.User')
+def drop_new_user_usage(sender, instance, created=False, **kwargs):
+    if created:
+        invalidate_owner(instance.pk)
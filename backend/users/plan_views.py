@@ -15,7 +15,7 @@ class PlanStatusView(APIView):
 
     def get(self, request):
         business_id = request.query_params.get('business_id') or request.headers.get('X-Business-ID')
-        status_data = get_full_plan_status(request.user, business_id=business_id)
+        status_data = get_full_plan_status(request.user, business_id=business_id, request=request)
         return Response(status_data)
 
 
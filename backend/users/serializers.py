@@ -121,7 +121,7 @@ class BusinessSerializer(serializers.ModelSerializer):
                 
         # White label check
         from users.plan_limits import get_full_plan_status
-        status = get_full_plan_status(instance.user, business_id=instance.id)
+        status = get_full_plan_status(instance.user, business_id=instance.id, request=self.context.get('request'))
         data['white_label_enabled'] = status.get('limits', {}).get('white_label', False)
         
         return data
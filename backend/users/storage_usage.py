@@ -0,0 +1,124 @@
+"""
+Per-owner storage ledger (User.storage_bytes).
+
+Every uploaded file counts against the owner of the business it belongs to:
+user avatars, business logos, invoice PDFs, payment receipts and expense
+attachments. Instead of walking all of those files on every limit check, the
+ledger is adjusted with a single UPDATE whenever a file is added, replaced or
+removed (including soft delete and restore), so reading usage is O(1).
+
+Rows soft-deleted as a set (SoftDeleteQuerySet.soft_delete) are released in
+bulk through bulk_soft_deleted. Other queryset.update()/bulk operations bypass
+the signals below; `manage.py reconcile_storage` rescans the files and
+corrects any drift.
+"""
+from collections import defaultdict
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from utils.models import bulk_soft_deleted
+
+from .models import User
+
+# model label -> (file field, ledger owner lookup for an instance)
+TRACKED_FILES = {
+    'users.User': ('avatar', lambda instance: {'pk': instance.pk}),
+    'users.Business': ('logo', lambda instance: {'pk': instance.user_id}),
+    'invoices.Invoice': ('pdf_file', lambda instance: {'businesses': instance.business_id}),
+    'invoices.Payment': ('receipt_file', lambda instance: {'businesses__invoices': instance.invoice_id}),
+    'invoices.Expense': ('attachment', lambda instance: {'businesses': instance.business_id}),
+}
+
+
+def file_size(field_file, name=None):
+    """Size in bytes of a stored file, 0 when it is empty, remote or missing."""
+    name = field_file.name if name is None else name
+    if not name:
+        return 0
+    try:
+        return field_file.storage.size(name)
+    except (OSError, ValueError, NotImplementedError):
+        return 0
+
+
+def adjust_storage(owner_lookup, delta):
+    """Add `delta` bytes to the ledger of the owner matching `owner_lookup`."""
+    if delta:
+        User.objects.filter(**owner_lookup).update(storage_bytes=F('storage_bytes') + delta)
+
+
+def get_storage_bytes(user):
+    return User.objects.filter(pk=user.pk).values_list('storage_bytes', flat=True).first() or 0
+
+
+def scan_storage_bytes(user):
+    """Walk every file owned by `user` and add up their sizes (what the ledger should hold)."""
+    from users.models import Business
+    from invoices.models import Invoice, Payment, Expense
+
+    total = file_size(user.avatar)
+    for business in Business.objects.filter(user=user).only('logo'):
+        total += file_size(business.logo)
+
+    sources = [
+        (Invoice.objects.filter(business__user=user), 'pdf_file'),
+        (Payment.objects.filter(invoice__business__user=user), 'receipt_file'),
+        (Expense.objects.filter(business__user=user), 'attachment'),
+    ]
+    for queryset, field in sources:
+        for instance in queryset.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).only(field).iterator():
+            total += file_size(getattr(instance, field))
+    return total
+
+
+# --------- Ledger maintenance ---------
+
+def _counted_name(instance, field):
+    """Name of the file `instance` currently counts for ('' when none or soft-deleted)."""
+    if instance.__dict__.get('is_deleted'):
+        return ''
+    value = instance.__dict__.get(field)
+    return str(getattr(value, 'name', value) or '')
+
+
+def _remember_file(sender, instance, **kwargs):
+    # __dict__ lookup: a deferred field must not cost a query per loaded row
+    field, _ = TRACKED_FILES[sender._meta.label]
+    instance._storage_counted = _counted_name(instance, field)
+
+
+def _file_saved(sender, instance, update_fields=None, **kwargs):
+    field, owner_lookup = TRACKED_FILES[sender._meta.label]
+    if update_fields is not None and not {field, 'is_deleted'}.intersection(update_fields):
+        return
+    old_name = getattr(instance, '_storage_counted', '')
+    new_name = _counted_name(instance, field)
+    if old_name != new_name:
+        field_file = getattr(instance, field)
+        adjust_storage(owner_lookup(instance), file_size(field_file, new_name) - file_size(field_file, old_name))
+    instance._storage_counted = new_name
+
+
+def _file_deleted(sender, instance, **kwargs):
+    field, owner_lookup = TRACKED_FILES[sender._meta.label]
+    old_name = getattr(instance, '_storage_counted', '')
+    if old_name:
+        adjust_storage(owner_lookup(instance), -file_size(getattr(instance, field), old_name))
+
+
+def _files_soft_deleted(sender, queryset, **kwargs):
+    field, owner_lookup = TRACKED_FILES[sender._meta.label]
+    freed = defaultdict(int)
+    for instance in queryset.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).iterator():
+        freed[tuple(owner_lookup(instance).items())] += file_size(getattr(instance, field))
+    for lookup, size in freed.items():
+        adjust_storage(dict(lookup), -size)
+
+
+for _label in TRACKED_FILES:
+    receiver(post_init, sender=_label)(_remember_file)
+    receiver(post_save, sender=_label)(_file_saved)
+    receiver(post_delete, sender=_label)(_file_deleted)
+    receiver(bulk_soft_deleted, sender=_label)(_files_soft_deleted)
@@ -1,4 +1,11 @@
-from django.test import TestCase
+import datetime
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
 from django.contrib.auth import get_user_model
 from users.models import SubscriptionPlan, Business, TeamMember, DiscountCoupon, TeamMemberInvitation
 
@@ -78,3 +85,188 @@ class TeamMemberInvitationTests(TestCase):
             role='MANAGER'
         )
         self.assertEqual(str(invite), 'Invite for newguy@sys.com by inviter@sys.com (MANAGER)')
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class StorageLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='ledger@storage.com', password='foo')
+        self.business = Business.objects.create(user=self.user, name='Storage Biz')
+
+    def _ledger(self):
+        self.user.refresh_from_db(fields=['storage_bytes'])
+        return self.user.storage_bytes
+
+    def test_ledger_follows_uploads_replacements_and_deletes(self):
+        from invoices.models import Expense
+
+        self.business.logo = ContentFile(b'x' * 100, name='logo.png')
+        self.business.save()
+        expense = Expense.objects.create(
+            business=self.business, description='Rent', amount=10, date=datetime.date.today(),
+            attachment=ContentFile(b'y' * 250, name='receipt.pdf')
+        )
+        self.assertEqual(self._ledger(), 350)
+
+        expense.attachment = ContentFile(b'z' * 50, name='receipt2.pdf')
+        expense.save()
+        self.assertEqual(self._ledger(), 150)
+
+        # Saves that do not touch the file leave the ledger alone
+        expense.description = 'Office rent'
+        expense.save(update_fields=['description'])
+        self.assertEqual(self._ledger(), 150)
+
+        expense.delete()
+        self.assertEqual(self._ledger(), 100)
+        expense.restore()
+        self.assertEqual(self._ledger(), 150)
+        expense.hard_delete()
+        self.assertEqual(self._ledger(), 100)
+
+    def test_limit_check_reads_the_ledger(self):
+        from users.plan_limits import check_storage_limit
+
+        plan = SubscriptionPlan.objects.create(name='tiny', label='Tiny', storage_limit_mb=1)
+        self.user.subscription_plan = plan
+        self.user.save()
+        User.objects.filter(pk=self.user.pk).update(storage_bytes=1024 * 1024)
+
+        with self.assertNumQueries(1):
+            result = check_storage_limit(self.user, 1)
+        self.assertEqual(result, {'allowed': False, 'current_mb': 1.0, 'limit_mb': 1})
+
+    def test_reconcile_corrects_drift(self):
+        self.business.logo = ContentFile(b'x' * 100, name='logo.png')
+        self.business.save()
+        User.objects.filter(pk=self.user.pk).update(storage_bytes=999)
+
+        out = StringIO()
+        call_command('reconcile_storage', '--user', str(self.user.pk), '--dry-run', stdout=out)
+        self.assertIn('Found 1 drifted', out.getvalue())
+        self.assertEqual(self._ledger(), 999)
+
+        call_command('reconcile_storage', stdout=StringIO())
+        self.assertEqual(self._ledger(), 100)
+
+class PlanUsageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        plan = SubscriptionPlan.objects.create(name='small', label='Small', invoices_per_month=2, clients_limit=5)
+        self.user = User.objects.create_user(email='usage@plan.com', password='foo', subscription_plan=plan)
+        self.business = Business.objects.create(user=self.user, name='Usage Biz')
+
+    def _invoice(self):
+        from clients.models import Client
+        from invoices.models import Invoice
+
+        client = Client.objects.create(business=self.business, name='Usage Client')
+        return Invoice.objects.create(
+            business=self.business, client=client, invoice_date=datetime.date.today(),
+            due_date=datetime.date.today(), status='draft'
+        )
+
+    def test_limit_checks_read_cached_counters(self):
+        from users.plan_limits import check_client_limit, check_invoice_limit
+
+        self._invoice()
+        self.assertEqual(check_invoice_limit(self.user, self.business)['current'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(check_invoice_limit(self.user, self.business)['current'], 1)
+            self.assertEqual(check_client_limit(self.user, self.business)['current'], 1)
+
+        # A new row drops the entry; deleted invoices still use up the monthly quota
+        self._invoice().delete()
+        result = check_invoice_limit(self.user, self.business)
+        self.assertEqual((result['current'], result['allowed']), (2, False))
+        self.assertEqual(check_client_limit(self.user)['current'], 2)
+
+    def test_plan_status_is_memoized_per_request(self):
+        from users.plan_limits import get_full_plan_status
+
+        self._invoice()
+        request = RequestFactory().get('/')
+        status = get_full_plan_status(self.user, business_id=self.business.id, request=request)
+        self.assertEqual(status['usage']['invoices_this_month'], 1)
+        self.assertEqual(status['usage']['clients'], 1)
+        self.assertEqual(status['usage']['businesses'], 1)
+
+        with self.assertNumQueries(0):
+            get_full_plan_status(self.user, business_id=self.business.id, request=request)
+
+        self._invoice().delete()
+        status = get_full_plan_status(self.user, business_id=self.business.id)
+        self.assertEqual(status['usage']['invoices_this_month'], 1)
+        self.assertEqual(status['usage']['clients'], 2)
+
+    def test_monthly_counters_use_local_month_ranges(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from invoices.models import Invoice
+        from users.plan_usage import get_business_usage
+        from utils.periods import datetime_range, get_timezone
+
+        self.user.timezone = 'Asia/Baku'
+        self.user.save()
+        month_start, _ = datetime_range('month', tz=get_timezone('Asia/Baku'))
+        inside, before = self._invoice(), self._invoice()
+        Invoice.all_objects.filter(pk=inside.pk).update(created_at=month_start)
+        Invoice.all_objects.filter(pk=before.pk).update(created_at=month_start - datetime.timedelta(seconds=1))
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as ctx:
+            usage = get_business_usage([self.business.pk])[self.business.pk]
+        self.assertEqual(usage['invoices_created_this_month'], 1)
+        self.assertEqual(usage['period_end'], datetime_range('month', tz=get_timezone('Asia/Baku'))[1])
+        # Range comparisons, not EXTRACT(), so the (business, created_at) index applies
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'extract' in q['sql'].lower()])
+
+    def test_entry_from_an_ended_month_is_recomputed(self):
+        from users.plan_usage import business_key, get_business_usage
+
+        self._invoice()
+        usage = get_business_usage([self.business.pk])[self.business.pk]
+        ended = usage['period_end'] - datetime.timedelta(days=40)
+        cache.set(business_key(self.business.pk), {**usage, 'invoices_created_this_month': 99, 'period_end': ended})
+        self.assertEqual(get_business_usage([self.business.pk])[self.business.pk]['invoices_created_this_month'], 1)
+
+    def test_entry_cached_before_commit_is_dropped_on_commit(self):
+        from users.plan_usage import business_key, get_business_usage
+
+        stale = get_business_usage([self.business.pk])[self.business.pk]
+        with self.captureOnCommitCallbacks(execute=True):
+            self._invoice()
+            # another request, still seeing the committed rows, caches them again
+            cache.set(business_key(self.business.pk), stale)
+        self.assertEqual(get_business_usage([self.business.pk])[self.business.pk]['invoices_created_this_month'], 1)
+
+
+class PeriodTests(TestCase):
+    def test_ranges_are_half_open(self):
+        from utils.periods import date_range
+
+        day = datetime.date(2024, 11, 15)
+        self.assertEqual(date_range('month', day), (datetime.date(2024, 11, 1), datetime.date(2024, 12, 1)))
+        self.assertEqual(date_range('quarter', day), (datetime.date(2024, 10, 1), datetime.date(2025, 1, 1)))
+        self.assertEqual(date_range('year', day), (datetime.date(2024, 1, 1), datetime.date(2025, 1, 1)))
+        with self.assertRaises(ValueError):
+            date_range('week', day)
+
+    def test_datetime_range_starts_at_local_midnight(self):
+        from utils.periods import datetime_range, get_timezone
+
+        start, end = datetime_range('month', datetime.date(2024, 3, 10), get_timezone('Asia/Baku'))
+        self.assertEqual(start.astimezone(datetime.timezone.utc), datetime.datetime(2024, 2, 29, 20, 0, tzinfo=datetime.timezone.utc))
+        self.assertEqual(end.astimezone(datetime.timezone.utc), datetime.datetime(2024, 3, 31, 20, 0, tzinfo=datetime.timezone.utc))
+        self.assertEqual(get_timezone('Not/AZone'), get_timezone(None))
+
+    def test_month_range_uses_index_on_postgres(self):
+        from django.db import connection
+        from invoices.models import Invoice
+        from utils.periods import datetime_range, in_range
+
+        if connection.vendor != 'postgresql':
+            self.skipTest('EXPLAIN index check needs PostgreSQL')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = Invoice.all_objects.filter(business_id=1, **in_range('created_at', datetime_range('month'))).explain()
+        self.assertIn('invoice_business_keyset_idx', plan)
@@ -127,3 +127,47 @@ class LogoutViewTestCase(APITestCase):
         url = reverse('logout')
         response = self.client.post(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BusinessContextTestCase(APITestCase):
+    def setUp(self):
+        from users.models import Business
+        self.owner = User.objects.create_user(email='owner@context.com', password='password')
+        self.rep = User.objects.create_user(email='rep@context.com', password='password')
+        self.business = Business.objects.create(user=self.owner, name='Context Biz')
+        self.url = reverse('client-list')
+
+    def _list(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.get(self.url, HTTP_X_BUSINESS_ID=self.business.id)
+
+    def test_context_is_resolved_once_and_cached(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self._list(self.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._list(self.owner)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        business_lookups = [q for q in ctx.captured_queries if 'FROM "users_business"' in q['sql']]
+        membership_lookups = [q for q in ctx.captured_queries if 'FROM "users_teammember"' in q['sql']]
+        # The membership is checked inside the business query, not cached or fetched separately
+        self.assertEqual(len(business_lookups), 1)
+        self.assertEqual(membership_lookups, business_lookups)
+
+    def test_membership_changes_apply_immediately(self):
+        from users.context import get_business_context
+        from users.models import TeamMember
+
+        response = self._list(self.rep)
+        self.assertIsNone(get_business_context(response.wsgi_request).business)
+
+        member = TeamMember.objects.create(owner=self.owner, user=self.rep, business=self.business, role='SALES_REP')
+        response = self._list(self.rep)
+        context = get_business_context(response.wsgi_request)
+        self.assertEqual((context.business, context.role, context.owner_id), (self.business, 'SALES_REP', self.owner.id))
+
+        member.delete()
+        response = self._list(self.rep)
+        self.assertIsNone(get_business_context(response.wsgi_request).business)
@@ -0,0 +1,139 @@
+"""
+Streaming CSV / XLSX exports of business-scoped lists.
+
+Rows are read with `values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE)`,
+so no model instances are built and at most one chunk of tuples is in memory,
+however large the table. CSV lines are yielded to StreamingHttpResponse as
+they are written. XLSX rows go through openpyxl's write-only worksheet
+(inline strings, rows spooled to a temporary file); the zipped workbook is
+then streamed back in blocks from a temporary file as well.
+"""
+import csv
+import datetime
+import tempfile
+
+import openpyxl
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+
+from users.plan_limits import check_feature
+from utils.periods import business_timezone, local_date
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+XLSX_BLOCK_SIZE = 64 * 1024
+# Spreadsheet apps evaluate cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """File-like object whose write() hands the value back, so csv.writer yields lines."""
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, columns, tz=None):
+    """Value rows of `queryset` for the (header, lookup) `columns`, fetched in chunks."""
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    rows = (
+        queryset.select_related(None).prefetch_related(None)
+        .values_list(*[lookup for _, lookup in columns])
+        .iterator(chunk_size=chunk_size)
+    )
+    for row in rows:
+        yield [_cell(value, tz) for value in row]
+
+
+def _cell(value, tz):
+    # Spreadsheets have no timezones: show local wall-clock time of the business
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value, tz)
+        return value.replace(tzinfo=None, microsecond=0)
+    # User text (client/product names, descriptions) must never become a live
+    # formula: CSV apps evaluate it, and openpyxl writes it as <f> in XLSX
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def csv_stream(header, rows):
+    writer = csv.writer(Echo())
+    # BOM so Excel opens the UTF-8 file with Azerbaijani letters intact
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def xlsx_stream(header, rows, title):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as buffer:
+        workbook.save(buffer)
+        buffer.seek(0)
+        while block := buffer.read(XLSX_BLOCK_SIZE):
+            yield block
+
+
+def export_response(queryset, columns, file_format, filename, title='Export', tz=None):
+    """StreamingHttpResponse with `queryset` as a CSV or XLSX attachment."""
+    header = [label for label, _ in columns]
+    rows = export_rows(queryset, columns, tz)
+    if file_format == 'xlsx':
+        content = xlsx_stream(header, rows, title)
+    else:
+        content = csv_stream(header, rows)
+
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
+
+
+class ExportMixin:
+    """
+    `GET <list>/export/?file_format=csv|xlsx` for BusinessContextMixin ViewSets.
+
+    Exports every row the list endpoint would return (business scope, team
+    visibility, ?search= and the view's own filters) without pagination,
+    ordered by `export_ordering`, with the `export_columns` ((header, lookup), ...).
+    Requires the plan's has_csv_export feature.
+    """
+    export_columns = ()
+    export_ordering = ()
+    export_filename = 'export'
+    export_title = 'Export'
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        business = self.get_active_business()
+        if not business:
+            return Response({"detail": "Aktiv biznes seçilməyib."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not check_feature(request.user, 'has_csv_export', business=business):
+            raise PermissionDenied({
+                "code": "plan_limit",
+                "detail": "Məlumatların eksportu cari planınıza daxil deyil.",
+                "upgrade_required": True
+            })
+
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError({"file_format": "Yalnız csv və ya xlsx seçilə bilər."})
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.export_ordering:
+            queryset = queryset.order_by(*self.export_ordering)
+        tz = business_timezone(business)
+        filename = f"{self.export_filename}_{local_date(tz).isoformat()}"
+        return export_response(queryset, self.export_columns, file_format, filename, title=self.export_title, tz=tz)
@@ -0,0 +1,27 @@
+from django.db.models import Func, IntegerField
+
+
+class DaysBetween(Func):
+    """
+    Whole days from `start` to `end` (end - start) for two DateField expressions,
+    as an integer on every supported backend:
+    PostgreSQL/Oracle subtract dates natively, SQLite goes through julianday()
+    and MySQL uses DATEDIFF().
+    """
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    output_field = IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='DATEDIFF', template='%(function)s(%(expressions)s)', arg_joiner=', ', **extra_context)
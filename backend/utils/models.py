@@ -1,10 +1,45 @@
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models.signals import ModelSignal
 from django.utils import timezone
 
+# Sent after SoftDeleteQuerySet.soft_delete() flags a batch of rows, with
+# `queryset` = those rows (all_objects, at most SOFT_DELETE_BATCH_SIZE of them).
+# Per-row save()/post_save signals are not sent for them, so receivers do the
+# side effects (stock, storage ledger, rollups, caches) for the whole batch at once.
+bulk_soft_deleted = ModelSignal(use_caching=True)
+
+SOFT_DELETE_BATCH_SIZE = 1000
+
+# Condition for partial indexes over the rows SoftDeleteManager returns. It
+# renders as "NOT is_deleted", the same term the manager adds to every query,
+# which is what lets SQLite and PostgreSQL pick the index.
+LIVE = models.Q(is_deleted=False)
+
+
 class SoftDeleteQuerySet(models.QuerySet):
     def delete(self):
+        """Flag the rows as deleted with one UPDATE: no cascade, no signals."""
         return self.update(is_deleted=True, deleted_at=timezone.now())
 
+    def soft_delete(self):
+        """
+        Soft-delete the rows and, through the model's `soft_delete_cascade`, their
+        related rows: one UPDATE per model and batch, followed by bulk_soft_deleted.
+        Returns the number of rows of this model that were deleted.
+        """
+        model = self.model
+        ids = list(self.filter(is_deleted=False).order_by().values_list('pk', flat=True))
+        deleted_at = timezone.now()
+        with transaction.atomic():
+            for start in range(0, len(ids), SOFT_DELETE_BATCH_SIZE):
+                batch = ids[start:start + SOFT_DELETE_BATCH_SIZE]
+                model.all_objects.filter(pk__in=batch).update(is_deleted=True, deleted_at=deleted_at)
+                for related_model, field in model.get_soft_delete_cascade():
+                    related_model.objects.filter(**{f'{field}__in': batch}).soft_delete()
+                bulk_soft_deleted.send(sender=model, queryset=model.all_objects.filter(pk__in=batch))
+        return len(ids)
+
     def hard_delete(self):
         return super().delete()
 
@@ -28,23 +63,26 @@ class SoftDeleteModel(models.Model):
     objects = SoftDeleteManager()
     all_objects = models.Manager() # Standard manager to access all records if needed
 
+    # Related rows soft-deleted together with this one, as (model label, FK field
+    # pointing here) pairs, e.g. (('invoices.InvoiceItem', 'invoice'),)
+    soft_delete_cascade = ()
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def get_soft_delete_cascade(cls):
+        return [(apps.get_model(label), field) for label, field in cls.soft_delete_cascade]
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.deleted_at = timezone.now()
         # Trigger save to fire post_save signals for inventory/audit
         self.save(update_fields=['is_deleted', 'deleted_at'])
-        
-        # Handle related soft deletes if any (manual cascade)
-        for related_obj in self._get_related_soft_delete_objects():
-            related_obj.delete()
-
 
-    def _get_related_soft_delete_objects(self):
-        """Override this in subclasses to return related objects that should be soft-deleted."""
-        return []
+        # Related rows go set-based (see SoftDeleteQuerySet.soft_delete)
+        for related_model, field in self.get_soft_delete_cascade():
+            related_model.objects.filter(**{field: self.pk}).soft_delete()
 
     def restore(self):
         self.is_deleted = False
@@ -0,0 +1,168 @@
+"""
+Keyset (cursor) pagination that list endpoints can offer next to page numbers.
+
+PageNumberPagination costs a COUNT(*) plus an OFFSET scan that grows with the
+page number. Keyset pages instead continue from the last row seen
+(`WHERE (created_at, id) < (last_created_at, last_id)`), which an index on
+the ordering columns answers in constant time at any depth.
+
+Views opt in by declaring `keyset_ordering`, a tuple of model fields that ends
+in a unique column (e.g. ('-created_at', '-id')). Clients opt in per request
+with `?pagination=cursor` and then follow the `next` / `previous` links; without
+it the page-number format is unchanged.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Yanlış kursor.'
+
+    def __init__(self, ordering=None, page_size=None, page_size_query_param=None, max_page_size=None):
+        self.ordering = tuple(ordering or self.ordering)
+        self.page_size = page_size or self.page_size
+        self.page_size_query_param = page_size_query_param or self.page_size_query_param
+        self.max_page_size = max_page_size or self.max_page_size
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    # --- cursors ---
+
+    def _field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def encode_cursor(self, direction, row):
+        values = [str(self._value(row, name)) for name in self._field_names()]
+        payload = json.dumps({'d': direction, 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return 'n', None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            direction, raw = payload['d'], payload['v']
+            names = self._field_names()
+            if direction not in ('n', 'p') or len(raw) != len(names):
+                raise ValueError
+            values = [model._meta.get_field(name).to_python(value) for name, value in zip(names, raw)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return direction, values
+
+    @staticmethod
+    def _value(row, name):
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    def _beyond(self, values, backwards):
+        """Rows strictly after `values` in the ordering (before them when `backwards`)."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != backwards
+            condition |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal[name] = value
+        return condition
+
+    # --- BasePagination API ---
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        direction, values = self.decode_cursor(request, queryset.model)
+        backwards = direction == 'p'
+
+        ordering = self.ordering
+        if backwards:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._beyond(values, backwards))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+
+        self.first_row = rows[0] if rows else None
+        self.last_row = rows[-1] if rows else None
+        return rows
+
+    def _link(self, direction, row):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(direction, row))
+
+    def get_next_link(self):
+        if not self.has_next or self.last_row is None:
+            return None
+        return self._link('n', self.last_row)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first_row is None:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self._link('p', self.first_row)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OptionalKeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination by default; keyset pagination when the view declares
+    `keyset_ordering` and the request asks for `?pagination=cursor`.
+    """
+    keyset_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering and request.query_params.get(self.keyset_query_param) == 'cursor':
+            self.keyset = KeysetPagination(
+                ordering, self.page_size, self.page_size_query_param, self.max_page_size
+            )
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
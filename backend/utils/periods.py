@@ -0,0 +1,73 @@
+"""
+Calendar periods (month, quarter, year) as half-open [start, end) ranges.
+
+`created_at__year=..., created_at__month=...` compiles to EXTRACT(...) = n,
+which no index on the column can answer. Filtering with
+`created_at__gte=start, created_at__lt=end` instead is a plain range scan on
+the (business, created_at)-style indexes, and the half-open end avoids the
+23:59:59.999 edge of BETWEEN.
+
+Periods are taken in the business timezone (the owner's `timezone` setting),
+so "this month" starts at local midnight on the 1st rather than in UTC.
+"""
+import datetime
+import zoneinfo
+
+from django.utils import timezone
+
+PERIOD_MONTHS = {'month': 1, 'quarter': 3, 'year': 12}
+
+
+def add_months(date, months):
+    """First day of the month `months` away from `date` (negative goes back)."""
+    index = date.year * 12 + date.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def get_timezone(name):
+    """ZoneInfo for a user-entered timezone name, the default timezone if it is unknown."""
+    try:
+        return zoneinfo.ZoneInfo(name) if name else timezone.get_default_timezone()
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return timezone.get_default_timezone()
+
+
+def business_timezone(business):
+    """Timezone the business reports in: its owner's setting."""
+    if business is None:
+        return timezone.get_default_timezone()
+    return get_timezone(business.user.timezone)
+
+
+def local_date(tz=None):
+    """Today's date in `tz` (default timezone when omitted)."""
+    return timezone.localtime(timezone.now(), tz or timezone.get_default_timezone()).date()
+
+
+def date_range(period, day=None, tz=None):
+    """
+    (first day, first day of the next period) of the month/quarter/year containing
+    `day`, for DateField filters. `day` defaults to today in `tz`.
+    """
+    if period not in PERIOD_MONTHS:
+        raise ValueError(f'Unknown period: {period}')
+    day = day or local_date(tz)
+    first_month = 1 if period == 'year' else day.month - (day.month - 1) % PERIOD_MONTHS[period]
+    start = datetime.date(day.year, first_month, 1)
+    return start, add_months(start, PERIOD_MONTHS[period])
+
+
+def datetime_range(period, day=None, tz=None):
+    """Same as date_range, as aware datetimes at local midnight in `tz`, for DateTimeField filters."""
+    tz = tz or timezone.get_default_timezone()
+    start, end = date_range(period, day, tz)
+    return (
+        datetime.datetime.combine(start, datetime.time.min, tzinfo=tz),
+        datetime.datetime.combine(end, datetime.time.min, tzinfo=tz),
+    )
+
+
+def in_range(field, bounds):
+    """Filter kwargs for `start <= field < end`."""
+    start, end = bounds
+    return {f'{field}__gte': start, f'{field}__lt': end}
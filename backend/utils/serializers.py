@@ -0,0 +1,30 @@
+def query_param_set(request, name):
+    """Comma separated query parameter as a set of names (`?expand=items,payments`)."""
+    params = getattr(request, 'query_params', None) or {}
+    return {value.strip() for value in (params.get(name) or '').split(',') if value.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Sparse fieldsets for read serializers.
+
+    `?fields=id,total` limits the output to the listed fields and
+    `?expand=items` adds the nested representations declared in
+    `expandable_fields` ({name: (serializer_class, kwargs)}), which are left out
+    by default. Views should prefetch only what `?expand=` asks for.
+    """
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+
+        expand = query_param_set(request, 'expand') & self.expandable_fields.keys()
+        for name in expand:
+            serializer_class, kwargs = self.expandable_fields[name]
+            fields[name] = serializer_class(**kwargs)
+
+        requested = query_param_set(request, 'fields')
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested or name in expand}
+        return fields
@@ -0,0 +1,17 @@
+import client from './client';
+
+// Downloads a list export (`<path>export/`), streamed by the backend as CSV or XLSX.
+// Extra params (e.g. search) narrow the export the same way they narrow the list.
+export const downloadExport = async (path, fileName, fileFormat = 'xlsx', params = {}) => {
+    const res = await client.get(`${path}export/`, {
+        params: { ...params, file_format: fileFormat },
+        responseType: 'blob',
+        timeout: 0, // large tables take longer than the default request timeout
+    });
+    const url = URL.createObjectURL(res.data);
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = `${fileName}_${new Date().toISOString().split('T')[0]}.${fileFormat}`;
+    link.click();
+    URL.revokeObjectURL(url);
+};
@@ -6,7 +6,7 @@ import clientApi from '../api/client';
 import { useToast } from '../components/Toast';
 import { Plus, Trash2, Search, Filter, DollarSign, Calendar, Tag, CreditCard, ChevronDown, X, Building, User, Paperclip, Download, Info, Edit2, Check } from 'lucide-react';
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, Cell } from 'recharts';
-import * as XLSX from 'xlsx';
+import { downloadExport } from '../api/exports';
 import UpgradeModal from '../components/UpgradeModal';
 import usePlanLimits from '../hooks/usePlanLimits';
 
@@ -238,22 +238,16 @@ const Expenses = () => {
                 <h2 className="text-3xl font-black text-[var(--color-text-primary)] tracking-tight">Xərclər</h2>
                 <div className="flex gap-2">
                     <button
-                        onClick={() => {
-                            const data = (filteredExpenses || []).map(e => ({
-                                'Təsvir': e.description,
-                                'Təchizatçı': e.vendor || '',
-                                'Kateqoriya': categories.find(c => c.id === e.category)?.name || e.category,
-                                'Tarix': e.date,
-                                'Məbləğ': parseFloat(e.amount),
-                                'Valyuta': e.currency,
-                                'Status': e.status === 'paid' ? 'Ödənilib' : 'Gözləmədə',
-                                'Ödəniş Üsulu': e.payment_method || ''
-                            }));
-
-                            const ws = XLSX.utils.json_to_sheet(data);
-                            const wb = XLSX.utils.book_new();
-                            XLSX.utils.book_append_sheet(wb, ws, "Xərclər");
-                            XLSX.writeFile(wb, `xercler_hesabati_${new Date().toISOString().split('T')[0]}.xlsx`);
+                        onClick={async () => {
+                            try {
+                                await downloadExport('/invoices/expenses/', 'xercler_hesabati', 'xlsx', { search: searchTerm || undefined });
+                            } catch (error) {
+                                if (error.response?.status === 403) {
+                                    setShowUpgradeModal(true);
+                                } else {
+                                    showToast(translateError(error), 'error');
+                                }
+                            }
                         }}
                         className="p-2.5 bg-[var(--color-card-bg)] border border-[var(--color-card-border)] text-[var(--color-text-secondary)] rounded-xl hover:bg-[var(--color-hover-bg)] transition-all font-bold text-sm flex items-center gap-2"
                         title="Excel kimi yüklə"
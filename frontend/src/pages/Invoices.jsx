@@ -10,7 +10,7 @@ import UpgradeModal from '../components/UpgradeModal';
 import AddPaymentModal from '../components/AddPaymentModal';
 import ProductQRScanner from '../components/ProductQRScanner';
 import { translateError } from '../api/translateErrors';
-import * as XLSX from 'xlsx';
+import { downloadExport } from '../api/exports';
 import usePlanLimits from '../hooks/usePlanLimits';
 import useAuthStore from '../store/useAuthStore';
 import { CURRENCY_SYMBOLS } from '../utils/currency';
@@ -111,6 +111,7 @@ const Invoices = () => {
             const res = await clientApi.get('/invoices/', {
                 params: {
                     page,
+                    expand: 'items', // needed by handleEdit
                     search: searchTerm || undefined,
                     // Status filter is currently handled locally in useMemo, 
                     // but we could pass it to backend if needed.
@@ -337,6 +338,7 @@ const Invoices = () => {
             currency,
             status: (triggerSend && (!editInvoice || editInvoice.status === 'draft')) ? 'finalized' : (editInvoice ? editInvoice.status : status),
             items: validItems.map((item, index) => ({
+                id: editInvoice ? item.id : undefined, // lets the backend update only the lines that changed
                 description: item.description,
                 quantity: item.quantity,
                 unit_price: item.unit_price,
@@ -451,8 +453,8 @@ const Invoices = () => {
 
         setSendingEmail(true);
         try {
-            await clientApi.post(`/invoices/${targetInvoice.id}/send_email/`);
-            showToast('Email uğurla göndərildi!');
+            const response = await clientApi.post(`/invoices/${targetInvoice.id}/send_email/`);
+            showToast(response.data?.message || 'Email uğurla göndərildi!');
             setShowSendModal(false);
         } catch (error) {
             console.error('Email error:', error);
@@ -554,37 +556,20 @@ const Invoices = () => {
                             <h2 className="text-3xl font-black text-[var(--color-text-primary)] tracking-tight font-roboto">Fakturalar</h2>
                             <div className="flex items-center gap-2">
                                 <button
-                                    onClick={() => {
-                                        const data = (filteredInvoices || []).map(inv => {
-                                            const clientName = clients?.find(c => c.id === inv.client)?.name || 'Naməlum';
-                                            return {
-                                                'Faktura №': inv.invoice_number,
-                                                'Müştəri': clientName,
-                                                'Sahibi': inv.created_by_name || 'Owner',
-                                                'Tarix': (() => {
-                                                    const d = new Date(inv.invoice_date);
-                                                    const m = ['Yan', 'Fev', 'Mar', 'Apr', 'May', 'İyn', 'İyl', 'Avq', 'Sen', 'Okt', 'Noy', 'Dek'];
-                                                    return !isNaN(d) ? `${d.getDate()} ${m[d.getMonth()]} ${d.getFullYear()}` : '';
-                                                })(),
-                                                'Son Tarix': (() => {
-                                                    const d = new Date(inv.due_date);
-                                                    const m = ['Yan', 'Fev', 'Mar', 'Apr', 'May', 'İyn', 'İyl', 'Avq', 'Sen', 'Okt', 'Noy', 'Dek'];
-                                                    return !isNaN(d) ? `${d.getDate()} ${m[d.getMonth()]} ${d.getFullYear()}` : '';
-                                                })(),
-                                                'Məbləğ': parseFloat(inv.total),
-                                                'Valyuta': CURRENCY_SYMBOLS[inv.currency] || '₼',
-                                                'Status': inv.status === 'paid' ? 'Ödənilib' :
-                                                    inv.status === 'sent' ? 'Göndərilib' :
-                                                        inv.status === 'viewed' ? 'Baxılıb' :
-                                                            inv.status === 'finalized' ? 'Təsdiqləndi' :
-                                                                inv.status === 'overdue' ? 'Gecikir' :
-                                                                    inv.status === 'cancelled' ? 'Ləğv edilib' : 'Qaralama'
-                                            };
-                                        });
-                                        const ws = XLSX.utils.json_to_sheet(data);
-                                        const wb = XLSX.utils.book_new();
-                                        XLSX.utils.book_append_sheet(wb, ws, "Fakturalar");
-                                        XLSX.writeFile(wb, `fakturalar_hesabati_${new Date().toISOString().split('T')[0]}.xlsx`);
+                                    onClick={async () => {
+                                        try {
+                                            await downloadExport('/invoices/', 'fakturalar_hesabati', 'xlsx', { search: searchTerm || undefined });
+                                        } catch (error) {
+                                            if (error.response?.status === 403) {
+                                                setUpgradeConfig({
+                                                    isOpen: true,
+                                                    title: 'Eksport Pro planlarda 📊',
+                                                    message: 'Fakturaları Excel/CSV kimi yükləmək üçün planınızı yüksəldin.'
+                                                });
+                                            } else {
+                                                showToast(translateError(error), 'error');
+                                            }
+                                        }
                                     }}
                                     className="p-2 bg-[var(--color-card-bg)] border border-[var(--color-card-border)] text-[var(--color-text-secondary)] rounded-lg hover:bg-[var(--color-hover-bg)] transition-all font-bold text-sm flex items-center gap-2"
                                     title="Excel kimi yüklə"
@@ -141,15 +141,30 @@ const Products = () => {
         onError: (err) => showToast(translateError(err), 'error')
     });
 
+    // The import runs in the background: follow the job until it finishes
+    const pollImportJob = async (statusUrl) => {
+        try {
+            const { data } = await clientApi.get(statusUrl);
+            if (data.status === 'done' || data.status === 'failed') {
+                queryClient.invalidateQueries(['products']);
+                showToast(data.detail, data.status === 'done' && !data.error_count ? 'success' : 'error');
+                return;
+            }
+            setTimeout(() => pollImportJob(statusUrl), 2000);
+        } catch (err) {
+            showToast(translateError(err), 'error');
+        }
+    };
+
     const uploadMutation = useMutation({
         mutationFn: (formData) => clientApi.post('/inventory/products/upload-excel/', formData, {
             headers: { 'Content-Type': 'multipart/form-data' }
         }),
         onSuccess: (res) => {
-            queryClient.invalidateQueries(['products']);
             showToast(res.data.detail);
             setIsUploadModalOpen(false);
             setExcelFile(null);
+            pollImportJob(res.data.status_url);
         },
         onError: (err) => {
             const data = err.response?.data;